@@ -9,14 +9,16 @@ Run Alignments
 """
 
 from airtight.cli import configure_commandline
-from copy import deepcopy
 import json
 import logging
 from pathlib import Path
 from platformdirs import user_cache_dir, user_config_dir
 import pleiades_aligner
+from pleiades_aligner.checkpoint import RunDirectory, source_signature
+from pleiades_aligner.planner import PipelinePlan, plan_pipeline
+from pleiades_aligner.report import filter_alignments, group_alignments, ReportWriter
 from pprint import pformat, pprint
-from shapely import to_wkt
+import sys
 
 logger = logging.getLogger(__name__)
 
@@ -43,33 +45,162 @@ OPTIONAL_ARGUMENTS = [
         False,
     ],
     ["-c", "--config", DEFAULT_CONFIG_FILE_PATH, "path to config file", False],
+    [
+        "-f",
+        "--format",
+        "json",
+        "report format: json (JSON array), jsonl (JSON Lines), or normalized "
+        + "(places and alignments tables)",
+        False,
+    ],
+    ["-o", "--output", "", "path to report file (default: standard output)", False],
+    [
+        "-G",
+        "--group-by",
+        "",
+        "order the report by the ids of places in this namespace, grouping "
+        + "their alignments (for prioritize3.py --stream)",
+        False,
+    ],
+    [
+        "-g",
+        "--geometry",
+        "wkt",
+        "geometry encoding in the report: wkt or wkb (hex)",
+        False,
+    ],
+    [
+        "-s",
+        "--store",
+        "",
+        "path to SQLite alignment store to save (queryable with query.py)",
+        False,
+    ],
+    [
+        "--save-state",
+        "--save_state",
+        "",
+        "path to save a snapshot after ingestion and primary alignment modes",
+        False,
+    ],
+    [
+        "--load-state",
+        "--load_state",
+        "",
+        "path to a snapshot to resume from instead of ingesting and running "
+        + "primary alignment modes",
+        False,
+    ],
+    [
+        "-S",
+        "--stats",
+        "",
+        "path to save timing, memory, and item counts for each stage of the run (JSON)",
+        False,
+    ],
+    [
+        "--progress-interval",
+        "--progress_interval",
+        "10",
+        "minimum seconds between progress reports (items done, rate, ETA) "
+        + "logged by long-running stages",
+        False,
+    ],
+    [
+        "-p",
+        "--profile",
+        "",
+        "profile stages of the run: cpu (cProfile), mem (tracemalloc), or both",
+        False,
+    ],
+    [
+        "--profile-stage",
+        "--profile_stage",
+        "*",
+        "name of the stage to profile, or a glob pattern matching stage names "
+        + "(e.g. 'align proximity' or 'ingest *')",
+        False,
+    ],
+    [
+        "--profile-dir",
+        "--profile_dir",
+        "profiles",
+        "directory in which to save profiles (pstats files and tracemalloc snapshots)",
+        False,
+    ],
+    [
+        "-n",
+        "--shard",
+        "",
+        "align only shard i of n (e.g. 3/8) of the places, partitioned "
+        + "geographically, and stop after saving the state with --save-state "
+        + "(combine the states of all shards with merge.py, then resume from the "
+        + "result with --load-state)",
+        False,
+    ],
+    [
+        "--run-dir",
+        "--run_dir",
+        "",
+        "directory in which to checkpoint each stage of the run (ingestion, "
+        + "each alignment mode, and each inference rule)",
+        False,
+    ],
+    [
+        "-r",
+        "--resume",
+        False,
+        "with --run-dir, skip the stages checkpointed by an earlier run whose "
+        + "inputs and configuration are unchanged",
+        False,
+    ],
+    [
+        "-x",
+        "--exhaustive",
+        False,
+        "compare every proximity candidate exactly, even those the report could "
+        + "not include (implied by --store, --save-state, --shard, and "
+        + "--incremental)",
+        False,
+    ],
+    [
+        "-i",
+        "--incremental",
+        "",
+        "path to state kept between runs, so that only places changed since the "
+        + "last run are re-aligned (and the store, if any, patched)",
+        False,
+    ],
 ]
 POSITIONAL_ARGUMENTS = [
     # each row is a list with 3 elements: name, type, help
 ]
 
 
-def main(**kwargs):
+def ingest(config: dict, stats: pleiades_aligner.Stats) -> dict:
     """
-    main function
+    Configure ingesters for namespaces indicated in the config file and ingest their data
     """
-    logger = logging.getLogger()
-    config_file_path = Path(kwargs["config"].strip()).expanduser().resolve()
-    with open(config_file_path, "r", encoding="utf-8") as f:
-        config = json.load(f)
-    del f
-
-    # configure ingesters for namespaces indicated in the config file
+    # raw source records are not needed once ingested unless the config file says otherwise
+    raw_properties = config.get("raw_properties", "drop")
     ingesters = dict()
     for namespace, file_path in config["data_sources"].items():
         if namespace == "chronique":
-            ingesters[namespace] = pleiades_aligner.IngesterChronique(file_path)
+            ingesters[namespace] = pleiades_aligner.IngesterChronique(
+                file_path, raw_properties
+            )
         elif namespace == "manto":
-            ingesters[namespace] = pleiades_aligner.IngesterMANTO(file_path)
+            ingesters[namespace] = pleiades_aligner.IngesterMANTO(
+                file_path, raw_properties
+            )
         elif namespace == "pleiades":
-            ingesters[namespace] = pleiades_aligner.IngesterPleiades(file_path)
+            ingesters[namespace] = pleiades_aligner.IngesterPleiades(
+                file_path, raw_properties
+            )
         elif namespace == "topostext":
-            ingesters[namespace] = pleiades_aligner.IngesterTopostext(file_path)
+            ingesters[namespace] = pleiades_aligner.IngesterTopostext(
+                file_path, raw_properties
+            )
         else:
             raise NotImplementedError(
                 f"No supported ingester for namespace '{namespace}'"
@@ -79,69 +210,266 @@ def main(**kwargs):
     # using the configured ingesters, ingest data from filepaths indicated in the config file
     for namespace, ingester in ingesters.items():
         logger.info(f"Ingesting data for namespace '{namespace}'")
-        ingester.ingest()
+        ingester.stats = stats
+        with stats.stage(f"ingest {namespace}") as record:
+            ingester.ingest()
+            record["items_out"] = len(ingester.data)
         logger.info(f"Successfully ingested {len(ingester.data)} places for namespace '{namespace}'")
+    return ingesters
 
-    # perform alignment operations indicated in the config file using the ingested data
-    logger.info("Performing alignments")
-    aligner = pleiades_aligner.Aligner(ingesters, config["data_sources"], config["redirects"])
-    aligner.align(modes=config["alignment_modes"], proximity_categories=config["proximity_categories"])
-    logger.info(f"Identified {len(aligner.alignments)} alignments")
-    for k, v in config["secondary_modes"].items():
-        aligner.align(modes=[k,], apply_to_modes=v)
+
+def pipeline_stages(config: dict, plan: PipelinePlan) -> list:
+    """
+    Return the name and inputs (configuration and, for ingestion, the signatures of the data
+    sources) of each stage of the run that is checkpointed in a run directory, in order
+    """
+    stages = [
+        (
+            "ingest",
+            {
+                "data_sources": config["data_sources"],
+                "raw_properties": config.get("raw_properties", "drop"),
+                "redirects": config["redirects"],
+                "signatures": {
+                    ns: source_signature(p) for ns, p in config["data_sources"].items()
+                },
+            },
+        )
+    ]
+    for mode in config["alignment_modes"]:
+        stages.append(
+            (
+                f"align {mode}",
+                {
+                    "proximity_categories": config["proximity_categories"],
+                    "plan": plan.asdict(),
+                },
+            )
+        )
+    for mode, apply_to_modes in config["secondary_modes"].items():
+        stages.append((f"align {mode}", {"apply_to_modes": apply_to_modes}))
+    for inference_rule in config["infer"]:
+        stages.append((inference_stage(inference_rule), inference_rule))
+    return stages
+
+
+def inference_stage(inference_rule: dict) -> str:
+    return f"infer {inference_rule['primary_namespace']} {inference_rule['aligned_namespace']} {inference_rule['inference_namespace']}"
+
+
+def checkpointed(run: RunDirectory, name: str) -> bool:
+    """Return True if stage name was checkpointed by an earlier run, so is skipped"""
+    return run is not None and run.skip(name)
+
+
+def main(**kwargs):
+    """
+    main function
+    """
+    logger = logging.getLogger()
+    config_file_path = Path(kwargs["config"].strip()).expanduser().resolve()
+    with open(config_file_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    del f
+
+    stats = pleiades_aligner.Stats(
+        profile=kwargs["profile"] or None,
+        profile_stage=kwargs["profile_stage"],
+        profile_dir=Path(kwargs["profile_dir"]).expanduser().resolve(),
+        progress_interval=float(kwargs["progress_interval"]),
+    )
+    shard = None
+    if kwargs["shard"]:
+        try:
+            shard = tuple(int(n) for n in kwargs["shard"].split("/"))
+            index, count = shard
+        except ValueError:
+            raise ValueError(f"Expected a shard like 3/8, but got '{kwargs['shard']}'")
+        if not kwargs["save_state"] or kwargs["load_state"] or kwargs["incremental"]:
+            raise ValueError(
+                "--shard requires --save-state, and excludes --load-state and --incremental"
+            )
+    # prune proximity candidates the report could not include, unless every alignment is kept
+    exhaustive = bool(
+        kwargs["exhaustive"]
+        or kwargs["store"]
+        or kwargs["save_state"]
+        or kwargs["incremental"]
+        or shard
+    )
+    plan = plan_pipeline(config, exhaustive=exhaustive)
+    logger.info(f"Proximity plan: {plan.asdict()}")
+    run = None
+    if kwargs["run_dir"]:
+        if kwargs["load_state"] or kwargs["incremental"] or shard:
+            raise ValueError(
+                "--run-dir excludes --load-state, --incremental, and --shard"
+            )
+        run_path = Path(kwargs["run_dir"]).expanduser().resolve()
+        run = RunDirectory(
+            run_path, pipeline_stages(config, plan), resume=kwargs["resume"]
+        )
+    elif kwargs["resume"]:
+        raise ValueError("--resume requires --run-dir")
+    changed_ids = None
+    incremental_path = None
+    if kwargs["incremental"]:
+        incremental_path = Path(kwargs["incremental"]).expanduser().resolve()
+    if kwargs["load_state"]:
+        # resume from a snapshot taken after ingestion and primary alignment modes
+        state_path = Path(kwargs["load_state"]).expanduser().resolve()
+        aligner = pleiades_aligner.Aligner.load(state_path)
+        if aligner.shard:
+            raise ValueError(
+                f"{state_path} holds only one shard of the places: merge the snapshots "
+                + "of every shard with merge.py first"
+            )
+        aligner.stats = stats
+        ingesters = aligner.ingesters
+        logger.info(
+            f"Resumed {len(aligner.alignments)} alignments for namespaces {", ".join(list(ingesters.keys()))} from {state_path}"
+        )
+    elif run is not None and run.completed:
+        # resume from the checkpoint of the last stage completed by an earlier run
+        aligner = run.restore()
+        aligner.stats = stats
+        ingesters = aligner.ingesters
+        logger.info(
+            f"Resumed {len(aligner.alignments)} alignments for namespaces {", ".join(list(ingesters.keys()))} from {run_path}"
+        )
+    else:
+        ingesters = ingest(config, stats)
+        if incremental_path and incremental_path.exists():
+            # re-align only the places that changed since the previous incremental run
+            logger.info(f"Performing incremental alignments against {incremental_path}")
+            aligner = pleiades_aligner.Aligner.load(incremental_path)
+            aligner.stats = stats
+            aligner.data_sources = config["data_sources"]
+            aligner.redirects = config["redirects"]
+            changes = aligner.update(
+                ingesters,
+                modes=config["alignment_modes"],
+                proximity_categories=config["proximity_categories"],
+                secondary_modes=config["secondary_modes"],
+            )
+            changed_ids = {
+                ":".join((ns, pid))
+                for ns, c in changes.items()
+                for pids in c.values()
+                for pid in pids
+            }
+        else:
+            aligner = pleiades_aligner.Aligner(
+                ingesters, config["data_sources"], config["redirects"]
+            )
+            aligner.stats = stats
+            if shard:
+                aligner.set_shard(*shard)
+            if run is not None:
+                run.save("ingest", aligner)
+    if changed_ids is None and not kwargs["load_state"]:
+        # perform alignment operations indicated in the config file using the ingested data
+        logger.info("Performing alignments")
+        for mode in config["alignment_modes"]:
+            if not checkpointed(run, f"align {mode}"):
+                aligner.align(
+                    modes=[mode],
+                    proximity_categories=config["proximity_categories"],
+                    plan=plan,
+                )
+                if run is not None:
+                    run.save(f"align {mode}", aligner)
+        logger.info(f"Identified {len(aligner.alignments)} alignments")
+
+    # save a snapshot to resume from when iterating on secondary modes, inference, and reports
+    if kwargs["save_state"]:
+        state_path = Path(kwargs["save_state"]).expanduser().resolve()
+        aligner.save(state_path)
+        logger.info(f"Saved ingested data and primary alignments to {state_path}")
+        if shard:
+            # everything else waits until the shards are merged
+            if kwargs["stats"]:
+                stats.save(Path(kwargs["stats"]).expanduser().resolve())
+            return
+
+    if changed_ids is None:
+        for k, v in config["secondary_modes"].items():
+            if not checkpointed(run, f"align {k}"):
+                aligner.align(modes=[k,], apply_to_modes=v)
+                if run is not None:
+                    run.save(f"align {k}", aligner)
+
+    # save the state the next incremental run will compare against (inference is always rerun)
+    if incremental_path:
+        aligner.save(incremental_path)
+        logger.info(f"Saved state for incremental alignment to {incremental_path}")
 
     # >>> add second-generation alignments, if any, using inference criteria defined in the config file
     for inference_rule in config["infer"]:
-        aligner.align_by_inference(**inference_rule)
+        if not checkpointed(run, inference_stage(inference_rule)):
+            aligner.align_by_inference(**inference_rule)
+            if run is not None:
+                run.save(inference_stage(inference_rule), aligner)
+
+    # persist all alignments and places to an indexed SQLite store, if requested
+    if kwargs["store"]:
+        store_path = Path(kwargs["store"]).expanduser().resolve()
+        if changed_ids is not None and store_path.exists():
+            # patch only what changed since the previous incremental run
+            with pleiades_aligner.AlignmentStore(store_path) as store:
+                store.sync(aligner, changed_ids)
+        else:
+            aligner.persist(store_path).close()
+        logger.info(f"Saved alignments and places to {store_path}")
 
     # prepare a JSON-formatted report according to the parameters defined in the config file
     logger.info(f"Preparing report")
     report = config["report"]
 
-    # >>> ignore alignments relying only on authority namespaces explicitly excluded by the config file
-    alignments = [a for a in aligner.alignments.values() if not a.authority_namespaces.intersection(report["ignore_authority_namespaces"])]
-    
-    # >>> further filter alignments by removing any that aren't based on the combination of alignment modes indicated in config file
-    required_modes = set(report["require_modes"])
-    alignments = [a for a in alignments if required_modes.issubset(a.modes)]
-
-    # >>> convert alignments to dictionaries in anticipation of serializing to JSON
-    alignments = [a.asdict() for a in alignments]
-
-    # >>> further filter alignment dictionaries to exclude those involving places from datasets (i.e. namespaces) explicitly excluded by the config file
-    filtered_alignments = list()
-    for a in alignments:
-        bailout = False
-        pids = a["aligned_ids"]
-        places = dict()
-        for pid in pids:
-            namespace, this_id = pid.split(":")
-            if namespace in report["ignore_place_namespaces"]:
-                bailout = True
-                break
-            try:
-                places[namespace] = ingesters[namespace].data.get_place_by_id(this_id)
-            except KeyError:
-                pass
-        if bailout:
-            continue
-        b = deepcopy(a)
-        # >>> copy essential place information into the alignment dictionaries
-        for namespace, place in places.items():
-            b[namespace] = {
-                "id": place.id,
-                "title": place.title, 
-                "names": list(place.names),
-                "feature_types": list(place.feature_types),
-                "uri": ingesters[namespace].base_uri + place.id,
-                "centroid": to_wkt(place.centroid),
-                "footprint": to_wkt(place.footprint)
-            }
-        filtered_alignments.append(b)
+    # >>> lazily filter out alignments relying only on excluded authority namespaces or lacking required modes
+    def report_alignments():
+        alignments = filter_alignments(
+            aligner.alignments.values(),
+            ignore_authority_namespaces=report["ignore_authority_namespaces"],
+            require_modes=report["require_modes"],
+        )
+        if kwargs["group_by"]:
+            return group_alignments(alignments, kwargs["group_by"])
+        return alignments
+
+    # >>> stream each alignment, enriched with essential place information, as soon as it is ready
+    # >>> (alignments involving places from namespaces excluded by the config file are skipped)
+    if kwargs["output"]:
+        output_path = Path(kwargs["output"]).expanduser().resolve()
+        stream = open(output_path, "w", encoding="utf-8")
+    else:
+        stream = sys.stdout
+    writer = ReportWriter(
+        ingesters,
+        stream,
+        format=kwargs["format"],
+        ignore_place_namespaces=report["ignore_place_namespaces"],
+        geometry_encoding=kwargs["geometry"],
+    )
+    # >>> serialize every referenced place once, up front, with vectorized geometry encoding
+    with stats.stage("report places", items_in=len(aligner.alignments)) as record:
+        record["items_out"] = writer.prime_fragments(report_alignments())
+    logger.info(f"Serialized {record['items_out']} places referenced by the report")
+    try:
+        with stats.stage(
+            "report alignments", items_in=len(aligner.alignments)
+        ) as record:
+            count = writer.write(report_alignments())
+            record["items_out"] = count
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    logger.info(f"Reported on {count} alignments after filtering")
 
-    # output the report
-    print(json.dumps(filtered_alignments, ensure_ascii=False, indent=4, sort_keys=True))
-    logger.info(f"Reported on {len(filtered_alignments)} alignments after filtering")
+    if kwargs["stats"]:
+        stats_path = Path(kwargs["stats"]).expanduser().resolve()
+        stats.save(stats_path)
+        logger.info(f"Saved statistics for {len(stats.stages)} stages to {stats_path}")
 
 if __name__ == "__main__":
     main(
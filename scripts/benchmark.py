@@ -0,0 +1,347 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+"""
+Benchmark each alignment stage against synthetic gazetteers of increasing size
+"""
+
+from airtight.cli import configure_commandline
+from datetime import datetime, timezone
+import json
+import logging
+import os
+from pathlib import Path
+import platform
+from platformdirs import user_cache_dir
+import pleiades_aligner
+from pleiades_aligner.planner import plan_pipeline
+from pleiades_aligner.report import filter_alignments, ReportWriter
+from pleiades_aligner.stats import compare_summaries, summarize_stages
+from pleiades_aligner.synthetic import generate
+import sys
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_PATH = str(
+    Path(user_cache_dir("pleiades_aligner", "isaw_nyu")) / "benchmarks"
+)
+RESULTS_FORMAT = 3  # increment whenever the results change shape
+# the configuration benchmarked, as it would appear in a config file (less data_sources)
+BENCHMARK_CONFIG = {
+    "redirects": {},
+    "alignment_modes": ["assertions", "proximity"],
+    "proximity_categories": {
+        "identical": ["centroid", 0.0],
+        "tight": ["centroid", 0.001],
+        "overlapping": ["footprint", 0.0],
+        "close": ["centroid", 0.005],
+        "near": ["footprint", 0.001],
+    },
+    "secondary_modes": {
+        "toponymy": ["assertion", "proximity"],
+        "typology": ["assertion", "proximity"],
+    },
+    "infer": [
+        {
+            "primary_namespace": "pleiades",
+            "aligned_namespace": "chronique",
+            "inference_namespace": "geonames",
+        }
+    ],
+    "report": {
+        "ignore_authority_namespaces": [],
+        "require_modes": [],
+        "ignore_place_namespaces": ["geonames"],
+    },
+}
+
+DEFAULT_LOG_LEVEL = logging.WARNING
+OPTIONAL_ARGUMENTS = [
+    [
+        "-l",
+        "--loglevel",
+        "NOTSET",
+        "desired logging level ("
+        + "case-insensitive string: DEBUG, INFO, WARNING, or ERROR",
+        False,
+    ],
+    ["-v", "--verbose", False, "verbose output (logging level == INFO)", False],
+    [
+        "-w",
+        "--veryverbose",
+        False,
+        "very verbose output (logging level == DEBUG)",
+        False,
+    ],
+    [
+        "-z",
+        "--sizes",
+        "10000,100000,1000000",
+        "comma-separated numbers of synthetic places to benchmark",
+        False,
+    ],
+    ["-s", "--seed", "0", "seed for the synthetic data generator", False],
+    [
+        "-d",
+        "--data",
+        DEFAULT_DATA_PATH,
+        "directory in which to generate (and reuse) synthetic data",
+        False,
+    ],
+    ["-o", "--output", "", "path to results file (default: standard output)", False],
+    [
+        "-t",
+        "--tracemalloc",
+        False,
+        "also measure peak Python allocations per stage (slows every stage, but "
+        + "without it memory is compared only by how much each stage raised the "
+        + "process's peak RSS)",
+        False,
+    ],
+    [
+        "-r",
+        "--repeat",
+        "1",
+        "number of times to run the stages for each size (times are compared by "
+        + "median)",
+        False,
+    ],
+    [
+        "-b",
+        "--baseline",
+        "",
+        "path to baseline results: compare against them, exiting non-zero on "
+        + "regression or on a baseline benchmark missing from these results (if "
+        + "the file does not exist, save these results there instead)",
+        False,
+    ],
+    [
+        "--allow-missing",
+        "--allow_missing",
+        False,
+        "do not fail when benchmarks in the baseline are missing from these "
+        + "results (e.g. when running fewer sizes)",
+        False,
+    ],
+    [
+        "-u",
+        "--update-baseline",
+        False,
+        "replace the baseline with these results after comparing",
+        False,
+    ],
+    [
+        "--time-tolerance",
+        "--time_tolerance",
+        "0.25",
+        "slowdown in median wall time, as a fraction of the baseline, that "
+        + "counts as a regression",
+        False,
+    ],
+    [
+        "--memory-tolerance",
+        "--memory_tolerance",
+        "0.25",
+        "increase in peak memory, as a fraction of the baseline, that counts as "
+        + "a regression",
+        False,
+    ],
+    [
+        "--count-tolerance",
+        "--count_tolerance",
+        "0.0",
+        "increase in candidate pairs evaluated, as a fraction of the baseline, "
+        + "that counts as a regression",
+        False,
+    ],
+    [
+        "--min-seconds",
+        "--min_seconds",
+        "0.05",
+        "ignore differences in wall time smaller than this many seconds",
+        False,
+    ],
+    [
+        "--min-bytes",
+        "--min_bytes",
+        "1048576",
+        "ignore differences in memory smaller than this many bytes",
+        False,
+    ],
+]
+POSITIONAL_ARGUMENTS = [
+    # each row is a list with 3 elements: name, type, help
+]
+
+
+def data_sources(path: Path, size: int, seed: int) -> dict:
+    """Return the data_sources of the synthetic gazetteer of size and seed, generating it once"""
+    path = path / f"{size}-{seed}"
+    manifest_path = path / "sources.json"
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    logger.info(f"Generating {size} synthetic places in {path}")
+    sources = generate(path, size, seed)
+    # written last, so that an interrupted generation is redone
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(sources, f)
+    return sources
+
+
+def benchmark(size: int, sources: dict, trace: bool) -> list:
+    """
+    Run every alignment stage against a synthetic gazetteer and return the statistics of
+    each stage (see pleiades_aligner.stats), labeled with the size
+    """
+    config = BENCHMARK_CONFIG
+    stats = pleiades_aligner.Stats(trace_memory=trace)
+    ingesters = {
+        "chronique": pleiades_aligner.IngesterChronique,
+        "manto": pleiades_aligner.IngesterMANTO,
+        "pleiades": pleiades_aligner.IngesterPleiades,
+        "topostext": pleiades_aligner.IngesterTopostext,
+    }
+    for namespace, file_path in sources.items():
+        with stats.stage(f"ingest {namespace}") as record:
+            ingesters[namespace] = ingesters[namespace](file_path, "drop")
+            ingesters[namespace].ingest()
+            record["items_out"] = len(ingesters[namespace].data)
+    aligner = pleiades_aligner.Aligner(ingesters, sources, config["redirects"])
+    aligner.stats = stats
+    aligner.align(
+        modes=config["alignment_modes"],
+        proximity_categories=config["proximity_categories"],
+        plan=plan_pipeline(config),
+    )
+    for mode, apply_to_modes in config["secondary_modes"].items():
+        aligner.align(modes=[mode], apply_to_modes=apply_to_modes)
+    for inference_rule in config["infer"]:
+        aligner.align_by_inference(**inference_rule)
+    report = config["report"]
+    with stats.stage("report", items_in=len(aligner.alignments)) as record:
+        with open(os.devnull, "w", encoding="utf-8") as stream:
+            writer = ReportWriter(
+                ingesters,
+                stream,
+                format="jsonl",
+                ignore_place_namespaces=report["ignore_place_namespaces"],
+            )
+            alignments = filter_alignments(
+                aligner.alignments.values(),
+                ignore_authority_namespaces=report["ignore_authority_namespaces"],
+                require_modes=report["require_modes"],
+            )
+            record["items_out"] = writer.write(alignments)
+    return [dict(size=size, **record) for record in stats.stages]
+
+
+def print_comparison(rows: list, stream=sys.stdout):
+    """Print a table of the regressions and improvements found by compare_summaries()"""
+    if not rows:
+        stream.write("No regressions or improvements beyond tolerances\n")
+        return
+    width = max([len(row["benchmark"]) for row in rows])
+    for row in rows:
+        line = f"{row['benchmark']:<{width}}  {row['verdict']:<11}"
+        if row["metric"] is not None:
+            before = format_metric(row["metric"], row["baseline"])
+            after = format_metric(row["metric"], row["current"])
+            line += f"  {row['metric']:<17}  {before:>12} -> {after:>12}"
+            if row["change"] is not None:
+                line += f"  {row['change']:+.1%}"
+        stream.write(line.rstrip() + "\n")
+
+
+def format_metric(metric: str, value) -> str:
+    if metric.endswith("_s"):
+        return f"{value:.3f}s"
+    if metric.endswith("_bytes"):
+        return f"{value / 2**20:.1f} MiB"
+    return str(value)
+
+
+def main(**kwargs):
+    """
+    main function
+    """
+    data_path = Path(kwargs["data"]).expanduser().resolve()
+    seed = int(kwargs["seed"])
+    sizes = [int(s) for s in kwargs["sizes"].split(",") if s.strip()]
+    results = {
+        "format": RESULTS_FORMAT,
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "tracemalloc": kwargs["tracemalloc"],
+        "repeat": int(kwargs["repeat"]),
+        "config": BENCHMARK_CONFIG,
+        "results": list(),
+    }
+    for size in sizes:
+        sources = data_sources(data_path, size, seed)
+        for i in range(results["repeat"]):
+            results["results"].extend(benchmark(size, sources, kwargs["tracemalloc"]))
+    results["summary"] = summarize_stages(results["results"])
+    if kwargs["output"]:
+        output_path = Path(kwargs["output"]).expanduser().resolve()
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+    elif not kwargs["baseline"]:
+        json.dump(results, sys.stdout, indent=4)
+        sys.stdout.write("\n")
+    if not kwargs["baseline"]:
+        return
+
+    # compare against the baseline, or make these results the baseline if there is none yet
+    baseline_path = Path(kwargs["baseline"]).expanduser().resolve()
+    try:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = None
+        logger.warning(
+            f"No baseline at {baseline_path}: saving these results as the baseline"
+        )
+    if baseline is not None:
+        if baseline["format"] != RESULTS_FORMAT:
+            raise ValueError(
+                f"Expected results format {RESULTS_FORMAT}, but {baseline_path} has format {baseline['format']}"
+            )
+        rows = compare_summaries(
+            baseline["summary"],
+            results["summary"],
+            time_tolerance=float(kwargs["time_tolerance"]),
+            memory_tolerance=float(kwargs["memory_tolerance"]),
+            count_tolerance=float(kwargs["count_tolerance"]),
+            min_seconds=float(kwargs["min_seconds"]),
+            min_bytes=int(kwargs["min_bytes"]),
+        )
+        print_comparison(rows)
+        failures = [r for r in rows if r["verdict"] == "regression"]
+        missing = [r["benchmark"] for r in rows if r["verdict"] == "missing"]
+        if missing:
+            logger.warning(
+                f"Benchmarks in the baseline missing from these results: {', '.join(missing)}"
+            )
+            if not kwargs["allow_missing"]:
+                failures.extend(missing)
+    if baseline is None or kwargs["update_baseline"]:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+    if baseline is not None and failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(
+        **configure_commandline(
+            OPTIONAL_ARGUMENTS, POSITIONAL_ARGUMENTS, DEFAULT_LOG_LEVEL
+        )
+    )
@@ -0,0 +1,118 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+"""
+Report what changed between the alignments of two runs (reports or SQLite stores)
+"""
+
+from airtight.cli import configure_commandline
+import json
+import logging
+from pathlib import Path
+from pleiades_aligner.diff import DISTANCE_ABS_TOL, DISTANCE_REL_TOL, diff_paths
+import sys
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_LEVEL = logging.WARNING
+OPTIONAL_ARGUMENTS = [
+    [
+        "-l",
+        "--loglevel",
+        "NOTSET",
+        "desired logging level ("
+        + "case-insensitive string: DEBUG, INFO, WARNING, or ERROR",
+        False,
+    ],
+    ["-v", "--verbose", False, "verbose output (logging level == INFO)", False],
+    [
+        "-w",
+        "--veryverbose",
+        False,
+        "very verbose output (logging level == DEBUG)",
+        False,
+    ],
+    ["-o", "--output", "", "path to diff file (default: standard output)", False],
+    [
+        "-s",
+        "--summary",
+        False,
+        "print only the number of alignments added, removed, and changed",
+        False,
+    ],
+    [
+        "-k",
+        "--chunk",
+        "100000",
+        "number of report records to sort in memory at a time",
+        False,
+    ],
+    [
+        "-r",
+        "--rel-tolerance",
+        str(DISTANCE_REL_TOL),
+        "relative difference in centroid distances below which they are unchanged",
+        False,
+    ],
+    [
+        "-a",
+        "--abs-tolerance",
+        str(DISTANCE_ABS_TOL),
+        "absolute difference in centroid distances below which they are unchanged",
+        False,
+    ],
+]
+POSITIONAL_ARGUMENTS = [
+    # each row is a list with 3 elements: name, type, help
+    ["old", str, "path to the earlier report or SQLite alignment store"],
+    ["new", str, "path to the later report or SQLite alignment store"],
+]
+
+
+def main(**kwargs):
+    """
+    main function
+    """
+    paths = list()
+    for k in ["old", "new"]:
+        whence = Path(kwargs[k]).expanduser().resolve()
+        if not whence.exists():
+            raise FileNotFoundError(whence)
+        paths.append(whence)
+    if kwargs["output"]:
+        stream = open(
+            Path(kwargs["output"]).expanduser().resolve(), "w", encoding="utf-8"
+        )
+    else:
+        stream = sys.stdout
+    counts = {"added": 0, "removed": 0, "changed": 0}
+    try:
+        # one change record per line, in alignment key order
+        for change in diff_paths(
+            *paths,
+            chunk_size=int(kwargs["chunk"]),
+            rel_tol=float(kwargs["rel_tolerance"]),
+            abs_tol=float(kwargs["abs_tolerance"]),
+        ):
+            counts[change["change"]] += 1
+            if not kwargs["summary"]:
+                stream.write(json.dumps(change, ensure_ascii=False, sort_keys=True))
+                stream.write("\n")
+        if kwargs["summary"]:
+            stream.write(json.dumps(counts, sort_keys=True))
+            stream.write("\n")
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    logger.info(", ".join([f"{v} {k}" for k, v in counts.items()]))
+
+
+if __name__ == "__main__":
+    main(
+        **configure_commandline(
+            OPTIONAL_ARGUMENTS, POSITIONAL_ARGUMENTS, DEFAULT_LOG_LEVEL
+        )
+    )
@@ -0,0 +1,78 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+"""
+Merge the saved states of every shard of a sharded run (align.py --shard i/n --save-state)
+"""
+
+from airtight.cli import configure_commandline
+import logging
+from pathlib import Path
+import pleiades_aligner
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_LEVEL = logging.WARNING
+OPTIONAL_ARGUMENTS = [
+    [
+        "-l",
+        "--loglevel",
+        "NOTSET",
+        "desired logging level ("
+        + "case-insensitive string: DEBUG, INFO, WARNING, or ERROR",
+        False,
+    ],
+    ["-v", "--verbose", False, "verbose output (logging level == INFO)", False],
+    [
+        "-w",
+        "--veryverbose",
+        False,
+        "very verbose output (logging level == DEBUG)",
+        False,
+    ],
+]
+POSITIONAL_ARGUMENTS = [
+    # each row is a list with 3 elements: name, type, help
+    [
+        "shards",
+        str,
+        "comma-separated paths to the saved states of every shard, or a glob pattern "
+        + "matching them",
+    ],
+    [
+        "output",
+        str,
+        "path to save the merged state (resume from it with align.py --load-state)",
+    ],
+]
+
+
+def main(**kwargs):
+    """
+    main function
+    """
+    paths = list()
+    for pattern in kwargs["shards"].split(","):
+        whence = Path(pattern.strip()).expanduser()
+        if whence.exists():
+            paths.append(whence.resolve())
+        else:
+            matches = sorted(whence.parent.glob(whence.name))
+            if not matches:
+                raise FileNotFoundError(whence)
+            paths.extend([m.resolve() for m in matches])
+    aligner = pleiades_aligner.Aligner.merge(paths)
+    output_path = Path(kwargs["output"]).expanduser().resolve()
+    aligner.save(output_path)
+    logger.info(f"Saved {len(aligner.alignments)} alignments merged from {len(paths)} shards to {output_path}")
+
+
+if __name__ == "__main__":
+    main(
+        **configure_commandline(
+            OPTIONAL_ARGUMENTS, POSITIONAL_ARGUMENTS, DEFAULT_LOG_LEVEL
+        )
+    )
@@ -12,6 +12,8 @@ from airtight.cli import configure_commandline
 import json
 import logging
 from pathlib import Path
+from pleiades_aligner.categories import CategoryRules, PLACE_CRITERIA, split_ids
+from pleiades_aligner.report import iter_report
 from pprint import pformat
 
 logger = logging.getLogger(__name__)
@@ -38,7 +40,11 @@ OPTIONAL_ARGUMENTS = [
 ]
 POSITIONAL_ARGUMENTS = [
     # each row is a list with 3 elements: name, type, help
-    ["jsonpath", str, "path to JSON file containing alignments"]
+    [
+        "jsonpath",
+        str,
+        "path to JSON file containing alignments (any report format written by align.py)",
+    ]
 ]
 
 
@@ -64,34 +70,25 @@ def main(**kwargs):
     """
     # logger = logging.getLogger(sys._getframe().f_code.co_name)
     inpath = Path(kwargs["jsonpath"]).expanduser().resolve()
-    with open(inpath, "r", encoding="utf-8") as f:
-        alignments = json.load(f)
-    del f
-    logger.info(f"Loaded {len(alignments)} alignments from {inpath}")
-
-    # filter alignments for the desired namespace
     primary_namespace = kwargs["namespace"]
-    alignments = {
-        a["hash"]: a for a in alignments if primary_namespace in a["aligned_namespaces"]
-    }
-    logger.info(f"After filtering: {len(alignments)} alignments")
 
-    # reorganize alignments by places in the primary namespace
+    # stream alignments for the desired namespace, reorganizing them by places in the primary namespace
     aligned_places = dict()
-    for a in alignments.values():
-        this_pid = [id for id in a["aligned_ids"] if id.startswith(primary_namespace)][
-            0
-        ]
-        that_pid = [id for id in a["aligned_ids"] if id != this_pid][0]
+    total = 0
+    count = 0
+    for a in iter_report(inpath):
+        total += 1
+        ids = split_ids(a, primary_namespace)
+        if ids is None:
+            continue
+        count += 1
+        this_pid, that_pid, that_namespace = ids
         this_pid_raw = this_pid.split(":")[1]
         try:
             aligned_places[this_pid_raw]
         except KeyError:
             aligned_places[this_pid_raw] = dict()
             aligned_places[this_pid_raw][primary_namespace] = a[primary_namespace]
-        that_namespace = [
-            ns for ns in a["aligned_namespaces"] if ns != primary_namespace
-        ][0]
         try:
             aligned_places[this_pid_raw][that_namespace]
         except KeyError:
@@ -123,31 +120,22 @@ def main(**kwargs):
                 if k in ["id"]:
                     continue
                 aligned_places[this_pid_raw][that_namespace][that_pid_raw][k] = v
+    logger.info(f"Loaded {count} of {total} alignments from {inpath}")
     logger.info(f"{len(aligned_places)} aligned places")
 
     # place the aligned places into categories of interest
+    rules = CategoryRules(PLACE_CRITERIA)
     categories = dict()
     for pleiades_id, data in aligned_places.items():
-        modes = set()
-        for ns, alignment in data.items():
-            if ns == "pleiades":
-                continue
-            for placeid, datum in alignment.items():
-                modes.add(",".join(sorted(datum["modes"])))
-        logger.error(modes)
-        cat = None
-        if "assertion,proximity,toponymy,typology" in modes:
-            cat = 1
-        elif "assertion,proximity,typology" or "proximity,toponymy,typology" in modes:
-            cat = 2
-        elif "assertion,proximity,toponymy" in modes:
-            cat = 3
-        elif "toponymy,proximity" in modes:
-            cat = 4
-        elif "proximity" in modes:
-            cat = 5
-        else:
-            cat = 6
+        cat = rules.classify_group(
+            [
+                datum
+                for ns, alignment in data.items()
+                if ns != "pleiades"
+                for datum in alignment.values()
+            ],
+            default=6,
+        )
         try:
             categories[cat]
         except KeyError:
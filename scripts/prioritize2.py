@@ -12,6 +12,8 @@ from airtight.cli import configure_commandline
 import json
 import logging
 from pathlib import Path
+from pleiades_aligner.categories import CategoryRules, PRIORITY_CRITERIA, split_ids
+from pleiades_aligner.report import iter_report
 from pprint import pformat
 
 logger = logging.getLogger(__name__)
@@ -38,52 +40,13 @@ OPTIONAL_ARGUMENTS = [
 ]
 POSITIONAL_ARGUMENTS = [
     # each row is a list with 3 elements: name, type, help
-    ["jsonpath", str, "path to JSON file containing alignments"]
+    [
+        "jsonpath",
+        str,
+        "path to JSON file containing alignments (any report format written by align.py)",
+    ]
 ]
 
-cat_criteria = {
-    "1": {
-        "modes": {"assertion", "proximity", "toponymy", "typology"},
-        "proximity_types": {"identical", "tight"},
-        "inference_modes": {},
-    },
-    "2": {
-        "modes": {"assertion", "proximity", "toponymy", "typology"},
-        "proximity_types": {"overlapping"},
-        "inference_modes": {},
-    },
-    "3": {
-        "modes": {"assertion", "proximity", "toponymy", "typology"},
-        "proximity_types": {"close"},
-        "inference_modes": {},
-    },
-    "4": {
-        "modes": {"proximity", "toponymy", "typology"},
-        "proximity_types": {"identical", "tight"},
-        "inference_modes": {},
-    },
-    "5": {
-        "modes": {"proximity", "toponymy", "typology"},
-        "proximity_types": {"overlapping"},
-        "inference_modes": {},
-    },
-    "6": {
-        "modes": {"proximity", "toponymy", "typology"},
-        "proximity_types": {"close"},
-        "inference_modes": {},
-    },
-    "7": {
-        "modes": {"assertion", "proximity", "toponymy"},
-        "proximity_types": {"identical", "tight", "overlapping", "close"},
-        "inference_modes": {},
-    },
-    "8": {
-        "modes": {"assertion", "toponymy"},
-        "proximity_types": {},
-        "inference_modes": {},
-    },
-}
-
 
 class SetEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -97,71 +60,54 @@ def main(**kwargs):
     main function
     """
     inpath = Path(kwargs["jsonpath"]).expanduser().resolve()
-    with open(inpath, "r", encoding="utf-8") as f:
-        alignments = json.load(f)
-    del f
-    logger.info(f"Loaded {len(alignments)} alignments from {inpath}")
-
-    # filter alignments for the desired namespace
     primary_namespace = kwargs["namespace"]
-    alignments = {
-        a["hash"]: a for a in alignments if primary_namespace in a["aligned_namespaces"]
-    }
-    logger.info(f"After filtering: {len(alignments)} alignments")
+    rules = CategoryRules(PRIORITY_CRITERIA)
 
-    # group by categories and primary namespace places
-    categories = {cat: dict() for cat in cat_criteria.keys()}
+    # stream alignments for the desired namespace, grouping them by categories and primary namespace places
+    alignments = dict()
+    categories = {cat: dict() for cat in rules.criteria.keys()}
     count = 0
-    inf_only = set("inference")
+    total = 0
     inferred_alignments_by_pid = dict()
-    for ahash, a in alignments.items():
-        a_modes = set(a["modes"])
-        primary_pid = [
-            pid for pid in a["aligned_ids"] if pid.startswith(primary_namespace)
-        ][0]
-        hit = False
-        for cat, criteria in cat_criteria.items():
-            if a_modes == criteria["modes"]:
-                if criteria["proximity_types"]:
-                    try:
-                        a["proximity"]
-                    except KeyError:
-                        continue
-                    else:
-                        if a["proximity"] in criteria["proximity_types"]:
-                            hit = True
-                else:
-                    hit = True
-            if hit:
-                count += 1
-                try:
-                    categories[cat][primary_pid]
-                except KeyError:
-                    categories[cat][primary_pid] = set()
-                categories[cat][primary_pid].add(ahash)
-                break
-        if not hit and "inference" in a_modes:
+    for a in iter_report(inpath):
+        total += 1
+        ids = split_ids(a, primary_namespace)
+        if ids is None:
+            continue
+        ahash = a["hash"]
+        primary_pid = ids[0]
+        cat = rules.classify(a)
+        if cat is not None:
+            count += 1
+            alignments[ahash] = a
+            try:
+                categories[cat][primary_pid]
+            except KeyError:
+                categories[cat][primary_pid] = set()
+            categories[cat][primary_pid].add(ahash)
+        elif "inference" in a["modes"]:
+            alignments[ahash] = a
             try:
                 inferred_alignments_by_pid[primary_pid]
             except KeyError:
                 inferred_alignments_by_pid[primary_pid] = set()
             inferred_alignments_by_pid[primary_pid].add(ahash)
+    logger.info(f"Categorized {count} of {total} alignments from {inpath}")
 
     # places by category
-    results = {cat: dict() for cat in cat_criteria.keys()}
+    results = {cat: dict() for cat in rules.criteria.keys()}
     for cat, hashes_by_pids in categories.items():
         for primary_pid, hashes in hashes_by_pids.items():
             for ahash in hashes:
                 a = alignments[ahash]
-                other_pid = [pid for pid in a["aligned_ids"] if pid != primary_pid][0]
+                primary_pid, other_pid, other_namespace = split_ids(
+                    a, primary_namespace
+                )
                 try:
                     results[cat][primary_pid]
                 except KeyError:
                     results[cat][primary_pid] = dict()
                 results[cat][primary_pid][primary_pid] = a[primary_namespace]
-                other_namespace = [
-                    ns for ns in a["aligned_namespaces"] if ns != primary_namespace
-                ][0]
                 results[cat][primary_pid][other_pid] = a[other_namespace]
                 results[cat][primary_pid][other_pid]["authorities"] = a["authorities"]
                 results[cat][primary_pid][other_pid]["modes"] = a["modes"]
@@ -183,14 +129,9 @@ def main(**kwargs):
                     if set(a["authorities"]).intersection(
                         results[cat][primary_pid][other_pid]["authorities"]
                     ):
-                        other_pid = [
-                            pid for pid in a["aligned_ids"] if pid != primary_pid
-                        ][0]
-                        other_namespace = [
-                            ns
-                            for ns in a["aligned_namespaces"]
-                            if ns != primary_namespace
-                        ][0]
+                        primary_pid, other_pid, other_namespace = split_ids(
+                            a, primary_namespace
+                        )
                         try:
                             results[cat][primary_pid][other_pid] = a[other_namespace]
                         except KeyError:
@@ -12,6 +12,14 @@ from airtight.cli import configure_commandline
 import json
 import logging
 from pathlib import Path
+from pleiades_aligner.categories import (
+    build_place_group,
+    CategoryRules,
+    iter_place_groups,
+    PRIORITY_CRITERIA,
+    split_ids,
+)
+from pleiades_aligner.report import iter_report
 from pprint import pformat
 
 logger = logging.getLogger(__name__)
@@ -35,55 +43,24 @@ OPTIONAL_ARGUMENTS = [
         False,
     ],
     ["-n", "--namespace", "pleiades", "namespace to group by", False],
+    [
+        "-s",
+        "--stream",
+        False,
+        "read JSON Lines grouped by namespace id (see align.py --group-by) and write "
+        + "one JSON line per categorized place as soon as its group is complete",
+        False,
+    ],
 ]
 POSITIONAL_ARGUMENTS = [
     # each row is a list with 3 elements: name, type, help
-    ["jsonpath", str, "path to JSON file containing alignments"]
+    [
+        "jsonpath",
+        str,
+        "path to JSON file containing alignments (any report format written by align.py)",
+    ]
 ]
 
-cat_criteria = {
-    "1": {
-        "modes": {"assertion", "proximity", "toponymy", "typology"},
-        "proximity_types": {"identical", "tight"},
-        "inference_modes": {},
-    },
-    "2": {
-        "modes": {"assertion", "proximity", "toponymy", "typology"},
-        "proximity_types": {"overlapping"},
-        "inference_modes": {},
-    },
-    "3": {
-        "modes": {"assertion", "proximity", "toponymy", "typology"},
-        "proximity_types": {"close"},
-        "inference_modes": {},
-    },
-    "4": {
-        "modes": {"proximity", "toponymy", "typology"},
-        "proximity_types": {"identical", "tight"},
-        "inference_modes": {},
-    },
-    "5": {
-        "modes": {"proximity", "toponymy", "typology"},
-        "proximity_types": {"overlapping"},
-        "inference_modes": {},
-    },
-    "6": {
-        "modes": {"proximity", "toponymy", "typology"},
-        "proximity_types": {"close"},
-        "inference_modes": {},
-    },
-    "7": {
-        "modes": {"assertion", "proximity", "toponymy"},
-        "proximity_types": {"identical", "tight", "overlapping", "close"},
-        "inference_modes": {},
-    },
-    "8": {
-        "modes": {"assertion", "toponymy"},
-        "proximity_types": {},
-        "inference_modes": {},
-    },
-}
-
 
 class SetEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -97,29 +74,42 @@ def main(**kwargs):
     main function
     """
     inpath = Path(kwargs["jsonpath"]).expanduser().resolve()
-    with open(inpath, "r", encoding="utf-8") as f:
-        alignments = json.load(f)
-    del f
-    logger.info(f"Loaded {len(alignments)} alignments from {inpath}")
-
-    # filter alignments for the desired namespace
     primary_namespace = kwargs["namespace"]
-    alignments = {
-        a["hash"]: a for a in alignments if primary_namespace in a["aligned_namespaces"]
-    }
-    logger.info(f"After filtering: {len(alignments)} alignments")
-
-    # group by primary namespace places and categorize
+    rules = CategoryRules(PRIORITY_CRITERIA)
+
+    if kwargs["stream"]:
+        # write each categorized place as soon as its group of alignments is complete
+        place_count = 0
+        for cat, primary_pid, count, group in iter_place_groups(
+            iter_report(inpath), primary_namespace, rules
+        ):
+            place_count += 1
+            record = {
+                "category": int(cat),
+                "id": primary_pid,
+                "alignments": count,
+                "places": group,
+            }
+            print(json.dumps(record, cls=SetEncoder))
+        logger.info(f"Wrote {place_count} categorized places")
+        return
+
+    # stream alignments for the desired namespace, grouping them by primary namespace places and categorizing them
+    alignments = dict()
     ahashes_by_pid = dict()
     inference_only_ahashes_by_pid = dict()
     pid_categories = dict()
-    for ahash, a in alignments.items():
-        a_modes = set(a["modes"])
-        primary_pid = [
-            pid for pid in a["aligned_ids"] if pid.startswith(primary_namespace)
-        ][0]
+    total = 0
+    for a in iter_report(inpath):
+        total += 1
+        ids = split_ids(a, primary_namespace)
+        if ids is None:
+            continue
+        ahash = a["hash"]
+        primary_pid = ids[0]
 
-        if a_modes == {"inference"}:
+        if a["modes"] == ["inference"]:
+            alignments[ahash] = a
             try:
                 inference_only_ahashes_by_pid[primary_pid]
             except KeyError:
@@ -127,34 +117,23 @@ def main(**kwargs):
             inference_only_ahashes_by_pid[primary_pid].add(ahash)
             continue
 
-        hit = False
-        for cat, criteria in cat_criteria.items():
-            if a_modes == criteria["modes"]:
-                if criteria["proximity_types"]:
-                    try:
-                        a["proximity"]
-                    except KeyError:
-                        continue
-                    else:
-                        if a["proximity"] in criteria["proximity_types"]:
-                            hit = True
-                else:
-                    hit = True
-            if hit:
-                try:
-                    ahashes_by_pid[primary_pid]
-                except KeyError:
-                    ahashes_by_pid[primary_pid] = set()
-                ahashes_by_pid[primary_pid].add(ahash)
-                try:
-                    pid_categories[primary_pid]
-                except KeyError:
-                    pid_categories[primary_pid] = set()
-                pid_categories[primary_pid].add(int(cat))
-                break
+        cat = rules.classify(a)
+        if cat is not None:
+            alignments[ahash] = a
+            try:
+                ahashes_by_pid[primary_pid]
+            except KeyError:
+                ahashes_by_pid[primary_pid] = set()
+            ahashes_by_pid[primary_pid].add(ahash)
+            try:
+                pid_categories[primary_pid]
+            except KeyError:
+                pid_categories[primary_pid] = set()
+            pid_categories[primary_pid].add(int(cat))
+    logger.info(f"Categorized {len(alignments)} of {total} alignments from {inpath}")
 
     # places by lowest category
-    results = {int(cat): dict() for cat in cat_criteria.keys()}
+    results = {int(cat): dict() for cat in rules.criteria.keys()}
 
     pids_low_categories = {pid: min(cats) for pid, cats in pid_categories.items()}
     unique_cats = {cat for cat in pids_low_categories.values()}
@@ -170,75 +149,14 @@ def main(**kwargs):
         )
         for primary_pid in sorted_pids:
             place_count += 1
-            for ahash in ahashes_by_pid[primary_pid]:
-                alignment_count += 1
-                a = alignments[ahash]
-                other_pid = [pid for pid in a["aligned_ids"] if pid != primary_pid][0]
-                try:
-                    results[cat][primary_pid]
-                except KeyError:
-                    results[cat][primary_pid] = dict()
-                try:
-                    results[cat][primary_pid][primary_pid] = a[primary_namespace]
-                except KeyError:
-                    pass
-                other_namespace = [
-                    ns for ns in a["aligned_namespaces"] if ns != primary_namespace
-                ][0]
-                try:
-                    results[cat][primary_pid][other_pid] = a[other_namespace]
-                except KeyError:
-                    results[cat][primary_pid][other_pid] = dict()
-                results[cat][primary_pid][other_pid]["authorities"] = a["authorities"]
-                results[cat][primary_pid][other_pid]["modes"] = a["modes"]
-                try:
-                    results[cat][primary_pid][other_pid]["proximity"] = a["proximity"]
-                    results[cat][primary_pid][other_pid]["centroid_distance_m"] = a[
-                        "centroid_distance_m"
-                    ]
-                except KeyError:
-                    results[cat][primary_pid][other_pid]["proximity"] = None
-                    results[cat][primary_pid][other_pid]["centroid_distance_m"] = None
-            try:
-                them = inference_only_ahashes_by_pid[primary_pid]
-            except KeyError:
-                pass
-            else:
-                for ahash in them:
-                    alignment_count += 1
-                    a = alignments[ahash]
-                    inference_ids = {pid for pid in a["authorities"]}
-                    if not inference_ids.intersection(
-                        set(results[cat][primary_pid].keys())
-                    ):
-                        continue
-                    other_pid = [pid for pid in a["aligned_ids"] if pid != primary_pid][
-                        0
-                    ]
-
-                    other_namespace = [
-                        ns for ns in a["aligned_namespaces"] if ns != primary_namespace
-                    ][0]
-                    try:
-                        results[cat][primary_pid][other_pid] = a[other_namespace]
-                    except KeyError:
-                        results[cat][primary_pid][other_pid] = dict()
-                    results[cat][primary_pid][other_pid]["authorities"] = a[
-                        "authorities"
-                    ]
-                    results[cat][primary_pid][other_pid]["modes"] = a["modes"]
-                    try:
-                        results[cat][primary_pid][other_pid]["proximity"] = a[
-                            "proximity"
-                        ]
-                        results[cat][primary_pid][other_pid]["centroid_distance_m"] = a[
-                            "centroid_distance_m"
-                        ]
-                    except KeyError:
-                        results[cat][primary_pid][other_pid]["proximity"] = None
-                        results[cat][primary_pid][other_pid][
-                            "centroid_distance_m"
-                        ] = None
+            them = inference_only_ahashes_by_pid.get(primary_pid, set())
+            alignment_count += len(ahashes_by_pid[primary_pid]) + len(them)
+            results[cat][primary_pid] = build_place_group(
+                primary_pid,
+                [alignments[ahash] for ahash in ahashes_by_pid[primary_pid]],
+                [alignments[ahash] for ahash in them],
+                primary_namespace,
+            )
 
     print(json.dumps(results, indent=4, cls=SetEncoder))
     logger.info(
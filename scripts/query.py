@@ -0,0 +1,99 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+"""
+Query a SQLite alignment store saved by align.py
+"""
+
+from airtight.cli import configure_commandline
+import json
+import logging
+from pathlib import Path
+from pleiades_aligner.store import AlignmentStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOG_LEVEL = logging.WARNING
+OPTIONAL_ARGUMENTS = [
+    [
+        "-l",
+        "--loglevel",
+        "NOTSET",
+        "desired logging level ("
+        + "case-insensitive string: DEBUG, INFO, WARNING, or ERROR",
+        False,
+    ],
+    ["-v", "--verbose", False, "verbose output (logging level == INFO)", False],
+    [
+        "-w",
+        "--veryverbose",
+        False,
+        "very verbose output (logging level == DEBUG)",
+        False,
+    ],
+    ["-i", "--id", "", "full id of a place the alignments must involve", False],
+    [
+        "-n",
+        "--namespaces",
+        "",
+        "one or two namespaces the aligned places must come from (comma-separated)",
+        False,
+    ],
+    ["-m", "--modes", "", "alignment modes required (comma-separated)", False],
+    ["-x", "--exclude", "", "alignment modes excluded (comma-separated)", False],
+    ["-p", "--proximity", "", "proximity classes accepted (comma-separated)", False],
+    [
+        "-a",
+        "--authorities",
+        "",
+        "authority namespaces accepted (comma-separated)",
+        False,
+    ],
+    ["-e", "--embed", False, "embed aligned place records in the output", False],
+]
+POSITIONAL_ARGUMENTS = [
+    # each row is a list with 3 elements: name, type, help
+    ["storepath", str, "path to SQLite alignment store"]
+]
+
+
+def split_arg(value: str) -> list:
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def main(**kwargs):
+    """
+    main function
+    """
+    whence = Path(kwargs["storepath"]).expanduser().resolve()
+    if not whence.exists():
+        raise FileNotFoundError(whence)
+    with AlignmentStore(whence) as store:
+        alignments = store.query(
+            full_id=kwargs["id"].strip(),
+            namespaces=split_arg(kwargs["namespaces"]),
+            modes=split_arg(kwargs["modes"]),
+            exclude_modes=split_arg(kwargs["exclude"]),
+            proximity=split_arg(kwargs["proximity"]),
+            authority_namespaces=split_arg(kwargs["authorities"]),
+        )
+        logger.info(f"Found {len(alignments)} matching alignments in {whence}")
+        if kwargs["embed"]:
+            for a in alignments:
+                for pid in a["aligned_ids"]:
+                    try:
+                        a[pid.split(":")[0]] = store.get_place(pid)
+                    except KeyError:
+                        pass
+    print(json.dumps(alignments, ensure_ascii=False, indent=4, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main(
+        **configure_commandline(
+            OPTIONAL_ARGUMENTS, POSITIONAL_ARGUMENTS, DEFAULT_LOG_LEVEL
+        )
+    )
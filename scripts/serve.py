@@ -0,0 +1,106 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+"""
+Serve single-place alignment queries from a saved state kept in memory (see pleiades_aligner.service)
+"""
+
+from airtight.cli import configure_commandline
+import json
+import logging
+from pathlib import Path
+from platformdirs import user_config_dir
+import pleiades_aligner
+from pleiades_aligner.service import AlignmentService, make_server
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG_FILE_PATH = str(
+    Path(user_config_dir("pleiades_aligner", "isaw_nyu")) / "default.config"
+)
+
+DEFAULT_LOG_LEVEL = logging.WARNING
+OPTIONAL_ARGUMENTS = [
+    [
+        "-l",
+        "--loglevel",
+        "NOTSET",
+        "desired logging level ("
+        + "case-insensitive string: DEBUG, INFO, WARNING, or ERROR",
+        False,
+    ],
+    ["-v", "--verbose", False, "verbose output (logging level == INFO)", False],
+    [
+        "-w",
+        "--veryverbose",
+        False,
+        "very verbose output (logging level == DEBUG)",
+        False,
+    ],
+    [
+        "-c",
+        "--config",
+        DEFAULT_CONFIG_FILE_PATH,
+        "path to config file (for alignment_modes, proximity_categories, and "
+        + "secondary_modes)",
+        False,
+    ],
+    ["-H", "--host", "127.0.0.1", "address on which to listen", False],
+    ["-p", "--port", "8765", "port on which to listen", False],
+    [
+        "-u",
+        "--socket",
+        "",
+        "path to a Unix domain socket on which to listen instead of host and port",
+        False,
+    ],
+]
+POSITIONAL_ARGUMENTS = [
+    # each row is a list with 3 elements: name, type, help
+    ["state", str, "path to a snapshot saved by align.py --save-state"],
+]
+
+
+def main(**kwargs):
+    """
+    main function
+    """
+    config_file_path = Path(kwargs["config"].strip()).expanduser().resolve()
+    with open(config_file_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    del f
+
+    state_path = Path(kwargs["state"]).expanduser().resolve()
+    aligner = pleiades_aligner.Aligner.load(state_path)
+    if aligner.shard:
+        raise ValueError(
+            f"{state_path} holds only one shard of the places: merge the snapshots "
+            + "of every shard with merge.py first"
+        )
+    for k, v in config["secondary_modes"].items():
+        aligner.align(modes=[k,], apply_to_modes=v)
+    service = AlignmentService(aligner, config)
+    socket_path = None
+    if kwargs["socket"]:
+        socket_path = Path(kwargs["socket"]).expanduser().resolve()
+    server = make_server(service, kwargs["host"], int(kwargs["port"]), socket_path)
+    logger.info(f"Serving {len(aligner.alignments)} alignments at {socket_path or (kwargs['host'] + ':' + kwargs['port'])}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path is not None:
+            socket_path.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main(
+        **configure_commandline(
+            OPTIONAL_ARGUMENTS, POSITIONAL_ARGUMENTS, DEFAULT_LOG_LEVEL
+        )
+    )
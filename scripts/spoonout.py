@@ -9,9 +9,9 @@ change me
 """
 
 from airtight.cli import configure_commandline
-import json
 import logging
 from pathlib import Path
+from pleiades_aligner.review import GroupIndex, ReviewLog
 from slugify import slugify
 
 logger = logging.getLogger(__name__)
@@ -34,6 +34,13 @@ OPTIONAL_ARGUMENTS = [
         "very verbose output (logging level == DEBUG)",
         False,
     ],
+    [
+        "-r",
+        "--restart",
+        False,
+        "start again from the first group (groups already decided are still skipped)",
+        False,
+    ],
 ]
 POSITIONAL_ARGUMENTS = [
     # each row is a list with 3 elements: name, type, help
@@ -57,55 +64,63 @@ def main(**kwargs):
     """
     # logger = logging.getLogger(sys._getframe().f_code.co_name)
     whence = Path(kwargs["aligned_places_file"]).expanduser().resolve()
-    with open(whence, "r", encoding="utf-8") as f:
-        aligned_places = json.load(f)
-    del f
+    index = GroupIndex(whence)
+    review = ReviewLog(whence)
+    if index.rebuilt or kwargs["restart"]:
+        # positions in a new or changed output mean nothing; decided groups are still skipped
+        review.cursor = 0
     w = 78
-    for category, place_groups in aligned_places.items():
-        for place_group in place_groups:
-            print("\n" + "=" * w)
-            print(f"category {category}")
-            output_pleiades(place_group["pleiades"])
-            others = list()
-            for ns, places in place_group.items():
-                if ns == "pleiades":
-                    continue
-                for pid, place in places.items():
-                    place["pid"] = pid
-                    place["namespace"] = ns
-                    others.append(place)
-            others.sort(key=lambda p: len(p["modes"]), reverse=True)
-            for place in others:
-                print("-" * w)
-                print(f"{place['namespace']}:{place['pid']}")
-                print(f"modes: {', '.join(place['modes'])}")
-                if "assertion" in place["modes"] or "inference" in place["modes"]:
-                    print(f"authorities: {', '.join(place['authorities'])}")
-                try:
-                    print(f"{place['title']}")
-                except KeyError:
-                    pass
-                try:
-                    print(f"{place['uri']}")
-                except KeyError:
-                    pass
-                try:
-                    print(
-                        f"names: {', '.join(sorted(place['names'], key=lambda n: slugify(n)))}"
-                    )
-                except KeyError:
-                    pass
-                try:
-                    d = place["centroid_distance_m"]
-                except KeyError:
-                    pass
-                else:
-                    print(f"centroid distance: {d}")
+    for position in range(review.cursor, len(index)):
+        category, group_id = index.entry(position)
+        if review.is_decided(group_id):
+            continue
+        category, group_id, place_group = index[position]
+        print("\n" + "=" * w)
+        print(f"category {category}")
+        output_pleiades(place_group["pleiades"])
+        others = list()
+        for ns, places in place_group.items():
+            if ns == "pleiades":
+                continue
+            for pid, place in places.items():
+                place["pid"] = pid
+                place["namespace"] = ns
+                others.append(place)
+        others.sort(key=lambda p: len(p["modes"]), reverse=True)
+        for place in others:
+            print("-" * w)
+            print(f"{place['namespace']}:{place['pid']}")
+            print(f"modes: {', '.join(place['modes'])}")
+            if "assertion" in place["modes"] or "inference" in place["modes"]:
+                print(f"authorities: {', '.join(place['authorities'])}")
+            try:
+                print(f"{place['title']}")
+            except KeyError:
+                pass
+            try:
+                print(f"{place['uri']}")
+            except KeyError:
+                pass
+            try:
+                print(
+                    f"names: {', '.join(sorted(place['names'], key=lambda n: slugify(n)))}"
+                )
+            except KeyError:
+                pass
+            try:
+                d = place["centroid_distance_m"]
+            except KeyError:
+                pass
+            else:
+                print(f"centroid distance: {d}")
 
-            s = input("press <ENTER> for next place group").strip()
-            if s:
-                if s[0].lower() == "q":
-                    exit()
+        s = input("press <ENTER> for next place group").strip()
+        if s:
+            if s[0].lower() == "q":
+                exit()
+            # anything else entered is recorded as the decision on this group
+            review.decide(group_id, s)
+        review.cursor = position + 1
 
 
 if __name__ == "__main__":
@@ -10,10 +10,10 @@ change me
 
 from airtight.cli import configure_commandline
 from colorama import Fore, Back, Style
-import json
 import logging
 import math
 from pathlib import Path
+from pleiades_aligner.review import GroupIndex, ReviewLog
 from slugify import slugify
 
 logger = logging.getLogger(__name__)
@@ -36,13 +36,20 @@ OPTIONAL_ARGUMENTS = [
         "very verbose output (logging level == DEBUG)",
         False,
     ],
+    [
+        "-r",
+        "--restart",
+        False,
+        "start again from the first group (groups already decided are still skipped)",
+        False,
+    ],
 ]
 POSITIONAL_ARGUMENTS = [
     # each row is a list with 3 elements: name, type, help
     [
         "aligned_places_file",
         str,
-        "path to aligned places json file as output by prioritize.py",
+        "path to aligned places file as output by prioritize2.py or prioritize3.py (JSON, or JSON Lines with --stream)",
     ]
 ]
 
@@ -100,30 +107,41 @@ def main(**kwargs):
     """
     # logger = logging.getLogger(sys._getframe().f_code.co_name)
     whence = Path(kwargs["aligned_places_file"]).expanduser().resolve()
-    with open(whence, "r", encoding="utf-8") as f:
-        categorized_aligments = json.load(f)
-    del f
+    index = GroupIndex(whence)
+    review = ReviewLog(whence)
+    if index.rebuilt or kwargs["restart"]:
+        # positions in a new or changed output mean nothing; decided groups are still skipped
+        review.cursor = 0
+    logger.info(
+        f"{len(index)} place groups, {len(review.decisions)} decided, resuming at {review.cursor}"
+    )
 
-    for cat, aligned_places in categorized_aligments.items():
-        for pleiades_id, pleiades_data in aligned_places.items():
-            wipe_terminal()
-            print(
-                Fore.RED
-                + Style.BRIGHT
-                + f"CATEGORY {cat}\n"
-                + "-" * 78
-                + Style.NORMAL
-                + Fore.RESET
-            )
-            output_place(pleiades_id, pleiades_data[pleiades_id])
-            for other_id, other_data in pleiades_data.items():
-                if other_id == pleiades_id:
-                    continue
-                output_place(other_id, other_data)
-            s = input("> ").strip()
-            if s:
-                if s[0].lower() == "q":
-                    exit()
+    for position in range(review.cursor, len(index)):
+        cat, pleiades_id = index.entry(position)
+        if review.is_decided(pleiades_id):
+            continue
+        cat, pleiades_id, pleiades_data = index[position]
+        wipe_terminal()
+        print(
+            Fore.RED
+            + Style.BRIGHT
+            + f"CATEGORY {cat}\n"
+            + "-" * 78
+            + Style.NORMAL
+            + Fore.RESET
+        )
+        output_place(pleiades_id, pleiades_data[pleiades_id])
+        for other_id, other_data in pleiades_data.items():
+            if other_id == pleiades_id:
+                continue
+            output_place(other_id, other_data)
+        s = input("> ").strip()
+        if s:
+            if s[0].lower() == "q":
+                exit()
+            # anything else entered is recorded as the decision on this group
+            review.decide(pleiades_id, s)
+        review.cursor = position + 1
 
 
 if __name__ == "__main__":
@@ -14,3 +14,6 @@ from pleiades_aligner.chronique import IngesterChronique
 from pleiades_aligner.manto import IngesterMANTO
 from pleiades_aligner.pleiades import IngesterPleiades
 from pleiades_aligner.topostext import IngesterTopostext
+from pleiades_aligner.report import ReportWriter
+from pleiades_aligner.store import AlignmentStore
+from pleiades_aligner.stats import Stats
@@ -10,15 +10,36 @@ Define the aligner class
 """
 from copy import deepcopy
 import functools
+import gzip
+import hashlib
 from haversine import haversine, Unit
 from logging import getLogger
+from pathlib import Path
+import pickle
 from pleiades_aligner.dataset import Place
+from pleiades_aligner.planner import PipelinePlan
+from pleiades_aligner.stats import Stats
+from pleiades_aligner.store import alignment_key, AlignmentStore
 from pprint import pformat
 from shapely import distance as shapely_distance
 from textnorm import normalize_space, normalize_unicode
+import zlib
 
+SNAPSHOT_FORMAT = 4  # increment whenever saved Aligner state changes shape
+PLACE_MODES = ["assertions", "proximity", "toponymy", "typology"]  # see align_place()
 
-@functools.cache
+
+def _corpus_digest(fingerprints: dict) -> str:
+    """Return a digest of place fingerprints by namespace and id, whatever their order"""
+    content = sorted(
+        (ns, pid, fp) for ns, fps in fingerprints.items() for pid, fp in fps.items()
+    )
+    return hashlib.blake2b(repr(content).encode("utf-8"), digest_size=16).hexdigest()
+
+
+# bounded, and cleared after each batch of proximity alignments, so that a long-lived aligner
+# (e.g. one serving single-place queries) does not keep every geometry it has compared
+@functools.lru_cache(maxsize=65536)
 def distance(a, b):
     return shapely_distance(a, b)
 
@@ -163,10 +184,18 @@ class Aligner:
             "assertion": set(),
             "proximity": set(),
         }
+        self._fingerprints = (
+            dict()
+        )  # place fingerprints by namespace, as of the last save
+        self.stats = Stats()  # timing, memory, and counts by stage
+        self.shard = None  # (index, count) if aligning only one shard of the places
+        self._shard_bins = dict()  # shard index by bin bounds
+        self._corpus = None  # digest of all ingested places, if aligning only one shard
 
     def align(self, modes: list, **kwargs):
         for mode in modes:
-            getattr(self, f"_align_{mode}")(**kwargs)
+            with self.stats.stage(f"align {mode}"):
+                getattr(self, f"_align_{mode}")(**kwargs)
 
     def alignments_by_mode(self, mode: str) -> list:
         return [
@@ -195,13 +224,409 @@ class Aligner:
             for ahash in self._alignment_hashes_by_id_namespace[namespace]
         ]
 
+    def save(self, path: Path):
+        """
+        Save a snapshot of ingested datasets and alignments to a compressed binary file
+        Alignment indexes are keyed by hashes that differ between Python processes, so they
+        are rebuilt from the saved alignments on load rather than saved themselves
+        """
+        state = {
+            "format": SNAPSHOT_FORMAT,
+            "ingesters": self.ingesters,
+            "data_sources": self.data_sources,
+            "redirects": self.redirects,
+            "alignments": list(self.alignments.values()),
+            "fingerprints": self.fingerprints(),
+            "shard": self.shard,
+            "corpus": self._corpus,
+        }
+        with gzip.open(path, "wb", compresslevel=6) as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.logger.info(f"Saved {len(self.alignments)} alignments to {path}")
+
+    @classmethod
+    def load(cls, path: Path) -> "Aligner":
+        """Create an aligner from a snapshot file written by Aligner.save()"""
+        with gzip.open(path, "rb") as f:
+            state = pickle.load(f)
+        if state["format"] != SNAPSHOT_FORMAT:
+            raise ValueError(
+                f"Expected snapshot format {SNAPSHOT_FORMAT}, but {path} has format {state['format']}"
+            )
+        aligner = cls(state["ingesters"], state["data_sources"], state["redirects"])
+        aligner._fingerprints = state["fingerprints"]
+        aligner.shard = state["shard"]
+        aligner._corpus = state["corpus"]
+        aligner.set_alignments(state["alignments"])
+        aligner.logger.info(f"Loaded {len(aligner.alignments)} alignments from {path}")
+        return aligner
+
+    def set_alignments(self, alignments: list):
+        """Replace all alignments with those in a list (e.g. saved earlier), rebuilding indexes"""
+        self.alignments = dict()
+        self._alignment_hashes_by_id_namespace = dict()
+        self._alignment_hashes_by_authority_namespace = dict()
+        self._alignment_hashes_by_full_id = dict()
+        self._alignment_hashes_by_mode = {
+            "inference": set(),
+            "assertion": set(),
+            "proximity": set(),
+        }
+        for alignment in alignments:
+            ahash = hash(alignment)
+            self.alignments[ahash] = alignment
+            self._index_alignment(ahash, alignment)
+
+    @classmethod
+    def merge(cls, paths: list) -> "Aligner":
+        """
+        Create an aligner from the snapshots of every shard of a sharded run (see set_shard())
+        The places of every shard are gathered again, and alignments found by more than one
+        shard are combined, as they are when found twice in one run, and registered in
+        alignment key order. The merged alignments are the same set as those of a run without
+        shards, whatever the order of paths, but not necessarily in the same order, and their
+        distances may differ in the last bits (compare them with a tolerance, as diff.py does).
+        Snapshots are loaded one at a time, so at most one shard is in memory besides the
+        merged places and alignments.
+        """
+        shards = set()
+        alignments = list()
+        aligner = None
+        for path in paths:
+            shard = cls.load(path)
+            if shard.shard is None:
+                raise ValueError(f"{path} is not a snapshot of a shard")
+            index, count = shard.shard
+            if aligner is None:
+                aligner = cls(shard.ingesters, shard.data_sources, shard.redirects)
+                aligner._fingerprints = shard._fingerprints
+                shard_count = count
+                corpus = shard._corpus
+            elif count != shard_count:
+                raise ValueError(
+                    f"Expected a shard of {shard_count}, but {path} is shard {index}/{count}"
+                )
+            elif shard._corpus != corpus:
+                raise ValueError(f"{path} was aligned against different data")
+            if index in shards:
+                raise ValueError(f"Shard {index}/{count} is given more than once")
+            if shards:
+                for namespace, ingester in shard.ingesters.items():
+                    for place in ingester.data.places:
+                        aligner.ingesters[namespace].data.add_place(place)
+                    aligner._fingerprints[namespace].update(
+                        shard._fingerprints[namespace]
+                    )
+            shards.add(index)
+            alignments.extend(shard.alignments.values())
+            del shard
+        if aligner is None:
+            raise ValueError("No shard snapshots to merge")
+        missing = set(range(1, shard_count + 1)) - shards
+        if missing:
+            raise ValueError(
+                f"Missing shards {', '.join([f'{i}/{shard_count}' for i in sorted(missing)])}"
+            )
+        if _corpus_digest(aligner._fingerprints) != corpus:
+            raise ValueError(
+                "The shards do not hold every place they were aligned against"
+            )
+        for alignment in sorted(alignments, key=alignment_key):
+            aligner._register_alignment(alignment)
+        aligner.logger.info(
+            f"Merged {len(alignments)} alignments from {shard_count} shards into {len(aligner.alignments)}"
+        )
+        return aligner
+
+    def set_shard(self, index: int, count: int):
+        """
+        Align only shard index (1 to count) of the ingested places from now on
+        Places are partitioned by proximity bin (the whole-degree box around each footprint):
+        bins, in order of their bounds, are split into count contiguous runs of similar
+        proximity cost (the square of the places in each bin), and unlocated places are
+        spread across shards by a checksum of their full ids. A shard drops the ingested
+        places it does not hold, so that its alignment and snapshot need only its share of
+        memory, and registers the assertions of its places and the proximity alignments
+        within its bins. Proximity candidates always share a bin, so no pair straddles two
+        shards, and no neighbouring bins need be kept: merging the snapshots of every shard
+        with merge() yields the same set of alignments as a run without shards.
+        """
+        if not 1 <= index <= count:
+            raise ValueError(f"Expected a shard from 1 to {count}, but got {index}")
+        sizes = dict()
+        for ingester in self.ingesters.values():
+            for place in ingester.data:
+                if place.bin:
+                    bounds = place.bin.bounds
+                    sizes[bounds] = sizes.get(bounds, 0) + 1
+        total = sum([n * n for n in sizes.values()])
+        self._shard_bins = dict()
+        cost = 0
+        for bounds in sorted(sizes):
+            n = sizes[bounds] * sizes[bounds]
+            # the shard in which the midpoint of this bin's cost falls
+            self._shard_bins[bounds] = 1 + min(
+                count - 1, int(count * (cost + n / 2) / total)
+            )
+            cost += n
+        self.shard = (index, count)
+        # taken before other shards' places are dropped, so that merge() can check that the
+        # shards were aligned against the same data and that together they hold all of it
+        self._corpus = _corpus_digest(self.fingerprints())
+        for ingester in self.ingesters.values():
+            ingester.data.places = [
+                p
+                for full_id, p in ingester.data.iter_full_ids()
+                if self._in_shard(full_id, p)
+            ]
+        self.logger.info(
+            f"Aligning shard {index}/{count}: {len([i for i in self._shard_bins.values() if i == index])} of {len(sizes)} bins"
+        )
+
+    def _in_shard(self, full_id: str, place: Place) -> bool:
+        if self.shard is None:
+            return True
+        index, count = self.shard
+        if place.bin:
+            return self._shard_bins[place.bin.bounds] == index
+        return 1 + zlib.crc32(full_id.encode("utf-8")) % count == index
+
+    def fingerprints(self) -> dict:
+        """Return the content fingerprints of all ingested places, by namespace and id"""
+        return {ns: i.data.fingerprints() for ns, i in self.ingesters.items()}
+
+    def update(
+        self,
+        ingesters: dict,
+        modes: list,
+        proximity_categories: dict = dict(),
+        secondary_modes: dict = dict(),
+    ) -> dict:
+        """
+        Replace ingested data with a fresh ingest and re-align only the places that changed
+        Places are compared by fingerprint with those saved in the snapshot this aligner was
+        loaded from. Every alignment involving an added, removed, or changed place is dropped,
+        then the primary modes are run again for those places alone (proximity candidates
+        come from a spatial query rather than a full pass over the bins), followed by the
+        secondary modes ({mode: apply_to_modes}) for the alignments so re-registered.
+        Alignments between unchanged places are kept as they were. Inference should be run
+        afterwards, as for a full alignment.
+        Returns lists of added, removed, and changed ids, by namespace
+        """
+        fingerprints = {ns: i.data.fingerprints() for ns, i in ingesters.items()}
+        changes = dict()
+        affected = set()
+        for ns in sorted(set(self._fingerprints) | set(fingerprints)):
+            old = self._fingerprints.get(ns, dict())
+            new = fingerprints.get(ns, dict())
+            changes[ns] = {
+                "added": sorted(new.keys() - old.keys()),
+                "removed": sorted(old.keys() - new.keys()),
+                "changed": sorted(
+                    pid for pid in new.keys() & old.keys() if new[pid] != old[pid]
+                ),
+            }
+            for pids in changes[ns].values():
+                affected.update([":".join((ns, pid)) for pid in pids])
+            self.logger.info(
+                f"Namespace '{ns}': "
+                + ", ".join([f"{len(v)} {k}" for k, v in changes[ns].items()])
+            )
+        self.ingesters = ingesters
+        self._fingerprints = fingerprints
+        self.realign(affected, modes, proximity_categories, secondary_modes)
+        return changes
+
+    def realign(
+        self,
+        full_ids: set,
+        modes: list,
+        proximity_categories: dict = dict(),
+        secondary_modes: dict = dict(),
+    ) -> set:
+        """
+        Re-align only the places with full_ids, after they were added, removed, or changed in
+        the ingested data, and return the hashes of the alignments registered for them
+        Every alignment involving those places is dropped. Assertions are registered again
+        from their own alignments and from those dropped that other places asserted; then
+        proximity candidates come from a spatial query, and secondary modes are applied to
+        what was registered. Inferences involving those places are not restored.
+        """
+        asserted_by_others = set()
+        for full_id in full_ids:
+            for ahash in list(self._alignment_hashes_by_full_id.get(full_id, set())):
+                alignment = self.alignments[ahash]
+                if "assertion" in alignment.modes:
+                    for authority in alignment.authorities:
+                        if (
+                            authority in full_ids
+                            or authority not in alignment.aligned_ids
+                        ):
+                            continue
+                        target_id = [i for i in alignment.aligned_ids if i != authority]
+                        asserted_by_others.add((authority, target_id[0]))
+                self._unregister_alignment(ahash)
+        if "assertions" in modes:
+            with self.stats.stage("update assertions", items_in=len(full_ids)):
+                for authority, target_id in sorted(asserted_by_others):
+                    self.stats.count("items_out")
+                    self._register_alignment(
+                        Alignment(
+                            authority, target_id, authority=authority, mode="assertion"
+                        )
+                    )
+                for full_id in sorted(full_ids):
+                    place = self._get_place(full_id)
+                    if place is None:
+                        continue
+                    for target_id in place.alignments:
+                        self.stats.count("items_out")
+                        self._register_alignment(
+                            Alignment(
+                                full_id, target_id, authority=full_id, mode="assertion"
+                            )
+                        )
+        if "proximity" in modes:
+            with self.stats.stage("update proximity", items_in=len(full_ids)):
+                self._align_proximity_incremental(full_ids, proximity_categories)
+        realigned = set()
+        for full_id in full_ids:
+            realigned.update(self._alignment_hashes_by_full_id.get(full_id, set()))
+        for mode, apply_to_modes in secondary_modes.items():
+            with self.stats.stage(f"update {mode}"):
+                getattr(self, f"_align_{mode}")(
+                    apply_to_modes=apply_to_modes, hashes=realigned
+                )
+        self.logger.info(
+            f"Re-aligned {len(full_ids)} changed places in {len(realigned)} alignments"
+        )
+        return realigned
+
+    def align_place(
+        self,
+        place: Place,
+        namespace: str = None,
+        modes: list = PLACE_MODES,
+        proximity_categories: dict = dict(),
+        apply_to_modes: dict = dict(),
+        register: bool = False,
+    ) -> list:
+        """
+        Return the alignments one place, new or edited, has with the ingested places of other
+        namespaces by each of modes: assertions (its own, and those other places make about
+        its id), proximity, and the secondary modes toponymy and typology, which apply to the
+        alignments of the modes in apply_to_modes ({mode: modes}, by default assertion and
+        proximity). Candidates come from the full-id and spatial indexes, so a place costs
+        O(log n + k) for k candidates rather than a pass over the bins.
+        Nothing is registered unless register is True, in which case the place is ingested
+        into its namespace (replacing any place with its id) and re-aligned by realign().
+        That drops every alignment of the place, so modes must then include assertions and
+        proximity (with proximity_categories) for none to be lost.
+        namespace defaults to that of the dataset holding the place, if any.
+        """
+        if namespace is None:
+            if place._dataset is None:
+                raise ValueError(f"Expected a namespace for place {place.id}")
+            namespace = place._dataset.namespace
+        unsupported = set(modes) - set(PLACE_MODES)
+        if unsupported:
+            raise ValueError(
+                f"Expected modes from {PLACE_MODES}, but got {sorted(unsupported)}"
+            )
+        secondary_modes = {
+            mode: apply_to_modes.get(mode, ["assertion", "proximity"])
+            for mode in modes
+            if mode in ("toponymy", "typology")
+        }
+        full_id = ":".join((namespace, place.id))
+        if register:
+            if (
+                not {"assertions", "proximity"}.issubset(modes)
+                or not proximity_categories
+            ):
+                raise ValueError(
+                    "Expected modes to include assertions and proximity, and "
+                    + f"proximity_categories, to register place {full_id}"
+                )
+            self.ingesters[namespace].data.add_place(place)
+            realigned = self.realign(
+                {full_id},
+                [mode for mode in modes if mode not in secondary_modes],
+                proximity_categories,
+                secondary_modes,
+            )
+            return [self.alignments[ahash] for ahash in realigned]
+
+        alignments = dict()
+
+        def add(alignment: Alignment):
+            ahash = hash(alignment)
+            try:
+                alignments[ahash] = self._merge_alignment(alignments[ahash], alignment)
+            except KeyError:
+                alignments[ahash] = alignment
+
+        if "assertions" in modes:
+            for ahash in self._alignment_hashes_by_full_id.get(full_id, set()):
+                alignment = self.alignments[ahash]
+                if "assertion" not in alignment.modes:
+                    continue
+                for authority in alignment.authorities:
+                    if authority != full_id and authority in alignment.aligned_ids:
+                        add(
+                            Alignment(
+                                authority,
+                                full_id,
+                                authority=authority,
+                                mode="assertion",
+                            )
+                        )
+            for target_id in place.alignments:
+                add(Alignment(full_id, target_id, authority=full_id, mode="assertion"))
+        if "proximity" in modes and place.bin and proximity_categories:
+            threshold = max([params[1] for params in proximity_categories.values()])
+            for place_b_namespace, place_b in self._proximity_candidates(
+                namespace, place, threshold
+            ):
+                alignment = self._proximity_alignment(
+                    namespace, place, place_b_namespace, place_b, proximity_categories
+                )
+                if alignment is not None:
+                    add(alignment)
+        matches = {"toponymy": self._common_names, "typology": self._common_types}
+        for mode, modes_applied_to in secondary_modes.items():
+            for alignment in alignments.values():
+                if not alignment.modes.intersection(modes_applied_to):
+                    continue
+                other_id = [i for i in alignment.aligned_ids if i != full_id][0]
+                other = self._get_place(other_id)
+                if other is not None and matches[mode](place, other):
+                    alignment.add_mode(mode)
+        return list(alignments.values())
+
+    def _get_place(self, full_id: str) -> Place:
+        """Return the ingested place with full_id, or None if there is none"""
+        ns, rawid = full_id.split(":", 1)
+        try:
+            return self.ingesters[ns].data.get_place_by_id(rawid)
+        except KeyError:
+            return None
+
+    def persist(self, path: Path) -> AlignmentStore:
+        """Save alignments and ingested places to a SQLite alignment store at path"""
+        store = AlignmentStore(path)
+        store.save(self)
+        return store
+
     def _align_assertions(self, **kwargs):
         """Record all alignments asserted in ingested data items"""
         self.logger.info("Performing assertion alignments")
         self._alignment_hashes_by_mode["assertion"] = set()
-        for namespace, ingester in self.ingesters.items():
-            for place in ingester.data.places:
-                full_place_id = ":".join((namespace, place.id))
+        for ingester in self.ingesters.values():
+            self.stats.count("items_in", len(ingester.data))
+            for full_place_id, place in ingester.data.iter_full_ids():
+                if not self._in_shard(full_place_id, place):
+                    continue
                 for target_id in place.alignments:
                     alignment = Alignment(
                         full_place_id,
@@ -210,6 +635,7 @@ class Aligner:
                         mode="assertion",
                     )
                     self._register_alignment(alignment)
+        self.stats.count("items_out", len(self._alignment_hashes_by_mode["assertion"]))
 
     def _register_alignment(self, alignment: Alignment):
         this_alignment = alignment
@@ -220,28 +646,49 @@ class Aligner:
             self.alignments[ahash] = this_alignment
         else:
             # alignment already noted
-            prior_alignment = self.alignments[ahash]
-            this_alignment = deepcopy(prior_alignment)
-            for authority_id in alignment.authorities:
-                this_alignment.add_authority(authority_id)
-            for mode in alignment.modes:
-                this_alignment.add_mode(mode)
-            if "proximity" in alignment.modes:
-                for prox_class in alignment.proximity:
-                    this_alignment.add_proximity(prox_class)
-                try:
-                    this_alignment.centroid_distance_dd = alignment.centroid_distance_dd
-                except AttributeError:
-                    self.logger.error(pformat(alignment.asdict(), indent=4))
-                    self.logger.error(pformat(prior_alignment.asdict(), indent=4))
-                    raise
-                this_alignment.centroid_distance_m = alignment.centroid_distance_m
-
+            this_alignment = self._merge_alignment(self.alignments[ahash], alignment)
             self.alignments[ahash] = this_alignment
 
-        # populate indexes
+        self._index_alignment(ahash, this_alignment)
+
+    def _merge_alignment(
+        self, prior_alignment: Alignment, alignment: Alignment
+    ) -> Alignment:
+        """Return a copy of prior_alignment with the modes and authorities of alignment"""
+        this_alignment = deepcopy(prior_alignment)
+        for authority_id in alignment.authorities:
+            this_alignment.add_authority(authority_id)
+        for mode in alignment.modes:
+            this_alignment.add_mode(mode)
+        if "proximity" in alignment.modes:
+            for prox_class in alignment.proximity:
+                this_alignment.add_proximity(prox_class)
+            try:
+                this_alignment.centroid_distance_dd = alignment.centroid_distance_dd
+            except AttributeError:
+                self.logger.error(pformat(alignment.asdict(), indent=4))
+                self.logger.error(pformat(prior_alignment.asdict(), indent=4))
+                raise
+            this_alignment.centroid_distance_m = alignment.centroid_distance_m
+        return this_alignment
+
+    def _unregister_alignment(self, ahash: int):
+        alignment = self.alignments.pop(ahash)
+        for index, keys in [
+            (self._alignment_hashes_by_mode, alignment.modes),
+            (self._alignment_hashes_by_full_id, alignment.aligned_ids),
+            (
+                self._alignment_hashes_by_authority_namespace,
+                alignment.authority_namespaces,
+            ),
+            (self._alignment_hashes_by_id_namespace, alignment.id_namespaces),
+        ]:
+            for k in keys:
+                index[k].discard(ahash)
+
+    def _index_alignment(self, ahash: int, this_alignment: Alignment):
         for mode in this_alignment.modes:
-            self._alignment_hashes_by_mode[mode].add(ahash)
+            self._index_mode(ahash, mode)
         for id in this_alignment.aligned_ids:
             try:
                 self._alignment_hashes_by_full_id[id]
@@ -264,15 +711,34 @@ class Aligner:
             finally:
                 self._alignment_hashes_by_id_namespace[ns].add(ahash)
 
-    def _align_proximity(self, proximity_categories: dict, **kwargs):
-        """Compare all ingested places to find possible associations by proximity"""
+    def _index_mode(self, ahash: int, mode: str):
+        try:
+            self._alignment_hashes_by_mode[mode]
+        except KeyError:
+            self._alignment_hashes_by_mode[mode] = set()
+        finally:
+            self._alignment_hashes_by_mode[mode].add(ahash)
+
+    def _align_proximity(
+        self, proximity_categories: dict, plan: PipelinePlan = None, **kwargs
+    ):
+        """
+        Compare all ingested places to find possible associations by proximity
+        Pairs that the tests of plan, if any, discard are not compared exactly
+        """
         self.logger.info("Performing proximity alignments")
         self._alignment_hashes_by_mode["proximity"] = set()
         # sort all places into geometric bins
         bins = dict()
         for ingester in self.ingesters.values():
-            for place in ingester.data.places:
+            self.stats.count("items_in", len(ingester.data))
+            for place in ingester.data:
                 if place.bin:
+                    if (
+                        self.shard
+                        and self._shard_bins[place.bin.bounds] != self.shard[0]
+                    ):
+                        continue
                     try:
                         bins[place.bin]
                     except KeyError:
@@ -280,38 +746,190 @@ class Aligner:
                     finally:
                         bins[place.bin].add((ingester.data.namespace, place))
 
+        if plan is not None:
+            # margin for rounding, so that no pair within the threshold is discarded
+            threshold = max([params[1] for params in proximity_categories.values()])
+            limit = threshold * (1.0 + 1e-9) + 1e-12
+            namespaces = list(self.ingesters.keys())
+            rules = {
+                (ns_a, ns_b): plan.rules(ns_a, ns_b)
+                for ns_a in namespaces
+                for ns_b in namespaces
+            }
+            bounds, names, types = self._prefilter_keys(bins, rules)
+
+        candidates = 0
+        progress = self.stats.progress(sum([len(v) for v in bins.values()]))
         for geom, places_info in bins.items():
             for place_a_namespace, place_a in places_info:
+                progress.update()
                 for place_b_namespace, place_b in places_info:
                     if place_a_namespace == place_b_namespace:
                         continue
-                    alignment = None
-                    for cat_name, cat_params in proximity_categories.items():
-                        attr_name = cat_params[0]
-                        val_a = getattr(place_a, attr_name)
-                        val_b = getattr(place_b, attr_name)
-                        threshold = cat_params[1]
-                        d = distance(val_a, val_b)
-                        if d <= threshold:
-                            place_a_full_id = ":".join((place_a_namespace, place_a.id))
-                            place_b_full_id = ":".join((place_b_namespace, place_b.id))
-                            if attr_name != "centroid":
-                                d = distance(
-                                    getattr(place_a, "centroid"),
-                                    getattr(place_b, "centroid"),
-                                )
-                            alignment = Alignment(
-                                place_a_full_id,
-                                place_b_full_id,
-                                mode="proximity",
-                                proximity=cat_name,
-                                centroid_distance_dd=d,
-                                centroid_distance_m=self._d_centroid_meters(
-                                    place_a, place_b
-                                ),
-                            )
-                            self._register_alignment(alignment)
-                            break
+                    if plan is not None:
+                        skip, share_names, share_types = rules[
+                            (place_a_namespace, place_b_namespace)
+                        ]
+                        if skip:
+                            continue
+                        a = bounds[place_a]
+                        b = bounds[place_b]
+                        if (
+                            a[0] - b[2] > limit
+                            or b[0] - a[2] > limit
+                            or a[1] - b[3] > limit
+                            or b[1] - a[3] > limit
+                        ):
+                            continue
+                        if share_names and names[place_a].isdisjoint(names[place_b]):
+                            continue
+                        if share_types and not types[place_a] & types[place_b]:
+                            continue
+                    candidates += 1
+                    self._align_proximity_pair(
+                        place_a_namespace,
+                        place_a,
+                        place_b_namespace,
+                        place_b,
+                        proximity_categories,
+                    )
+        progress.finish()
+        distance.cache_clear()
+        self.stats.count("candidates", candidates)
+        self.stats.count("items_out", len(self._alignment_hashes_by_mode["proximity"]))
+
+    def _align_proximity_pair(
+        self,
+        place_a_namespace: str,
+        place_a: Place,
+        place_b_namespace: str,
+        place_b: Place,
+        proximity_categories: dict,
+    ):
+        """Register a proximity alignment in the first category whose threshold the places meet"""
+        alignment = self._proximity_alignment(
+            place_a_namespace, place_a, place_b_namespace, place_b, proximity_categories
+        )
+        if alignment is not None:
+            self._register_alignment(alignment)
+
+    def _prefilter_keys(self, bins: dict, rules: dict) -> tuple:
+        """
+        Return the footprint bounds of every binned place and, as the rules of a plan need
+        them, their normalized names and feature type bitmasks, computed once per place
+        """
+        need_names = any([r[1] for r in rules.values()])
+        need_types = any([r[2] for r in rules.values()])
+        bounds = dict()
+        names = dict()
+        types = dict()
+        bits = dict()
+        for places_info in bins.values():
+            for namespace, place in places_info:
+                bounds[place] = place.footprint.bounds
+                if need_names:
+                    names[place] = self._name_keys(place)
+                if need_types:
+                    mask = 0
+                    for t in place.feature_types:
+                        try:
+                            mask |= bits[t]
+                        except KeyError:
+                            bits[t] = 1 << len(bits)
+                            mask |= bits[t]
+                    types[place] = mask
+        return bounds, names, types
+
+    def _proximity_alignment(
+        self,
+        place_a_namespace: str,
+        place_a: Place,
+        place_b_namespace: str,
+        place_b: Place,
+        proximity_categories: dict,
+    ) -> Alignment:
+        """
+        Return a proximity alignment in the first category whose threshold the places meet
+        Each kind of distance (centroid or footprint) is computed at most once
+        """
+        distances = dict()
+
+        def get_distance(attr_name: str) -> float:
+            try:
+                return distances[attr_name]
+            except KeyError:
+                distances[attr_name] = distance(
+                    getattr(place_a, attr_name), getattr(place_b, attr_name)
+                )
+                return distances[attr_name]
+
+        for cat_name, cat_params in proximity_categories.items():
+            attr_name = cat_params[0]
+            threshold = cat_params[1]
+            d = get_distance(attr_name)
+            if d <= threshold:
+                place_a_full_id = ":".join((place_a_namespace, place_a.id))
+                place_b_full_id = ":".join((place_b_namespace, place_b.id))
+                if attr_name != "centroid":
+                    d = get_distance("centroid")
+                return Alignment(
+                    place_a_full_id,
+                    place_b_full_id,
+                    mode="proximity",
+                    proximity=cat_name,
+                    centroid_distance_dd=d,
+                    centroid_distance_m=self._d_centroid_meters(place_a, place_b),
+                )
+        return None
+
+    def _align_proximity_incremental(self, full_ids: set, proximity_categories: dict):
+        """
+        Compare only the places with full_ids to the places of other namespaces in the same
+        bin, using a spatial query for candidates within the widest category threshold
+        (centroids lie within footprints, so footprint distance never exceeds centroid distance)
+        """
+        threshold = max([cat_params[1] for cat_params in proximity_categories.values()])
+        compared = set()
+        progress = self.stats.progress(len(full_ids))
+        for full_id in sorted(full_ids):
+            progress.update()
+            place_a_namespace, rawid = full_id.split(":")
+            try:
+                place_a = self.ingesters[place_a_namespace].data.get_place_by_id(rawid)
+            except KeyError:
+                # removed, or not from an ingested namespace
+                continue
+            if not place_a.bin:
+                continue
+            for place_b_namespace, place_b in self._proximity_candidates(
+                place_a_namespace, place_a, threshold
+            ):
+                pair = frozenset({full_id, ":".join((place_b_namespace, place_b.id))})
+                if pair in compared:
+                    continue
+                compared.add(pair)
+                self.stats.count("candidates")
+                self._align_proximity_pair(
+                    place_a_namespace,
+                    place_a,
+                    place_b_namespace,
+                    place_b,
+                    proximity_categories,
+                )
+        progress.finish()
+        distance.cache_clear()
+
+    def _proximity_candidates(self, namespace: str, place: Place, threshold: float):
+        """
+        Yield (namespace, place) for the places of other namespaces in the same bin as place
+        whose footprints lie within threshold of its footprint, found by spatial query
+        """
+        for place_b_namespace, ingester in self.ingesters.items():
+            if place_b_namespace == namespace:
+                continue
+            for place_b in ingester.data.query_radius(place.footprint, threshold):
+                if place_b.bin == place.bin:
+                    yield place_b_namespace, place_b
 
     def _d_centroid_meters(self, a: Place, b: Place):
         coords_a = list(list(a.centroid.coords)[0])
@@ -320,16 +938,21 @@ class Aligner:
         coords_b.reverse()
         return haversine(coords_a, coords_b, unit=Unit.METERS)
 
-    def _align_toponymy(self, apply_to_modes: list, **kwargs):
+    def _align_toponymy(self, apply_to_modes: list, hashes: set = None, **kwargs):
         self.logger.info(
             f"Performing toponomy alignment checks for alignment modes {apply_to_modes}"
         )
         candidate_hashes = set()
         for m in apply_to_modes:
             candidate_hashes.update(self._alignment_hashes_by_mode[m])
+        if hashes is not None:
+            candidate_hashes.intersection_update(hashes)
+        self.stats.count("items_in", len(candidate_hashes))
         places = dict()
         filtered_hashes = set()
+        progress = self.stats.progress(len(candidate_hashes))
         for chash in candidate_hashes:
+            progress.update()
             c = self.alignments[chash]
             consider = True
             for pid in c.aligned_ids:
@@ -351,31 +974,31 @@ class Aligner:
                 places[pid] = p
             if consider:
                 filtered_hashes.add(chash)
+        progress.finish()
+        self.stats.count("candidates", len(filtered_hashes))
         for chash in filtered_hashes:
             c = self.alignments[chash]
             pid1, pid2 = c.aligned_ids
-            names1 = {
-                normalize_space(normalize_unicode(n)).lower()
-                for n in places[pid1].names
-            }
-            names2 = {
-                normalize_space(normalize_unicode(n)).lower()
-                for n in places[pid2].names
-            }
-            common = names1.intersection(names2)
-            if common:
+            if self._common_names(places[pid1], places[pid2]):
                 self.alignments[chash].add_mode("toponymy")
+                self._index_mode(chash, "toponymy")
+                self.stats.count("items_out")
 
-    def _align_typology(self, apply_to_modes: list, **kwargs):
+    def _align_typology(self, apply_to_modes: list, hashes: set = None, **kwargs):
         self.logger.info(
             f"Performing typology alignment checks for alignment modes {apply_to_modes}"
         )
         candidate_hashes = set()
         for m in apply_to_modes:
             candidate_hashes.update(self._alignment_hashes_by_mode[m])
+        if hashes is not None:
+            candidate_hashes.intersection_update(hashes)
+        self.stats.count("items_in", len(candidate_hashes))
         places = dict()
         filtered_hashes = set()
+        progress = self.stats.progress(len(candidate_hashes))
         for chash in candidate_hashes:
+            progress.update()
             c = self.alignments[chash]
             consider = True
             for pid in c.aligned_ids:
@@ -396,12 +1019,15 @@ class Aligner:
                 places[pid] = p
             if consider:
                 filtered_hashes.add(chash)
+        progress.finish()
+        self.stats.count("candidates", len(filtered_hashes))
         for chash in filtered_hashes:
             c = self.alignments[chash]
             pid1, pid2 = c.aligned_ids
-            common = places[pid1].feature_types.intersection(places[pid2].feature_types)
-            if common:
+            if self._common_types(places[pid1], places[pid2]):
                 self.alignments[chash].add_mode("typology")
+                self._index_mode(chash, "typology")
+                self.stats.count("items_out")
 
     def align_by_inference(
         self,
@@ -414,6 +1040,19 @@ class Aligner:
         self.logger.info(
             f"Inferring alignments between {primary_namespace} and {inference_namespace} based on assertions found in {aligned_namespace} already matched with {primary_namespace}."
         )
+        inferred = self._alignment_hashes_by_mode["inference"]
+        with self.stats.stage(
+            f"infer {primary_namespace} {aligned_namespace} {inference_namespace}"
+        ):
+            before = len(inferred)
+            self._align_by_inference(
+                primary_namespace, aligned_namespace, inference_namespace
+            )
+            self.stats.count("items_out", len(inferred) - before)
+
+    def _align_by_inference(
+        self, primary_namespace: str, aligned_namespace: str, inference_namespace: str
+    ):
         primary_alignments = {
             a
             for a in self.alignments_by_id_namespace(primary_namespace)
@@ -424,7 +1063,10 @@ class Aligner:
             for a in self.alignments_by_id_namespace(inference_namespace)
             if "assertion" in a.modes and aligned_namespace in a.id_namespaces
         }
+        self.stats.count("items_in", len(candidate_alignments))
+        progress = self.stats.progress(len(candidate_alignments))
         for candidate in candidate_alignments:
+            progress.update()
             aligned_id = [
                 f
                 for f in candidate.aligned_ids
@@ -440,6 +1082,7 @@ class Aligner:
             }
             if not these_candidate:
                 continue
+            self.stats.count("candidates", len(these_primary) * len(these_candidate))
             for this_primary in these_primary:
                 primary_id = [
                     f
@@ -456,3 +1099,15 @@ class Aligner:
                         primary_id, inferred_id, "inference", authority=aligned_id
                     )
                     self._register_alignment(new_alignment)
+        progress.finish()
+
+    def _common_names(self, place_a: Place, place_b: Place) -> set:
+        """Return the names (normalized, lower case) two places share"""
+        return self._name_keys(place_a).intersection(self._name_keys(place_b))
+
+    def _name_keys(self, place: Place) -> set:
+        return {normalize_space(normalize_unicode(n)).lower() for n in place.names}
+
+    def _common_types(self, place_a: Place, place_b: Place) -> set:
+        """Return the feature types two places share"""
+        return place_a.feature_types.intersection(place_b.feature_types)
@@ -0,0 +1,244 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Classify alignment records into categories of interest for review
+"""
+ALIGNMENT_MODES = ["assertion", "proximity", "inference", "toponymy", "typology"]
+MODE_BITS = {mode: 1 << i for i, mode in enumerate(ALIGNMENT_MODES)}
+
+# categories used by the prioritize scripts, in order of precedence
+PRIORITY_CRITERIA = {
+    "1": {
+        "modes": {"assertion", "proximity", "toponymy", "typology"},
+        "proximity_types": {"identical", "tight"},
+    },
+    "2": {
+        "modes": {"assertion", "proximity", "toponymy", "typology"},
+        "proximity_types": {"overlapping"},
+    },
+    "3": {
+        "modes": {"assertion", "proximity", "toponymy", "typology"},
+        "proximity_types": {"close"},
+    },
+    "4": {
+        "modes": {"proximity", "toponymy", "typology"},
+        "proximity_types": {"identical", "tight"},
+    },
+    "5": {
+        "modes": {"proximity", "toponymy", "typology"},
+        "proximity_types": {"overlapping"},
+    },
+    "6": {
+        "modes": {"proximity", "toponymy", "typology"},
+        "proximity_types": {"close"},
+    },
+    "7": {
+        "modes": {"assertion", "proximity", "toponymy"},
+        "proximity_types": {"identical", "tight", "overlapping", "close"},
+    },
+    "8": {
+        "modes": {"assertion", "toponymy"},
+        "proximity_types": set(),
+    },
+}
+
+# categories used by prioritize.py for whole places: a place falls in the highest-ranking
+# category met by any of its alignments (or in 6 if none)
+PLACE_CRITERIA = {
+    1: {"modes": {"assertion", "proximity", "toponymy", "typology"}},
+    2: [
+        {"modes": {"assertion", "proximity", "typology"}},
+        {"modes": {"proximity", "toponymy", "typology"}},
+    ],
+    3: {"modes": {"assertion", "proximity", "toponymy"}},
+    4: {"modes": {"proximity", "toponymy"}},
+    5: {"modes": {"proximity"}},
+}
+
+
+def mode_mask(modes) -> int:
+    """Return the bitmask for a collection of alignment modes, or None if any is unknown"""
+    mask = 0
+    for mode in modes:
+        try:
+            mask |= MODE_BITS[mode]
+        except KeyError:
+            return None
+    return mask
+
+
+def split_ids(record: dict, namespace: str) -> tuple:
+    """
+    Return (primary_id, other_id, other_namespace) for an alignment record involving a place
+    from namespace, or None if it does not involve one
+    """
+    id_1, id_2 = record["aligned_ids"]
+    namespace_1 = id_1.split(":")[0]
+    namespace_2 = id_2.split(":")[0]
+    if namespace_1 == namespace:
+        return (id_1, id_2, namespace_2)
+    if namespace_2 == namespace:
+        return (id_2, id_1, namespace_1)
+    return None
+
+
+class CategoryRules:
+    """
+    Category criteria compiled to a lookup table
+
+    criteria maps each category, in order of precedence, to a rule (or a list of alternative
+    rules) giving the exact set of "modes" an alignment must have and the "proximity_types"
+    its proximity class must be one of (if none are given, any proximity class, or none,
+    will do). The first category an alignment meets is the one it is assigned. Compiling
+    resolves that precedence once, up front, so that classifying an alignment is a single
+    lookup by (mode bitmask, proximity class).
+    """
+
+    def __init__(self, criteria: dict):
+        self.criteria = criteria
+        self._table = dict()
+        self._any_proximity = dict()
+        self._ranks = {cat: i for i, cat in enumerate(criteria.keys())}
+        for cat, rules in criteria.items():
+            if isinstance(rules, dict):
+                rules = [rules]
+            for rule in rules:
+                self._compile(cat, rule)
+
+    def _compile(self, cat, rule: dict):
+        mask = mode_mask(rule["modes"])
+        if mask is None:
+            raise ValueError(
+                f"Unsupported alignment mode in criteria for category {cat}: {rule['modes']}"
+            )
+        if mask in self._any_proximity:
+            # an earlier category already takes every alignment with these modes
+            return
+        if rule.get("proximity_types"):
+            for proximity in rule["proximity_types"]:
+                self._table.setdefault((mask, proximity), cat)
+        else:
+            self._any_proximity[mask] = cat
+
+    def classify(self, record: dict):
+        """Return the category of an alignment record, or None if it meets no criteria"""
+        mask = mode_mask(record["modes"])
+        try:
+            return self._table[(mask, record.get("proximity"))]
+        except KeyError:
+            return self._any_proximity.get(mask)
+
+    def classify_all(self, records):
+        """Lazily yield (category, record) for each record in an iterable of alignment records"""
+        for record in records:
+            yield (self.classify(record), record)
+
+    def classify_group(self, records, default=None):
+        """Return the highest-ranking category among alignment records, or default if none"""
+        cats = {self.classify(record) for record in records}
+        cats.discard(None)
+        if not cats:
+            return default
+        return min(cats, key=self.rank)
+
+    def rank(self, cat) -> int:
+        """Return the precedence of a category (lower ranks first)"""
+        return self._ranks[cat]
+
+
+def build_place_group(
+    primary_id: str, alignments: list, inferred: list, namespace: str
+) -> dict:
+    """
+    Gather the places aligned with a primary namespace place, keyed by full id
+    - alignments: categorized alignment records involving the primary place
+    - inferred: inference-only alignment records involving the primary place, included
+      only if one of their authorities is among the places already gathered
+    """
+    group = dict()
+    for a in alignments:
+        primary_id, other_id, other_namespace = split_ids(a, namespace)
+        try:
+            group[primary_id] = a[namespace]
+        except KeyError:
+            pass
+        _add_aligned_place(group, a, other_id, other_namespace)
+    for a in inferred:
+        if not set(a["authorities"]).intersection(group.keys()):
+            continue
+        primary_id, other_id, other_namespace = split_ids(a, namespace)
+        _add_aligned_place(group, a, other_id, other_namespace)
+    return group
+
+
+def iter_place_groups(records, namespace: str, rules: CategoryRules):
+    """
+    Lazily yield (category, primary_id, count, group) for each categorized primary namespace
+    place, from alignment records grouped (e.g. sorted) by primary namespace id
+    Each group is yielded as soon as the records for the next place begin, so memory use is
+    bounded by the largest group; category is the highest-ranking category among the place's
+    alignments, count the number of alignments so categorized, and group as returned by
+    build_place_group(). Records not involving namespace are skipped. Raises ValueError if
+    the records of a place do not follow one another.
+    """
+    current = None
+    seen = set()
+    categorized = list()
+    inferred = list()
+    cats = set()
+    for a in records:
+        ids = split_ids(a, namespace)
+        if ids is None:
+            continue
+        if ids[0] != current:
+            if cats:
+                yield (
+                    min(cats, key=rules.rank),
+                    current,
+                    len(categorized),
+                    build_place_group(current, categorized, inferred, namespace),
+                )
+            if ids[0] in seen:
+                raise ValueError(
+                    f"Alignments of {ids[0]} are not grouped together; write the report "
+                    f"with align.py --group-by={namespace}"
+                )
+            seen.add(ids[0])
+            current = ids[0]
+            categorized = list()
+            inferred = list()
+            cats = set()
+        if a["modes"] == ["inference"]:
+            inferred.append(a)
+            continue
+        cat = rules.classify(a)
+        if cat is not None:
+            categorized.append(a)
+            cats.add(cat)
+    if cats:
+        yield (
+            min(cats, key=rules.rank),
+            current,
+            len(categorized),
+            build_place_group(current, categorized, inferred, namespace),
+        )
+
+
+def _add_aligned_place(group: dict, a: dict, other_id: str, other_namespace: str):
+    try:
+        group[other_id] = a[other_namespace]
+    except KeyError:
+        group[other_id] = dict()
+    group[other_id]["authorities"] = a["authorities"]
+    group[other_id]["modes"] = a["modes"]
+    try:
+        group[other_id]["proximity"] = a["proximity"]
+        group[other_id]["centroid_distance_m"] = a["centroid_distance_m"]
+    except KeyError:
+        group[other_id]["proximity"] = None
+        group[other_id]["centroid_distance_m"] = None
@@ -0,0 +1,165 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Checkpoint each stage of an alignment run to a directory, so that an interrupted run resumes
+"""
+import gzip
+import hashlib
+import json
+from logging import getLogger
+import os
+from pathlib import Path
+import pickle
+from pleiades_aligner.aligner import Aligner
+
+CHECKPOINT_FORMAT = 1  # increment whenever the manifest or checkpoints change shape
+MANIFEST_NAME = "run.json"
+
+
+def source_signature(path) -> list:
+    """
+    Return the size and modification time of a data source file, or of every file under a
+    data source directory, so that changed inputs can be detected without ingesting them
+    """
+    path = Path(path).expanduser().resolve()
+    if path.is_file():
+        s = path.stat()
+        return [[path.name, s.st_size, s.st_mtime_ns]]
+    signature = list()
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            s = os.stat(os.path.join(dirpath, filename))
+            relative = os.path.relpath(os.path.join(dirpath, filename), path)
+            signature.append([relative, s.st_size, s.st_mtime_ns])
+    if not signature:
+        raise FileNotFoundError(path)
+    return sorted(signature)
+
+
+class RunDirectory:
+    """
+    Checkpoints of the stages of an alignment run, in pipeline order
+
+    stages is a list of (name, inputs) pairs, where inputs is anything JSON-serializable
+    that determines the outcome of the stage (its configuration and, for ingestion, the
+    signatures of the data sources). The key of each stage hashes its inputs with the key
+    of the stage before, so a change invalidates that stage and every stage after it.
+    The first stage checkpoints the whole Aligner (ingested data included); later stages
+    checkpoint only the alignments.
+    """
+
+    def __init__(self, path: Path, stages: list, resume: bool = False):
+        self.logger = getLogger("RunDirectory")
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.keys = dict()
+        self.names = list()
+        key = str(CHECKPOINT_FORMAT)
+        for name, inputs in stages:
+            if name in self.keys:
+                raise ValueError(f"Stage '{name}' is given more than once")
+            key = hashlib.sha256(
+                json.dumps([key, name, inputs], sort_keys=True, default=str).encode(
+                    "utf-8"
+                )
+            ).hexdigest()
+            self.keys[name] = key
+            self.names.append(name)
+        self.completed = list()  # names of stages with valid checkpoints, in order
+        if resume:
+            for record in self._read_manifest():
+                name = record["stage"]
+                if (
+                    len(self.completed) == len(self.names)
+                    or name != self.names[len(self.completed)]
+                    or record["key"] != self.keys[name]
+                    or not (self.path / record["file"]).exists()
+                ):
+                    break
+                self.completed.append(name)
+            if self.completed:
+                self.logger.info(
+                    f"Resuming after stage '{self.completed[-1]}' ({len(self.completed)} of {len(self.names)} stages complete)"
+                )
+            else:
+                self.logger.info(f"No checkpoints to resume from in {self.path}")
+        self._write_manifest()
+
+    def skip(self, name: str) -> bool:
+        """Return True if stage name has a valid checkpoint, so need not be run"""
+        if name not in self.keys:
+            raise KeyError(f"No stage named '{name}' in this run")
+        return name in self.completed
+
+    def restore(self) -> Aligner:
+        """Return an aligner in the state checkpointed after the last complete stage"""
+        if not self.completed:
+            raise ValueError(f"No complete stages to restore in {self.path}")
+        aligner = Aligner.load(self.path / self._filename(self.names[0]))
+        if len(self.completed) > 1:
+            name = self.completed[-1]
+            with gzip.open(self.path / self._filename(name), "rb") as f:
+                aligner.set_alignments(pickle.load(f))
+            self.logger.info(
+                f"Restored {len(aligner.alignments)} alignments checkpointed after stage '{name}'"
+            )
+        return aligner
+
+    def save(self, name: str, aligner: Aligner):
+        """Checkpoint the aligner after stage name, which must be the next stage in order"""
+        expected = None
+        if len(self.completed) < len(self.names):
+            expected = self.names[len(self.completed)]
+        if name != expected:
+            raise ValueError(f"Expected to checkpoint stage '{expected}', not '{name}'")
+        path = self.path / self._filename(name)
+        temporary = path.with_name(path.name + ".tmp")
+        if not self.completed:
+            aligner.save(temporary)
+        else:
+            with gzip.open(temporary, "wb", compresslevel=6) as f:
+                pickle.dump(
+                    list(aligner.alignments.values()),
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+        # a checkpoint is only recorded in the manifest once completely written
+        os.replace(temporary, path)
+        self.completed.append(name)
+        self._write_manifest()
+        self.logger.info(f"Checkpointed stage '{name}' to {path}")
+
+    def _filename(self, name: str) -> str:
+        index = self.names.index(name)
+        return f"{index:02d}-{name.replace(' ', '_')}.checkpoint"
+
+    def _read_manifest(self) -> list:
+        try:
+            with open(self.path / MANIFEST_NAME, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return list()
+        if manifest["format"] != CHECKPOINT_FORMAT:
+            self.logger.warning(
+                f"Ignoring checkpoints in {self.path} with format {manifest['format']} (expected {CHECKPOINT_FORMAT})"
+            )
+            return list()
+        return manifest["stages"]
+
+    def _write_manifest(self):
+        manifest = {
+            "format": CHECKPOINT_FORMAT,
+            "stages": [
+                {"stage": name, "key": self.keys[name], "file": self._filename(name)}
+                for name in self.completed
+            ],
+        }
+        temporary = self.path / (MANIFEST_NAME + ".tmp")
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(temporary, self.path / MANIFEST_NAME)
@@ -14,8 +14,13 @@ from pleiades_aligner.ingester import IngesterCSV
 
 
 class IngesterChronique(IngesterCSV):
-    def __init__(self, filepath: Path):
-        IngesterCSV.__init__(self, namespace="chronique", filepath=filepath)
+    def __init__(self, filepath: Path, raw_properties: str = "keep"):
+        IngesterCSV.__init__(
+            self,
+            namespace="chronique",
+            filepath=filepath,
+            raw_properties=raw_properties,
+        )
         self.logger = getLogger("IngesterChronique")
         self.base_uri = "https://chronique.efa.gr/?kroute=topo_public&id="
 
@@ -24,6 +29,7 @@ class IngesterChronique(IngesterCSV):
             self, id_clean={"strip-prefix": 'GA_OPE_EDIT" target="_blank">'}
         )
         self._digest()
+        self._apply_raw_properties_policy()
 
     def _digest(self):
         self._set_titles_from_properties("Toponym {id}: {Full_name}")
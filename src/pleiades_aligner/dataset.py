@@ -9,11 +9,18 @@
 Define common classes for managing ingested datasets and their place records
 """
 
-from haversine import inverse_haversine, Direction, Unit
+import functools
+import hashlib
+from haversine import inverse_haversine_vector, Direction, Unit
 from logging import getLogger
+import numpy
+import pickle
 from pprint import pformat
 from shapely import (
+    distance,
+    dwithin,
     GeometryCollection,
+    intersects,
     Point,
     LinearRing,
     LineString,
@@ -21,10 +28,70 @@ from shapely import (
     MultiPoint,
     MultiPolygon,
     MultiLineString,
-    distance,
+    STRtree,
+    to_wkb,
 )
 from shapely.geometry import box
 from slugify import slugify
+from sys import intern
+import zlib
+
+CARDINAL_DIRECTIONS = numpy.array(
+    [
+        Direction.NORTH.value,
+        Direction.EAST.value,
+        Direction.SOUTH.value,
+        Direction.WEST.value,
+    ]
+)
+# places added, replaced, or moved since the spatial index was built are queried alongside
+# it until there are more of them than this fraction of the indexed places (or minimum)
+SPATIAL_PENDING_FRACTION = 0.05
+SPATIAL_PENDING_MIN = 256
+
+
+def accuracy_to_degrees(origins, distances_meters) -> numpy.ndarray:
+    """
+    Convert accuracy radii in meters to unsigned decimal degrees, in bulk
+    - origins: sequence of (longitude, latitude) pairs in signed decimal degrees WGS84
+    - distances_meters: sequence of accuracy radii in meters, one per origin
+    Returns an array holding, for each origin, the planar distance in decimal degrees
+    to the furthest of the points lying distances_meters due N, E, S, and W of it
+    """
+    origins = numpy.asarray(origins, dtype=float).reshape(-1, 2)
+    distances_meters = numpy.asarray(distances_meters, dtype=float).reshape(-1)
+    if origins.shape[0] != distances_meters.shape[0]:
+        raise ValueError(
+            f"Expected one distance per origin, but got {origins.shape[0]} origins and {distances_meters.shape[0]} distances"
+        )
+    count = origins.shape[0]
+    if not count:
+        return numpy.empty(0, dtype=float)
+    # one row per (direction, origin) pair: haversine wants (latitude, longitude)
+    lat_lng = numpy.tile(origins[:, ::-1], (len(CARDINAL_DIRECTIONS), 1))
+    lats, lngs = inverse_haversine_vector(
+        lat_lng,
+        numpy.tile(distances_meters, len(CARDINAL_DIRECTIONS)),
+        numpy.repeat(CARDINAL_DIRECTIONS, count),
+        unit=Unit.METERS,
+    )
+    dx = lngs.reshape(-1, count) - origins[:, 0]
+    dy = lats.reshape(-1, count) - origins[:, 1]
+    return numpy.hypot(dx, dy).max(axis=0)
+
+
+def _ordered_geometries(geometries: set) -> list:
+    """
+    Return a set of geometries as a list in an order (by WKB) that, unlike the set's own,
+    is the same in every process, so that centroids derived from them are too
+    """
+    return sorted(geometries, key=to_wkb)
+
+
+@functools.lru_cache(maxsize=65536)
+def name_key(name: str) -> str:
+    """Return the slug used to index and look up a place name"""
+    return slugify(name)
 
 
 class DataSet:
@@ -39,6 +106,7 @@ class DataSet:
 
         self._places = dict()
         self._name_index = dict()
+        self._spatial_index = None  # built on first spatial query
 
         for k, arg in kwargs.items():
             try:
@@ -49,6 +117,12 @@ class DataSet:
                 )
             setattr(self, k, arg)
 
+    def __getstate__(self):
+        # the spatial index is rebuilt on demand rather than pickled
+        state = self.__dict__.copy()
+        state["_spatial_index"] = None
+        return state
+
     # namespace:
     # a read-only, non-zero-length, slug-like string
     # once initialized, it can only be set or changed directly by the DataSet object itself
@@ -63,17 +137,38 @@ class DataSet:
             raise ValueError(
                 f"Expected slugifiable string like '{slug}' for namespace, but got '{namespace}'"
             )
-        self._namespace = namespace
+        self._namespace = intern(namespace)
 
     @property
     def namespace(self):
         return self._namespace
 
     # places
+    # pids and places return new lists; for iteration, prefer the live, zero-copy
+    # pid_view and place_view, items(), or iterating over the dataset itself
+
     @property
     def pids(self):
         return list(self._places.keys())
 
+    @property
+    def pid_view(self):
+        return self._places.keys()
+
+    @property
+    def place_view(self):
+        return self._places.values()
+
+    def items(self):
+        """Return a live view of (pid, place) pairs"""
+        return self._places.items()
+
+    def iter_full_ids(self):
+        """Yield (namespace-qualified id, place) pairs without copying the collection"""
+        prefix = self._namespace + ":"
+        for pid, place in self._places.items():
+            yield prefix + pid, place
+
     @property
     def places(self):
         return list(self._places.values())
@@ -90,8 +185,16 @@ class DataSet:
             raise TypeError(
                 "One or more items in values argument is not of type Place: {fail_types}"
             )
-        self._places = {p.id: p for p in values}
+        for p in self._places.values():
+            if p._dataset is self:
+                p._dataset = None
+        # replace contents in place so that views handed out earlier stay live
+        self._places.clear()
+        self._places.update({p.id: p for p in values})
+        for p in values:
+            p._dataset = self
         self.reindex()
+        self._spatial_index = None
 
     def get_place_by_id(self, id: str):
         try:
@@ -101,24 +204,231 @@ class DataSet:
                 f"Requested placeid {self.namespace}:{id}, but it has not been ingested."
             ) from err
 
+    def add_place(self, place: "Place"):
+        """Add a place, replacing any place with the same id, and update indexes to match"""
+        if not isinstance(place, Place):
+            raise TypeError(f"Expected type Place, but got {type(place)}")
+        try:
+            self.remove_place(place.id)
+        except KeyError:
+            pass
+        self._places[place.id] = place
+        place._dataset = self
+        self._index_names(place.id, place.names)
+        self._geometry_changed(place)
+
+    def remove_place(self, id: str) -> "Place":
+        """Remove the place with id, updating indexes to match, and return it"""
+        place = self.get_place_by_id(id)
+        del self._places[id]
+        if place._dataset is self:
+            place._dataset = None
+        for key in {name_key(n) for n in place.names}:
+            try:
+                pids = self._name_index[key]
+            except KeyError:
+                continue
+            pids.discard(id)
+            if not pids:
+                del self._name_index[key]
+        self._unindex_geometry(id)
+        return place
+
+    def get_places_by_name(self, name: str) -> list:
+        """Return all places having a name that slugifies like the name argument"""
+        try:
+            pids = self._name_index[name_key(name)]
+        except KeyError:
+            return list()
+        return [self._places[pid] for pid in pids]
+
     def reindex(self):
+        """Rebuild the name index from scratch"""
+        self._name_index = dict()
         for pid, p in self._places.items():
+            self._index_names(pid, p.names)
+
+    def _index_names(self, pid: str, names: set):
+        for n in names:
+            key = name_key(n)
+            if not key:
+                continue
             try:
-                p.names
-            except AttributeError:
-                pass
-            else:
-                for n in p.names:
-                    slug = slugify(n)
-                    try:
-                        self._name_index[slug]
-                    except KeyError:
-                        self._name_index[slug] = dict()
-                    finally:
-                        self._name_index[slug][pid] = 1
+                self._name_index[key]
+            except KeyError:
+                self._name_index[key] = set()
+            finally:
+                self._name_index[key].add(pid)
+
+    def _names_changed(self, place: "Place", removed: set, added: set):
+        """Hook called by a member place when its names change"""
+        if removed:
+            # another remaining name may still share a key with a removed name
+            keep = {name_key(n) for n in place.names}
+            for n in removed:
+                key = name_key(n)
+                if key in keep:
+                    continue
+                try:
+                    pids = self._name_index[key]
+                except KeyError:
+                    continue
+                pids.discard(place.id)
+                if not pids:
+                    del self._name_index[key]
+        if added:
+            self._index_names(place.id, added)
+
+    # spatial queries:
+    # backed by STR-packed R-trees over place footprints and centroids, which are built on
+    # first use and discarded whenever places are reassigned; places added, removed, or
+    # moved since are kept as pending changes checked alongside the trees, which are rebuilt
+    # once the changes pile up; distances are planar, in decimal degrees, as in proximity
+    # alignment
+
+    def query_bbox(self, bounds: tuple, geometry: str = "footprint") -> list:
+        """
+        Return places whose geometry intersects a bounding box
+        - bounds: (min_x, min_y, max_x, max_y) in signed decimal degrees WGS84
+        - geometry: "footprint" or "centroid"
+        """
+        target = box(*bounds)
+        places, tree, added = self._get_spatial_index(geometry)
+        hits = tree.query(target, predicate="intersects")
+        return self._live_hits(places, hits) + self._pending_hits(
+            added, geometry, intersects, target
+        )
+
+    def query_radius(
+        self, origin: Point, radius: float, geometry: str = "footprint"
+    ) -> list:
+        """
+        Return places whose geometry lies within radius decimal degrees of origin
+        """
+        places, tree, added = self._get_spatial_index(geometry)
+        hits = tree.query(origin, predicate="dwithin", distance=radius)
+        return self._live_hits(places, hits) + self._pending_hits(
+            added, geometry, dwithin, origin, radius
+        )
+
+    def nearest(self, origin: Point, k: int = 1, geometry: str = "centroid") -> list:
+        """
+        Return the k places whose geometry is nearest to origin, nearest first
+        """
+        places, tree, added = self._get_spatial_index(geometry)
+        count = len(self._spatial_index["positions"])
+        if k < 1 or not (count or added):
+            return list()
+        candidates = list()
+        if count:
+            # widen a radius search, starting from the nearest distance, until it holds k
+            # hits; anything outside the final radius is further away than every hit inside
+            hits, distances = tree.query_nearest(origin, return_distance=True)
+            radius = max(float(distances.min()), 0.000001)
+            while True:
+                hits = tree.query(origin, predicate="dwithin", distance=radius)
+                candidates = self._live_hits(places, hits)
+                if len(candidates) >= min(k, count):
+                    break
+                radius *= 2
+        candidates.extend(added.values())
+        distances = distance([getattr(p, geometry) for p in candidates], origin)
+        return [candidates[i] for i in numpy.argsort(distances, kind="stable")[:k]]
+
+    def build_spatial_index(self):
+        """Build the spatial index now, if it is not built already, rather than on first query"""
+        self._get_spatial_index("footprint")
+
+    def _get_spatial_index(self, geometry: str) -> tuple:
+        if geometry not in ("footprint", "centroid"):
+            raise ValueError(
+                f"Expected 'footprint' or 'centroid' for geometry, but got '{geometry}'"
+            )
+        index = self._spatial_index
+        if index is not None and len(index["added"]) + len(index["stale"]) > max(
+            SPATIAL_PENDING_MIN, SPATIAL_PENDING_FRACTION * len(index["places"])
+        ):
+            index = None
+        if index is None:
+            places = [p for p in self._places.values() if p.footprint is not None]
+            index = {
+                "places": places,
+                "positions": {p.id: i for i, p in enumerate(places)},
+                "stale": set(),  # positions of places removed or moved since
+                "added": dict(),  # places added or moved since, by id
+                "footprint": STRtree([p.footprint for p in places]),
+                "centroid": STRtree([p.centroid for p in places]),
+            }
+            self._spatial_index = index
+        return (index["places"], index[geometry], index["added"])
+
+    def _live_hits(self, places: list, hits) -> list:
+        """Return the places at positions hits of the spatial index, less stale ones"""
+        stale = self._spatial_index["stale"]
+        return [places[i] for i in sorted(hits) if i not in stale]
+
+    def _pending_hits(self, added: dict, geometry: str, predicate, *args) -> list:
+        """Return the places added to the spatial index since it was built that match"""
+        if not added:
+            return list()
+        places = list(added.values())
+        matches = predicate([getattr(p, geometry) for p in places], *args)
+        return [p for p, match in zip(places, matches) if match]
+
+    def _unindex_geometry(self, pid: str):
+        """Mark the place with pid as no longer in the spatial index"""
+        index = self._spatial_index
+        if index is None:
+            return
+        index["added"].pop(pid, None)
+        try:
+            index["stale"].add(index["positions"].pop(pid))
+        except KeyError:
+            pass
+
+    def _geometry_changed(self, place: "Place"):
+        """Hook called by a member place when its spatial metadata changes"""
+        if self._spatial_index is None:
+            return
+        self._unindex_geometry(place.id)
+        if place.footprint is not None:
+            self._spatial_index["added"][place.id] = place
+
+    def apply_deferred_accuracy(self):
+        """
+        Convert and apply all accuracy values deferred by places in this dataset
+        Metric accuracy values are converted to decimal degrees in a single vectorized pass,
+        then each affected place recalculates its spatial metadata once
+        """
+        places = [p for p in self._places.values() if p._deferred_accuracy]
+        if not places:
+            return
+        origins = list()
+        distances = list()
+        for p in places:
+            for x, y, distance_meters in p._deferred_accuracy:
+                origins.append((x, y))
+                distances.append(distance_meters)
+        dd_vals = accuracy_to_degrees(origins, distances)
+        i = 0
+        for p in places:
+            j = i + len(p._deferred_accuracy)
+            p._deferred_accuracy = None
+            p.set_accuracy_if_larger(None, float(dd_vals[i:j].max()), "DD")
+            i = j
+
+    def fingerprints(self) -> dict:
+        """Return the content fingerprint of every place, keyed by id"""
+        return {pid: p.fingerprint() for pid, p in self._places.items()}
+
+    def __contains__(self, pid: str):
+        return pid in self._places
+
+    def __iter__(self):
+        return iter(self._places.values())
 
     def __len__(self):
-        return len(self.places)
+        return len(self._places)
 
 
 class Place:
@@ -126,28 +436,46 @@ class Place:
     A record containing information about a single Place resource in a DataSet
     """
 
-    def __init__(self, id: str, **kwargs):
-        self.logger = getLogger("Place")
+    __slots__ = (
+        "_id",
+        "_alignments",
+        "_geometries",
+        "_names",
+        "_accuracy",
+        "_feature_types",
+        "_centroid",
+        "_footprint",
+        "_bin",
+        "_deferred_accuracy",
+        "_raw_properties",
+        "_dataset",
+        "title",
+    )
+    logger = getLogger("Place")
 
+    def __init__(self, id: str, **kwargs):
         self._set_id(id)
 
         self._alignments = set()
-        self._geometries = list()
+        self._geometries = None
         self._names = set()
         self._accuracy = 0.0  # assume unsigned decimal degrees
-        self.feature_types = set()
+        self._feature_types = set()
         self._centroid = None  # assume signed decimal degrees WGS84
         self._footprint = None  # assume signed decimal degrees WGS84
         self._bin = None  # n x n degree bin into which the footprint fits
-        self.raw_properties = dict()
+        self._deferred_accuracy = None  # metric accuracy values awaiting conversion
+        self._raw_properties = dict()
+        self._dataset = None  # the DataSet, if any, whose indexes cover this place
 
         for k, arg in kwargs.items():
-            try:
-                getattr(self, k)
-            except AttributeError as err:
-                self.logger.warning(
-                    f"__init__() is setting uninitialized attribute {k}='{arg}', which was passed with kwargs"
-                )
+            attr = getattr(Place, k, None)
+            if isinstance(attr, property):
+                settable = attr.fset is not None
+            else:
+                settable = k in Place.__slots__ and not k.startswith("_")
+            if not settable:
+                raise TypeError(f"Place() got an unsupported keyword argument '{k}'")
             setattr(self, k, arg)
 
     # id:
@@ -168,41 +496,31 @@ class Place:
     def accuracy(self) -> float:
         return self._accuracy
 
-    def set_accuracy_if_larger(self, origin: Point, val: float, unit: str = "DD"):
+    def set_accuracy_if_larger(
+        self, origin: Point, val: float, unit: str = "DD", defer: bool = False
+    ):
+        """
+        Set accuracy to val if it is larger than the current accuracy
+        If defer is True, metric values are stored for later bulk conversion by
+        DataSet.apply_deferred_accuracy() instead of being converted and applied now
+        """
         if unit.lower() == "dd":
             dd_val = val
         elif unit.lower() in ["m", "meters", "metres"]:
-            dd_val = distance(origin, self._furthest_cardinal_point(origin, val))
+            if not isinstance(val, float):
+                raise TypeError(f"Expected float for val, but got {type(val)}={val}")
+            if defer:
+                if self._deferred_accuracy is None:
+                    self._deferred_accuracy = list()
+                self._deferred_accuracy.append((origin.x, origin.y, val))
+                return
+            dd_val = float(accuracy_to_degrees((origin.x, origin.y), val)[0])
         else:
             raise ValueError(unit)
         if dd_val > self._accuracy:
             self._accuracy = dd_val
             self._recalculate_spatial_metadata()
 
-    def _furthest_cardinal_point(self, origin: Point, distance_meters: float) -> Point:
-        if not isinstance(distance_meters, float):
-            raise TypeError(
-                f"Expected float for distance_meters, but got {type(distance_meters)}={distance_meters}"
-            )
-        points = [
-            inverse_haversine(
-                (origin.y, origin.x), distance_meters, dir, unit=Unit.METERS
-            )
-            for dir in [
-                Direction.NORTH,
-                Direction.EAST,
-                Direction.SOUTH,
-                Direction.WEST,
-            ]
-        ]
-        points = [Point((d[1], d[0])) for d in points]
-        points = sorted(
-            points,
-            key=lambda d: distance(d, origin),
-            reverse=True,
-        )
-        return points[0]
-
     @property
     def id(self):
         return self._id
@@ -291,8 +609,10 @@ class Place:
                     values,
                 ]
             )
-        elif isinstance(values, (tuple, set)):
+        elif isinstance(values, tuple):
             self._geometries = GeometryCollection(list(values))
+        elif isinstance(values, set):
+            self._geometries = GeometryCollection(_ordered_geometries(values))
         self._recalculate_spatial_metadata()
 
     def add_geometries(
@@ -316,11 +636,11 @@ class Place:
         elif isinstance(values, GeometryCollection):
             gg = set(self.geometries.geoms)
             gg.update(values.geoms)
-            self._geometries = GeometryCollection(list(gg))
+            self._geometries = GeometryCollection(_ordered_geometries(gg))
         elif isinstance(values, (list, tuple)):
             gg = set(self.geometries.geoms)
             gg.update(values)
-            self._geometries = GeometryCollection(list(gg))
+            self._geometries = GeometryCollection(_ordered_geometries(gg))
         elif isinstance(
             values,
             (
@@ -338,7 +658,7 @@ class Place:
             except AttributeError:
                 gg = set()
             gg.add(values)
-            self._geometries = GeometryCollection(list(gg))
+            self._geometries = GeometryCollection(_ordered_geometries(gg))
         self._recalculate_spatial_metadata()
 
     def remove_geometries(self):
@@ -383,8 +703,94 @@ class Place:
             float(1 + int(max_y)),
         ]
         self._bin = box(*round_bounds)
+        if self._dataset is not None:
+            self._dataset._geometry_changed(self)
+
+    # Fingerprint
+    # a digest of everything alignment and reporting depend on, which (unlike hash()) is the
+    # same across runs, so that changed places can be found by comparing fingerprints
+
+    def fingerprint(self) -> str:
+        geometries = [
+            None if g is None else to_wkb(g, hex=True)
+            for g in (self._centroid, self._footprint)
+        ]
+        content = (
+            getattr(self, "title", None),
+            sorted(self._names),
+            sorted(self._feature_types),
+            sorted(self._alignments),
+            self._accuracy,
+            geometries,
+        )
+        return hashlib.blake2b(
+            repr(content).encode("utf-8"), digest_size=16
+        ).hexdigest()
+
+    # Feature types
+    # strings are interned, since the same few type terms recur across every place in a dataset
+
+    @property
+    def feature_types(self) -> set:
+        return self._feature_types
+
+    @feature_types.deleter
+    def feature_types(self):
+        self._feature_types = set()
+
+    @feature_types.setter
+    def feature_types(self, values: [tuple, list, set, str, None]):
+        del self.feature_types
+        self.add_feature_types(values)
+
+    def add_feature_types(self, values: [tuple, list, set, str, None]):
+        if values is None:
+            return
+        if values:
+            if isinstance(values, (set, tuple, list)):
+                self._feature_types.update([intern(v) for v in values])
+            elif isinstance(values, str):
+                self._feature_types.add(intern(values))
+            else:
+                raise TypeError(
+                    f"Expected tuple, list, set, or str, but got {type(values)}"
+                )
+
+    # Raw properties:
+    # the source record as read by the ingester; once the ingester has digested it, the
+    # ingester's raw properties policy may drop it or hold it compressed (see IngesterBase)
+
+    @property
+    def raw_properties(self) -> dict:
+        """
+        Compressed raw properties are decompressed into a new dictionary on each access,
+        so changes made to the returned dictionary are not kept
+        """
+        if isinstance(self._raw_properties, bytes):
+            return pickle.loads(zlib.decompress(self._raw_properties))
+        return self._raw_properties
+
+    @raw_properties.deleter
+    def raw_properties(self):
+        self._raw_properties = dict()
+
+    @raw_properties.setter
+    def raw_properties(self, values: [dict, None]):
+        if values is None:
+            del self.raw_properties
+        elif isinstance(values, dict):
+            self._raw_properties = values
+        else:
+            raise TypeError(f"Expected dict, but got {type(values)}")
+
+    def compress_raw_properties(self):
+        if self._raw_properties and not isinstance(self._raw_properties, bytes):
+            self._raw_properties = zlib.compress(pickle.dumps(self._raw_properties))
 
     # Names
+    # changes made through the names property and the add/remove methods are reported to
+    # the dataset holding this place, if any, so that its name index stays current
+    # (geometry changes are reported likewise, from _recalculate_spatial_metadata)
 
     @property
     def names(self) -> set:
@@ -392,23 +798,25 @@ class Place:
 
     @names.deleter
     def names(self):
-        self._names = set()
+        self._replace_names(set())
 
     @names.setter
     def names(self, values: [tuple, list, set, str, None]):
         if values is None:
             del self.names
         elif isinstance(values, set):
-            self._names = values
+            self._replace_names(values)
         elif isinstance(values, str):
             if values:
-                self._names = {
-                    values,
-                }
+                self._replace_names(
+                    {
+                        values,
+                    }
+                )
             else:
                 del self.names
         elif isinstance(values, (tuple, list)):
-            self._names = set(values)
+            self._replace_names(set(values))
         else:
             raise TypeError(
                 f"Expected tuple, list, set, or str, but got {type(values)}"
@@ -419,23 +827,39 @@ class Place:
             return
         if values:
             if isinstance(values, (set, tuple, list)):
-                self._names.update(values)
+                added = set(values).difference(self._names)
             elif isinstance(values, str):
-                self._names.add(values)
+                added = {values}.difference(self._names)
             else:
                 raise TypeError(
                     f"Expected tuple, list, set, or str, but got {type(values)}"
                 )
+            if added:
+                self._names.update(added)
+                if self._dataset is not None:
+                    self._dataset._names_changed(self, set(), added)
 
     def remove_names(self, values: [tuple, list, set, str, None]):
         if values is None:
             return
         if values:
             if isinstance(values, str):
-                self._names.discard(values)
+                removed = {values}.intersection(self._names)
             elif isinstance(values, (tuple, list, set)):
-                self._names = self._names.difference(values)
+                removed = self._names.intersection(values)
             else:
                 raise TypeError(
                     f"Expected tuple, list, set, or str, but got {type(values)}"
                 )
+            if removed:
+                self._names = self._names.difference(removed)
+                if self._dataset is not None:
+                    self._dataset._names_changed(self, removed, set())
+
+    def _replace_names(self, values: set):
+        prior = self._names
+        self._names = values
+        if self._dataset is not None:
+            self._dataset._names_changed(
+                self, prior.difference(values), values.difference(prior)
+            )
@@ -0,0 +1,167 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Compare the alignments of two runs
+"""
+import heapq
+import json
+import math
+from pathlib import Path
+from pleiades_aligner.report import iter_report
+from pleiades_aligner.store import AlignmentStore
+import tempfile
+
+DIFF_FIELDS = [
+    "modes",
+    "authorities",
+    "proximity",
+    "centroid_distance_dd",
+    "centroid_distance_m",
+]
+SQLITE_HEADER = b"SQLite format 3\x00"
+# centroid distances closer than these tolerances are reported as unchanged, since the same
+# inputs can give distances differing in their last bits
+DISTANCE_REL_TOL = 1e-9
+DISTANCE_ABS_TOL = 1e-9
+
+
+def record_key(record: dict) -> str:
+    """Return the stable key for an alignment record, as alignment_key() does for an Alignment"""
+    return " >< ".join(sorted(record["aligned_ids"]))
+
+
+def is_store(path: Path) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+
+def iter_sorted(path: Path, chunk_size: int = 100000):
+    """
+    Yield (key, record) for every alignment in a report or store, in key order, with records
+    trimmed to the fields compared by diff_alignments
+    Stores are read with an ordered cursor; reports are sorted externally, in sorted chunks
+    of chunk_size records spilled to temporary files and then merged, so memory use is
+    bounded however long the report (JSON array reports must still be parsed whole)
+    """
+    if is_store(path):
+        with AlignmentStore(path) as store:
+            for record in store.iter_alignments():
+                yield (record["key"], _trim(record))
+        return
+    with tempfile.TemporaryDirectory() as tmpdir:
+        chunks = list()
+        chunk = list()
+        for record in iter_report(path):
+            chunk.append((record_key(record), _trim(record)))
+            if len(chunk) >= chunk_size:
+                chunks.append(_spill(chunk, Path(tmpdir) / f"{len(chunks)}.jsonl"))
+                chunk = list()
+        if not chunks:
+            yield from sorted(chunk, key=lambda item: item[0])
+            return
+        if chunk:
+            chunks.append(_spill(chunk, Path(tmpdir) / f"{len(chunks)}.jsonl"))
+        yield from heapq.merge(
+            *[_read_chunk(p) for p in chunks], key=lambda item: item[0]
+        )
+
+
+def diff_alignments(
+    old,
+    new,
+    rel_tol: float = DISTANCE_REL_TOL,
+    abs_tol: float = DISTANCE_ABS_TOL,
+):
+    """
+    Compare two key-ordered streams of (key, record), as yielded by iter_sorted(), and yield
+    a change record for every alignment added, removed, or changed between them
+    Changes list modes and authorities added and removed, old and new proximity classes,
+    and old, new, and delta values of centroid distances that differ beyond rel_tol and
+    abs_tol (as for math.isclose)
+    """
+    old = iter(old)
+    new = iter(new)
+    old_item = next(old, None)
+    new_item = next(new, None)
+    while old_item is not None or new_item is not None:
+        if new_item is None or (old_item is not None and old_item[0] < new_item[0]):
+            yield {"key": old_item[0], "change": "removed", "old": old_item[1]}
+            old_item = next(old, None)
+        elif old_item is None or new_item[0] < old_item[0]:
+            yield {"key": new_item[0], "change": "added", "new": new_item[1]}
+            new_item = next(new, None)
+        else:
+            changes = _compare(old_item[1], new_item[1], rel_tol, abs_tol)
+            if changes:
+                changes["key"] = new_item[0]
+                changes["change"] = "changed"
+                yield changes
+            old_item = next(old, None)
+            new_item = next(new, None)
+
+
+def diff_paths(
+    old_path: Path,
+    new_path: Path,
+    chunk_size: int = 100000,
+    rel_tol: float = DISTANCE_REL_TOL,
+    abs_tol: float = DISTANCE_ABS_TOL,
+):
+    """Yield change records between the alignments in two reports or stores"""
+    yield from diff_alignments(
+        iter_sorted(old_path, chunk_size),
+        iter_sorted(new_path, chunk_size),
+        rel_tol=rel_tol,
+        abs_tol=abs_tol,
+    )
+
+
+def _compare(old: dict, new: dict, rel_tol: float, abs_tol: float) -> dict:
+    changes = dict()
+    for field in ["modes", "authorities"]:
+        before = set(old.get(field, list()))
+        after = set(new.get(field, list()))
+        if before != after:
+            changes[field] = {
+                "added": sorted(after - before),
+                "removed": sorted(before - after),
+            }
+    if old.get("proximity") != new.get("proximity"):
+        changes["proximity"] = {
+            "old": old.get("proximity"),
+            "new": new.get("proximity"),
+        }
+    for field in ["centroid_distance_dd", "centroid_distance_m"]:
+        before = old.get(field)
+        after = new.get(field)
+        if before is None or after is None:
+            if before != after:
+                changes[field] = {"old": before, "new": after}
+        elif not math.isclose(before, after, rel_tol=rel_tol, abs_tol=abs_tol):
+            changes[field] = {"old": before, "new": after, "delta": after - before}
+    return changes
+
+
+def _trim(record: dict) -> dict:
+    return {k: record[k] for k in DIFF_FIELDS if k in record}
+
+
+def _spill(chunk: list, path: Path) -> Path:
+    chunk.sort(key=lambda item: item[0])
+    with open(path, "w", encoding="utf-8") as f:
+        for item in chunk:
+            f.write(json.dumps(item, ensure_ascii=False))
+            f.write("\n")
+    return path
+
+
+def _read_chunk(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            key, record = json.loads(line)
+            yield (key, record)
@@ -17,6 +17,7 @@ from logging import getLogger
 import os
 from pathlib import Path
 from pleiades_aligner.dataset import DataSet, Place
+from pleiades_aligner.stats import Progress
 from pprint import pformat
 from shapely import Point
 from shapely.geometry import shape
@@ -28,17 +29,51 @@ FIELDNAME_GUESSES = {
     "longitude": ["lon", "long", "longitude"],
 }
 
+# what to do with each place's raw properties once the ingester has digested them
+RAW_PROPERTIES_POLICIES = ["keep", "compress", "drop"]
+
 
 class IngesterBase:
-    def __init__(self, namespace: str, filepath: Path):
+    def __init__(self, namespace: str, filepath: Path, raw_properties: str = "keep"):
         self.logger = getLogger(f"{namespace.capitalize()}Ingester")
         self.data = DataSet(namespace=namespace)
         self.filepath = filepath
+        if raw_properties not in RAW_PROPERTIES_POLICIES:
+            raise ValueError(
+                f"Expected one of {RAW_PROPERTIES_POLICIES} for raw_properties, but got '{raw_properties}'"
+            )
+        self.raw_properties_policy = raw_properties
+        self.stats = None  # if set, progress is reported through these run statistics
+
+    def __getstate__(self):
+        # run statistics belong to the run, not to the ingested data
+        state = self.__dict__.copy()
+        state["stats"] = None
+        return state
+
+    def _progress(self, total: int = None) -> Progress:
+        """Return a Progress for a loop over total items being ingested"""
+        stage = f"ingest {self.data.namespace}"
+        if self.stats is None:
+            return Progress(stage, total)
+        return self.stats.progress(total, stage=stage)
+
+    def _apply_raw_properties_policy(self):
+        """
+        Drop or compress raw properties according to the policy set at initialization
+        Call only after _digest() has finished using the raw properties
+        """
+        if self.raw_properties_policy == "drop":
+            for place in self.data:
+                del place.raw_properties
+        elif self.raw_properties_policy == "compress":
+            for place in self.data:
+                place.compress_raw_properties()
 
     def _set_alignments_from_properties(self, alignment_fields: dict):
         if set(alignment_fields.keys()) == {"fieldname", "namespaces"}:
             fn = alignment_fields["fieldname"]
-            for place in self.data.places:
+            for place in self.data:
                 alignment_ids = set()
                 for meta in alignment_fields["namespaces"]:
                     these_alignment_ids = self._get_alignment_id(place, fn, meta)
@@ -46,7 +81,7 @@ class IngesterBase:
                         alignment_ids.update(these_alignment_ids)
                 place.alignments = alignment_ids
         else:
-            for place in self.data.places:
+            for place in self.data:
                 alignment_ids = set()
                 for fn, meta in alignment_fields.items():
                     these_alignment_ids = self._get_alignment_id(place, fn, meta)
@@ -85,12 +120,12 @@ class IngesterBase:
     def _set_feature_types_from_properties(
         self, fieldname: str, feature_types: dict, aliases: dict = dict()
     ):
-        for place in self.data.places:
+        for place in self.data:
             type_codes = self._norm_string(place.raw_properties[fieldname]).split(",")
             type_codes = [c.strip() for c in type_codes if c.strip()]
             for type_code in type_codes:
                 try:
-                    place.feature_types.add(feature_types[type_code])
+                    place.add_feature_types(feature_types[type_code])
                 except KeyError:
                     raise KeyError(
                         f"Unsupported feature type code '{type_code}' in field {fieldname}"
@@ -101,11 +136,10 @@ class IngesterBase:
                     except KeyError:
                         pass
                     else:
-                        for this in these:
-                            place.feature_types.add(this)
+                        place.add_feature_types(these)
 
     def _set_titles_from_properties(self, format_string: str):
-        for place in self.data.places:
+        for place in self.data:
             try:
                 place.title = format_string.format(**place.raw_properties, id=place.id)
             except KeyError as err:
@@ -117,7 +151,7 @@ class IngesterBase:
         return normalize_space(normalize_unicode(s))
 
     def _set_names_from_properties(self, fieldnames: list):
-        for place in self.data.places:
+        for place in self.data:
             names = set()
             for fn in fieldnames:
                 raw = place.raw_properties[fn]
@@ -140,8 +174,10 @@ class IngesterBase:
 
 
 class IngesterCSV(IngesterBase):
-    def __init__(self, namespace: str, filepath: Path = None):
-        IngesterBase.__init__(self, namespace, filepath)
+    def __init__(
+        self, namespace: str, filepath: Path = None, raw_properties: str = "keep"
+    ):
+        IngesterBase.__init__(self, namespace, filepath, raw_properties)
 
     def ingest(self, unique_rows=True, id_clean=dict()):
         raw_data, fieldnames = self._load_csv()
@@ -173,7 +209,9 @@ class IngesterCSV(IngesterBase):
         lon_key = self._guess_csv_field(fieldnames, FIELDNAME_GUESSES["longitude"])
         other_keys = [k for k in fieldnames if k != id_key]
         places = dict()
+        progress = self._progress(len(raw_data))
         for datum in raw_data:
+            progress.update()
             this_pid = self._clean_id(datum[id_key], id_clean)
             try:
                 place = places[this_pid]
@@ -195,6 +233,7 @@ class IngesterCSV(IngesterBase):
                     elif isinstance(values, set):
                         place.raw_properties[k].add(new_values)
             places[this_pid] = place
+        progress.finish()
         if places:
             self.data.places = list(places.values())
 
@@ -217,7 +256,9 @@ class IngesterCSV(IngesterBase):
         lon_key = self._guess_csv_field(fieldnames, FIELDNAME_GUESSES["longitude"])
         other_keys = [k for k in fieldnames if k != id_key]
         places = list()
+        progress = self._progress(len(raw_data))
         for datum in raw_data:
+            progress.update()
             this_id = self._clean_id(datum[id_key], id_clean)
             p = Place(id=this_id)
             if lat_key and lon_key:
@@ -225,6 +266,7 @@ class IngesterCSV(IngesterBase):
                 other_keys = [k for k in other_keys if k not in (lat_key, lon_key)]
             p.raw_properties = {k: datum[k] for k in other_keys}
             places.append(p)
+        progress.finish()
         if places:
             self.data.places = places
 
@@ -286,16 +328,24 @@ class IngesterCSV(IngesterBase):
 
 
 class IngesterWHGJSON(IngesterBase):
-    def __init__(self, namespace: str, filepath: Path = None, base_uri: str = None):
+    def __init__(
+        self,
+        namespace: str,
+        filepath: Path = None,
+        base_uri: str = None,
+        raw_properties: str = "keep",
+    ):
         self.base_uri = base_uri
-        IngesterBase.__init__(self, namespace, filepath)
+        IngesterBase.__init__(self, namespace, filepath, raw_properties)
 
     def ingest(self, id_clean=dict()):
         with open(self.filepath, "r", encoding="utf-8") as f:
             colxn = json.load(f)
         del f
         places = list()
+        progress = self._progress(len(colxn["features"]))
         for feat in colxn["features"]:
+            progress.update()
             props = {
                 "title": self._norm_string(feat["properties"]["title"]),
                 "types": [t["identifier"].strip() for t in feat["types"]],
@@ -320,12 +370,12 @@ class IngesterWHGJSON(IngesterBase):
                     this_id = this_id[len(self.base_uri) :]
             p = Place(
                 id=this_id,
-                base_uri=self.base_uri,
                 geometries=shape(feat["geometry"]["geometries"][0]),
                 names=[self._norm_string(n["toponym"]) for n in feat["names"]],
                 raw_properties=props,
             )
             places.append(p)
+        progress.finish()
 
         if places:
             self.data.places = places
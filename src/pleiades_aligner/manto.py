@@ -15,8 +15,10 @@ import re
 
 
 class IngesterMANTO(IngesterCSV):
-    def __init__(self, filepath: Path):
-        IngesterCSV.__init__(self, namespace="manto", filepath=filepath)
+    def __init__(self, filepath: Path, raw_properties: str = "keep"):
+        IngesterCSV.__init__(
+            self, namespace="manto", filepath=filepath, raw_properties=raw_properties
+        )
         self.logger = getLogger("IngesterMANTO")
         self.base_uri = "https://resource.manto.unh.edu/"
         self.rx_name_symbol = re.compile(r"^([^Α-Ωα-ωA-Za-zἌἨ]).+$")
@@ -49,6 +51,7 @@ class IngesterMANTO(IngesterCSV):
     def ingest(self):
         IngesterCSV.ingest(self, unique_rows=False)
         self._digest()
+        self._apply_raw_properties_policy()
 
     def _digest(self):
         self._set_titles_from_properties("{id}: {Name_1}")
@@ -69,7 +72,7 @@ class IngesterMANTO(IngesterCSV):
 
     def _separate_names_and_types(self):
         # some manto fields have embedded emojis for place type
-        for p in self.data.places:
+        for p in self.data:
             new_names = set()
             for n in p.names:
                 m = self.rx_name_symbol.match(n)
@@ -82,32 +85,32 @@ class IngesterMANTO(IngesterCSV):
                             f"Unrecognized MANTO symbol '{symbol}' in '{n}' for {p.uri}"
                         )
                     new_names.add(n[1:].strip())
-                    p.feature_types.add(st)
+                    p.add_feature_types(st)
                 else:
                     new_names.add(n)
             if p.names != new_names:
                 p.names = new_names
         # some manto fields have prefix words that indicate place type
-        for p in self.data.places:
+        for p in self.data:
             new_names = set()
             for n in p.names:
                 m = self.rx_name_prefix.match(n)
                 if m:
-                    p.feature_types.add(self.feature_types[m.group(1)])
+                    p.add_feature_types(self.feature_types[m.group(1)])
                     new_names.add(self._norm_string(n[len(m.group(1)) :]))
             if new_names:
                 p.add_names(new_names)
         # some manto fields have parenthetic words that indicate place type
-        for p in self.data.places:
+        for p in self.data:
             for k, v in p.raw_properties.items():
                 if k in ["Name_1", "Information", "Minimal Disambiguation"] and v:
                     m = self.rx_name_parenthetical.match(v)
                     if m:
-                        p.feature_types.add(self.feature_types[m.group(1)])
+                        p.add_feature_types(self.feature_types[m.group(1)])
         # some manto fields have plain-text substrings that indicate place type
-        for p in self.data.places:
+        for p in self.data:
             for k, v in p.raw_properties.items():
                 if k in ["Name_1", "Information", "Minimal Disambiguation"] and v:
                     m = self.rx_name_substring.match(v)
                     if m:
-                        p.feature_types.add(self.feature_types[m.group(1)])
+                        p.add_feature_types(self.feature_types[m.group(1)])
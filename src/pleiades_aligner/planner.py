@@ -0,0 +1,74 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Plan cheap tests that prune proximity candidates before their exact distances are computed
+"""
+
+
+class PipelinePlan:
+    """
+    Tests, planned from the configuration of a run, that discard proximity candidates
+    without changing its report. Each pair of places in a bin is tested, cheapest first:
+    - the namespaces of the pair: alignments with a namespace the report ignores are not
+      reported
+    - the distance between bounding boxes, which never exceeds the exact distance, against
+      the widest category threshold (always applied)
+    - shared names (normalized as by toponymy), if the report requires toponymy
+    - shared feature types (as bitmasks), if the report requires typology
+    Only the bounding box test holds for pairs of namespaces that an inference rule reads
+    (inference uses their alignments whatever the report requires) and when exhaustive is
+    True, for runs that keep every alignment (in a store, or a saved state).
+    """
+
+    def __init__(
+        self,
+        require_modes: list = list(),
+        ignore_place_namespaces: list = list(),
+        inference_pairs: list = list(),
+        exhaustive: bool = False,
+    ):
+        self.require_modes = sorted(set(require_modes))
+        self.ignore_place_namespaces = sorted(set(ignore_place_namespaces))
+        self.inference_pairs = {frozenset(pair) for pair in inference_pairs}
+        self.exhaustive = exhaustive
+
+    def rules(self, namespace_a: str, namespace_b: str) -> tuple:
+        """
+        Return whether to skip a pair of namespaces entirely, and whether its places must
+        share names and feature types
+        """
+        if self.exhaustive or {namespace_a, namespace_b} in self.inference_pairs:
+            return (False, False, False)
+        return (
+            bool({namespace_a, namespace_b}.intersection(self.ignore_place_namespaces)),
+            "toponymy" in self.require_modes,
+            "typology" in self.require_modes,
+        )
+
+    def asdict(self) -> dict:
+        return {
+            "require_modes": self.require_modes,
+            "ignore_place_namespaces": self.ignore_place_namespaces,
+            "inference_pairs": sorted([sorted(p) for p in self.inference_pairs]),
+            "exhaustive": self.exhaustive,
+        }
+
+
+def plan_pipeline(config: dict, exhaustive: bool = False) -> PipelinePlan:
+    """Return the plan for a run configured as by an align.py config file"""
+    report = config.get("report", dict())
+    return PipelinePlan(
+        require_modes=report.get("require_modes", list()),
+        ignore_place_namespaces=report.get("ignore_place_namespaces", list()),
+        inference_pairs=[
+            (rule[a], rule["aligned_namespace"])
+            for rule in config.get("infer", list())
+            for a in ["primary_namespace", "inference_namespace"]
+        ],
+        exhaustive=exhaustive,
+    )
@@ -30,15 +30,31 @@ SUPPORTED_ALIGNMENTS = {
 
 
 class IngesterPleiades(IngesterBase):
-    def __init__(self, filepath: Path):
-        IngesterBase.__init__(self, namespace="pleiades", filepath=filepath)
+    def __init__(self, filepath: Path, raw_properties: str = "keep"):
+        IngesterBase.__init__(
+            self,
+            namespace="pleiades",
+            filepath=filepath,
+            raw_properties=raw_properties,
+        )
         self.logger = getLogger("IngesterPleiades")
         self.base_uri = "https://pleiades.stoa.org/places/"
         self._pleiades_file_system = PleiadesFilesystem(root=filepath)
 
+    def __getstate__(self):
+        # the filesystem reader is recreated on demand rather than pickled
+        state = IngesterBase.__getstate__(self)
+        state["_pleiades_file_system"] = None
+        return state
+
     def ingest(self):
+        if self._pleiades_file_system is None:
+            self._pleiades_file_system = PleiadesFilesystem(root=self.filepath)
         places = list()
-        for pid in self._pleiades_file_system.get_pids():
+        pids = list(self._pleiades_file_system.get_pids())
+        progress = self._progress(len(pids))
+        for pid in pids:
+            progress.update()
             datum = self._pleiades_file_system.get(pid)
             p = Place(id=pid)
 
@@ -66,7 +82,10 @@ class IngesterPleiades(IngesterBase):
                     if p_loc["accuracy_value"]:
                         if isinstance(p_loc["accuracy_value"], float):
                             p.set_accuracy_if_larger(
-                                g.centroid, p_loc["accuracy_value"], "meters"
+                                g.centroid,
+                                p_loc["accuracy_value"],
+                                "meters",
+                                defer=True,
                             )
 
             # names
@@ -84,9 +103,12 @@ class IngesterPleiades(IngesterBase):
 
             # place types
             p.feature_types = set(datum["placeTypes"])
+        progress.finish()
         if places:
             self.data.places = places
+            self.data.apply_deferred_accuracy()
         self._digest()
+        self._apply_raw_properties_policy()
 
     def _digest(self):
         pass
@@ -0,0 +1,280 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Write alignment reports
+"""
+import json
+from logging import getLogger
+import numpy
+from pathlib import Path
+from shapely import to_wkb, to_wkt
+from typing import Iterable, TextIO
+
+REPORT_FORMATS = ["json", "jsonl", "normalized"]
+GEOMETRY_ENCODINGS = ["wkt", "wkb"]
+
+
+def iter_report(path: Path):
+    """
+    Yield alignment records from a report file in any format written by ReportWriter
+    Records from normalized reports get their own copy of each aligned place's fragment,
+    embedded under its namespace just as in the other formats; JSON Lines reports are
+    read lazily, one line at a time
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        first_line = f.readline()
+        if not first_line.strip():
+            # a JSON Lines report of no alignments is empty
+            return
+        f.seek(0)
+        if first_line.lstrip().startswith("["):
+            yield from json.load(f)
+            return
+        try:
+            json.loads(first_line)
+        except json.JSONDecodeError:
+            report = json.load(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+    places = report["places"]
+    for record in report["alignments"]:
+        for pid in record["aligned_ids"]:
+            try:
+                fragment = places[pid]
+            except KeyError:
+                continue
+            record[pid.split(":")[0]] = dict(fragment)
+        yield record
+
+
+def load_report(path: Path) -> list:
+    """Load all alignment records from a report file in any format written by ReportWriter"""
+    return list(iter_report(path))
+
+
+def filter_alignments(
+    alignments: Iterable,
+    ignore_authority_namespaces: list = list(),
+    require_modes: list = list(),
+):
+    """
+    Lazily filter alignments according to report parameters
+    - ignore alignments relying only on authority namespaces explicitly excluded
+    - ignore alignments that aren't based on all the required alignment modes
+    """
+    ignore_authority_namespaces = set(ignore_authority_namespaces)
+    require_modes = set(require_modes)
+    for a in alignments:
+        if a.authority_namespaces.intersection(ignore_authority_namespaces):
+            continue
+        if not require_modes.issubset(a.modes):
+            continue
+        yield a
+
+
+def group_alignments(alignments: Iterable, namespace: str) -> list:
+    """
+    Order alignments by the full id of the place they align from namespace, so that all the
+    alignments of each such place are adjacent (as prioritize3.py --stream expects);
+    alignments not involving namespace come last, in key order
+    """
+
+    def key(a):
+        for pid in a.aligned_ids:
+            if pid.split(":")[0] == namespace:
+                return (0, pid, repr(a))
+        return (1, "", repr(a))
+
+    return sorted(alignments, key=key)
+
+
+class ReportWriter:
+    """
+    Serialize alignments one record at a time, enriched with information about the aligned places
+
+    Records are written as soon as they are ready, so the report is never held in memory:
+    - json: a pretty-printed JSON array, identical to json.dumps(records, indent=4)
+    - jsonl: JSON Lines, one compact record per line
+    - normalized: a JSON object with two tables, one compact record per line: "alignments",
+      whose records refer to places only by the full ids in aligned_ids, and "places",
+      which holds each referenced place's fragment once, keyed by full id
+
+    Each referenced place is serialized only once: its fragment is cached by full id and
+    reused by every record that refers to it. Call prime_fragments() first to encode the
+    geometries of all referenced places in a single vectorized pass. Geometries are encoded
+    as WKT or as hex WKB, according to geometry_encoding.
+    """
+
+    def __init__(
+        self,
+        ingesters: dict,
+        stream: TextIO,
+        format: str = "json",
+        ignore_place_namespaces: list = list(),
+        geometry_encoding: str = "wkt",
+    ):
+        self.logger = getLogger("ReportWriter")
+        if format not in REPORT_FORMATS:
+            raise ValueError(
+                f"Expected one of {REPORT_FORMATS} for format, but got '{format}'"
+            )
+        if geometry_encoding not in GEOMETRY_ENCODINGS:
+            raise ValueError(
+                f"Expected one of {GEOMETRY_ENCODINGS} for geometry_encoding, but got '{geometry_encoding}'"
+            )
+        self.ingesters = ingesters
+        self.stream = stream
+        self.format = format
+        self.ignore_place_namespaces = set(ignore_place_namespaces)
+        self.geometry_encoding = geometry_encoding
+        self.count = 0
+        self._fragments = dict()
+
+    def write(self, alignments: Iterable) -> int:
+        """Write a complete report for alignments and return the number of records written"""
+        self.count = 0
+        if self.format == "normalized":
+            return self._write_normalized(alignments)
+        if self.format == "json":
+            self.stream.write("[")
+        for a in alignments:
+            record = self.make_record(a)
+            if record is None:
+                continue
+            self._write_record(record)
+            self.count += 1
+        if self.format == "json":
+            if self.count:
+                self.stream.write("\n")
+            self.stream.write("]\n")
+        return self.count
+
+    def make_record(self, alignment, embed_places: bool = True) -> dict:
+        """
+        Convert an alignment to a report record with essential information about the aligned places
+        Returns None if the alignment involves a place from an ignored namespace
+        """
+        if self._is_ignored(alignment):
+            return None
+        record = alignment.asdict()
+        if embed_places:
+            for pid in alignment.aligned_ids:
+                place = self._get_place(pid)
+                if place is not None:
+                    record[pid.split(":")[0]] = self.place_fragment(pid, place)
+        return record
+
+    def place_fragment(self, full_id: str, place) -> dict:
+        """Return the (cached) report fragment for a place"""
+        try:
+            return self._fragments[full_id]
+        except KeyError:
+            centroid, footprint = self._encode([place.centroid, place.footprint])
+            fragment = self._make_fragment(full_id, place, centroid, footprint)
+            self._fragments[full_id] = fragment
+            return fragment
+
+    def prime_fragments(self, alignments: Iterable) -> int:
+        """
+        Cache fragments for all places referenced by alignments, encoding their geometries
+        in one vectorized pass; returns the number of fragments added to the cache
+        """
+        pending = dict()
+        for a in alignments:
+            if self._is_ignored(a):
+                continue
+            for pid in a.aligned_ids:
+                if pid in self._fragments or pid in pending:
+                    continue
+                place = self._get_place(pid)
+                if place is not None:
+                    pending[pid] = place
+        places = list(pending.values())
+        centroids = self._encode([p.centroid for p in places])
+        footprints = self._encode([p.footprint for p in places])
+        for full_id, place, centroid, footprint in zip(
+            pending.keys(), places, centroids, footprints
+        ):
+            self._fragments[full_id] = self._make_fragment(
+                full_id, place, centroid, footprint
+            )
+        return len(places)
+
+    def _encode(self, geometries: list) -> list:
+        array = numpy.empty(len(geometries), dtype=object)
+        array[:] = geometries
+        if self.geometry_encoding == "wkt":
+            return to_wkt(array).tolist()
+        return to_wkb(array, hex=True).tolist()
+
+    def _get_place(self, full_id: str):
+        """Return the ingested place for a full id, or None if it has not been ingested"""
+        namespace, this_id = full_id.split(":")
+        try:
+            return self.ingesters[namespace].data.get_place_by_id(this_id)
+        except KeyError:
+            return None
+
+    def _is_ignored(self, alignment) -> bool:
+        return bool(alignment.id_namespaces.intersection(self.ignore_place_namespaces))
+
+    def _make_fragment(self, full_id: str, place, centroid, footprint) -> dict:
+        namespace = full_id.split(":")[0]
+        return {
+            "id": place.id,
+            "title": place.title,
+            "names": list(place.names),
+            "feature_types": list(place.feature_types),
+            "uri": self.ingesters[namespace].base_uri + place.id,
+            "centroid": centroid,
+            "footprint": footprint,
+        }
+
+    def _write_normalized(self, alignments: Iterable) -> int:
+        referenced = dict()
+        self.stream.write('{"alignments": [')
+        for a in alignments:
+            record = self.make_record(a, embed_places=False)
+            if record is None:
+                continue
+            for pid in a.aligned_ids:
+                if pid in referenced:
+                    continue
+                place = self._get_place(pid)
+                if place is not None:
+                    referenced[pid] = self.place_fragment(pid, place)
+            if self.count:
+                self.stream.write(",")
+            self.stream.write("\n")
+            self.stream.write(self._compact(record))
+            self.count += 1
+        self.stream.write('\n],\n"places": {')
+        for i, (pid, fragment) in enumerate(referenced.items()):
+            if i:
+                self.stream.write(",")
+            self.stream.write("\n")
+            self.stream.write(f"{self._compact(pid)}: {self._compact(fragment)}")
+        self.stream.write("\n}}\n")
+        return self.count
+
+    def _compact(self, obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, sort_keys=True)
+
+    def _write_record(self, record: dict):
+        if self.format == "json":
+            serial = json.dumps(record, ensure_ascii=False, indent=4, sort_keys=True)
+            if self.count:
+                self.stream.write(",")
+            self.stream.write("\n    ")
+            self.stream.write(serial.replace("\n", "\n    "))
+        else:
+            self.stream.write(self._compact(record))
+            self.stream.write("\n")
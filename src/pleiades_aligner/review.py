@@ -0,0 +1,186 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Random access to prioritized place groups, and persistent review state, for the spoonout tools
+"""
+from datetime import datetime, timezone
+import json
+from logging import getLogger
+import os
+from pathlib import Path
+
+INDEX_FORMAT = 1  # increment whenever the index changes shape
+
+
+class GroupIndex:
+    """
+    A sidecar offset index over the place groups in a prioritized output, so that any group
+    can be read with a single seek
+
+    Prioritized outputs are either JSON Lines, one group per line, as written by
+    prioritize3.py --stream, or a single JSON object of categories, each holding groups keyed
+    by id (prioritize2.py, prioritize3.py) or a list of groups (prioritize.py). JSON Lines are
+    indexed in place; the groups of a JSON object are copied once, in order, to a JSON Lines
+    sidecar, which is indexed instead. The index (and any sidecar) is rebuilt whenever the
+    size or modification time of the prioritized output changes.
+    """
+
+    def __init__(self, path: Path):
+        self.logger = getLogger("GroupIndex")
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+        self.groups_path = self.path.with_name(self.path.name + ".groups.jsonl")
+        self._entries = None
+        self.data_path = None
+        self.rebuilt = False  # whether the index was (re)built rather than loaded
+        try:
+            self._load()
+        except (FileNotFoundError, ValueError, KeyError) as err:
+            self.logger.info(f"Building group index for {self.path} ({err})")
+            self.build()
+            self.rebuilt = True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, position: int) -> tuple:
+        """Return (category, id, group) for the group at position"""
+        category, group_id, offset, length = self._entries[position]
+        with open(self.data_path, "rb") as f:
+            f.seek(offset)
+            record = json.loads(f.read(length))
+        return (category, group_id, record["places"])
+
+    def entry(self, position: int) -> tuple:
+        """Return (category, id) for the group at position, without reading the group"""
+        category, group_id, offset, length = self._entries[position]
+        return (category, group_id)
+
+    def ids(self) -> list:
+        return [entry[1] for entry in self._entries]
+
+    def build(self):
+        """(Re)build the index, and the JSON Lines sidecar if the output is a JSON object"""
+        with open(self.path, "r", encoding="utf-8") as f:
+            first_line = f.readline()
+        try:
+            record = json.loads(first_line)
+        except json.JSONDecodeError:
+            record = None
+        if isinstance(record, dict) and "places" in record:
+            self.data_path = self.path
+        else:
+            self._copy_groups()
+            self.data_path = self.groups_path
+        entries = list()
+        with open(self.data_path, "rb") as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    entries.append(
+                        [record["category"], record["id"], offset, len(line)]
+                    )
+                offset += len(line)
+        self._entries = entries
+        index = {
+            "format": INDEX_FORMAT,
+            "source": self._source_stat(),
+            "data": self.data_path.name,
+            "entries": entries,
+        }
+        with open(self.index_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False)
+        self.logger.info(f"Indexed {len(entries)} groups in {self.data_path}")
+
+    def _copy_groups(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            categories = json.load(f)
+        with open(self.groups_path, "w", encoding="utf-8") as f:
+            for category, groups in categories.items():
+                if isinstance(groups, list):
+                    # groups listed without ids are identified by category and position
+                    groups = {f"{category}/{i}": g for i, g in enumerate(groups)}
+                for group_id, group in groups.items():
+                    record = {"category": category, "id": group_id, "places": group}
+                    f.write(json.dumps(record, ensure_ascii=False))
+                    f.write("\n")
+
+    def _load(self):
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index["format"] != INDEX_FORMAT:
+            raise ValueError(f"index format {index['format']} is out of date")
+        if index["source"] != self._source_stat():
+            raise ValueError(f"{self.path.name} has changed since it was indexed")
+        self.data_path = self.path.with_name(index["data"])
+        if not self.data_path.exists():
+            raise FileNotFoundError(self.data_path)
+        self._entries = index["entries"]
+
+    def _source_stat(self) -> list:
+        stat = self.path.stat()
+        return [stat.st_size, stat.st_mtime_ns]
+
+
+class ReviewLog:
+    """
+    Persistent review state kept beside a prioritized output: an append-only log of the
+    decisions made on groups, by id, and a cursor holding the position of the next group
+    to review, so that review resumes where it stopped and decided groups are skipped
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.log_path = self.path.with_name(self.path.name + ".decisions.jsonl")
+        self.cursor_path = self.path.with_name(self.path.name + ".cursor")
+        self.decisions = dict()
+        try:
+            f = open(self.log_path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            pass
+        else:
+            with f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        # later decisions on a group supersede earlier ones
+                        self.decisions[entry["id"]] = entry["decision"]
+        try:
+            with open(self.cursor_path, "r", encoding="utf-8") as f:
+                self._cursor = json.load(f)["position"]
+        except FileNotFoundError:
+            self._cursor = 0
+
+    @property
+    def cursor(self) -> int:
+        return self._cursor
+
+    @cursor.setter
+    def cursor(self, position: int):
+        self._cursor = position
+        # write and rename, so that an interrupted write cannot leave a corrupt cursor
+        tmp_path = self.cursor_path.with_name(self.cursor_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"position": position}, f)
+        os.replace(tmp_path, self.cursor_path)
+
+    def decide(self, group_id: str, decision: str):
+        """Record a decision on a group"""
+        entry = {
+            "id": group_id,
+            "decision": decision,
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False))
+            f.write("\n")
+        self.decisions[group_id] = decision
+
+    def is_decided(self, group_id: str) -> bool:
+        return group_id in self.decisions
@@ -0,0 +1,221 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Answer single-place alignment queries over HTTP from data kept in memory between queries
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+from logging import getLogger
+from pathlib import Path
+from pleiades_aligner.aligner import Aligner
+from pleiades_aligner.dataset import Place
+from pleiades_aligner.store import alignment_key
+from shapely.geometry import shape
+import socketserver
+from urllib.parse import parse_qs, urlparse
+
+logger = getLogger(__name__)
+
+
+def place_from_record(record: dict) -> tuple:
+    """
+    Return the namespace and a Place built from a JSON place record, with keys namespace,
+    id, and optionally title, names, feature_types, alignments (full ids), geometry
+    (GeoJSON), and accuracy (decimal degrees)
+    """
+    try:
+        namespace = record["namespace"]
+        pid = str(record["id"])
+    except (KeyError, TypeError) as err:
+        raise ValueError("Expected a place record with namespace and id") from err
+    place = Place(id=pid)
+    if record.get("title"):
+        place.title = record["title"]
+    place.names = list(record.get("names", list()))
+    place.feature_types = list(record.get("feature_types", list()))
+    place.alignments = list(record.get("alignments", list()))
+    if record.get("geometry"):
+        place.geometries = shape(record["geometry"])
+        if record.get("accuracy"):
+            place.set_accuracy_if_larger(None, float(record["accuracy"]), "DD")
+    return namespace, place
+
+
+class AlignmentService:
+    """
+    Align single places against an aligner kept in memory, with its datasets' name and
+    spatial indexes built once, up front, and kept current as places are updated
+    config supplies alignment_modes, proximity_categories, and secondary_modes, as in an
+    align.py config file. Inference, a second pass over whole namespaces, is left to batch
+    runs: inferred alignments involving updated places are dropped until the next one.
+    """
+
+    def __init__(self, aligner: Aligner, config: dict):
+        self.aligner = aligner
+        self.modes = config["alignment_modes"]
+        self.proximity_categories = config["proximity_categories"]
+        self.secondary_modes = config["secondary_modes"]
+        for ingester in self.aligner.ingesters.values():
+            ingester.data.build_spatial_index()
+
+    def align_place(self, record: dict) -> list:
+        """Return the alignments a place record would have, without ingesting it"""
+        namespace, place = place_from_record(record)
+        alignments = self.aligner.align_place(
+            place,
+            namespace=namespace,
+            modes=self.modes + list(self.secondary_modes.keys()),
+            proximity_categories=self.proximity_categories,
+            apply_to_modes=self.secondary_modes,
+        )
+        return [a.asdict() for a in sorted(alignments, key=alignment_key)]
+
+    def alignments_for(self, full_id: str) -> list:
+        """Return the current alignments of the place with full_id (namespace:id)"""
+        try:
+            alignments = self.aligner.alignments_by_full_id(full_id)
+        except KeyError:
+            alignments = list()
+        return [a.asdict() for a in sorted(alignments, key=alignment_key)]
+
+    def update(self, records: list = list(), removed: list = list()) -> dict:
+        """
+        Add or replace places from records, remove the places with full ids in removed,
+        and re-align them all
+        """
+        changes = list()
+        for record in records:
+            namespace, place = place_from_record(record)
+            changes.append((namespace, place))
+        for full_id in removed:
+            namespace, pid = full_id.split(":", 1)
+            changes.append((namespace, pid))
+        # check everything before changing anything
+        for namespace, change in changes:
+            if namespace not in self.aligner.ingesters:
+                raise KeyError(f"No ingested namespace '{namespace}'")
+            if not isinstance(change, Place):
+                if change not in self.aligner.ingesters[namespace].data:
+                    raise KeyError(f"No ingested place '{namespace}:{change}'")
+        affected = set()
+        for namespace, change in changes:
+            data = self.aligner.ingesters[namespace].data
+            if isinstance(change, Place):
+                data.add_place(change)
+                affected.add(":".join((namespace, change.id)))
+            else:
+                data.remove_place(change)
+                affected.add(":".join((namespace, change)))
+        realigned = self.aligner.realign(
+            affected,
+            self.modes,
+            proximity_categories=self.proximity_categories,
+            secondary_modes=self.secondary_modes,
+        )
+        return {"realigned": sorted(affected), "alignments": len(realigned)}
+
+    def status(self) -> dict:
+        return {
+            "places": {
+                ns: len(ingester.data)
+                for ns, ingester in self.aligner.ingesters.items()
+            },
+            "alignments": len(self.aligner.alignments),
+        }
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON endpoints of an AlignmentService:
+    - GET /alignments?id=namespace:id
+    - GET /status
+    - POST /align_place (a place record)
+    - POST /update ({"places": [place records], "removed": [full ids]})
+    """
+
+    server_version = "pleiades_aligner"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        service = self.server.service
+        if url.path == "/alignments":
+            ids = parse_qs(url.query).get("id")
+            if not ids:
+                self._send(400, {"error": "Expected an id parameter"})
+            else:
+                self._send(200, service.alignments_for(ids[0]))
+        elif url.path == "/status":
+            self._send(200, service.status())
+        else:
+            self._send(404, {"error": f"No endpoint {url.path}"})
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length).decode("utf-8"))
+        except ValueError as err:
+            self._send(400, {"error": f"Expected a JSON body: {err}"})
+            return
+        try:
+            if self.path == "/align_place":
+                self._send(200, service.align_place(body))
+            elif self.path == "/update":
+                self._send(
+                    200,
+                    service.update(
+                        records=body.get("places", list()),
+                        removed=body.get("removed", list()),
+                    ),
+                )
+            else:
+                self._send(404, {"error": f"No endpoint {self.path}"})
+        except KeyError as err:
+            # str() of a KeyError quotes its message
+            self._send(404, {"error": err.args[0] if err.args else str(err)})
+        except (TypeError, ValueError, AttributeError) as err:
+            self._send(400, {"error": str(err)})
+
+    def _send(self, status: int, content):
+        data = json.dumps(content, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # clients of a Unix domain socket have no address
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "unix"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class UnixHTTPServer(socketserver.UnixStreamServer):
+    """An HTTP server listening on a Unix domain socket rather than a TCP port"""
+
+
+def make_server(
+    service: AlignmentService,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    socket_path: Path = None,
+):
+    """
+    Return an HTTP server for service, on host and port or on a Unix domain socket
+    Requests are handled one at a time, so queries and updates never interleave.
+    """
+    if socket_path is not None:
+        server = UnixHTTPServer(str(socket_path), ServiceRequestHandler)
+    else:
+        server = HTTPServer((host, port), ServiceRequestHandler)
+    server.service = service
+    return server
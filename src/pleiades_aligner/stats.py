@@ -0,0 +1,423 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Record timing and memory statistics for the stages of a run
+"""
+from contextlib import contextmanager
+import cProfile
+from fnmatch import fnmatchcase
+from io import StringIO
+import json
+from logging import getLogger
+from pathlib import Path
+import pstats
+import re
+from statistics import median
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+STATS_FORMAT = 1  # increment whenever saved statistics change shape
+COUNTS = ["items_in", "items_out", "candidates"]
+PROFILES = ["cpu", "mem", "both"]
+PROGRESS_INTERVAL = 10.0  # minimum seconds between progress events
+PROFILER_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, cProfile.__file__),
+    tracemalloc.Filter(False, pstats.__file__),
+]
+
+
+def peak_rss() -> int:
+    """Return the peak resident set size of this process in bytes, or None if unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024  # kilobytes elsewhere
+
+
+class Stats:
+    """
+    Per-stage statistics of a run, in the order the stages ran
+
+    Each stage records its wall and CPU time, the peak resident set size of the process at
+    its end and how much the stage raised it, counts of items in and out and of candidate
+    pairs evaluated (as counted by the code run during the stage), and, when tracemalloc is
+    tracing, the peak of Python allocations above their level at the start of the stage.
+    Tracing slows everything down, so it is started only if trace_memory is True (or by the
+    caller). The counts of nested stages are kept by the innermost stage alone.
+
+    Stages can also be profiled: if profile is "cpu", "mem", or "both", every stage whose
+    name matches profile_stage (a glob pattern, e.g. "align proximity" or "ingest *") runs
+    under cProfile, tracemalloc, or both. Each profiled stage writes its pstats file and/or
+    tracemalloc snapshot to profile_dir, and logs the profile_top functions by cumulative
+    time and lines by memory allocated during the stage. A stage nested in a profiled stage
+    is profiled as part of it rather than on its own.
+
+    Long-running loops report their progress through progress(), which passes rate-limited
+    events to progress_callback, or logs them if there is none.
+    """
+
+    def __init__(
+        self,
+        trace_memory: bool = False,
+        profile: str = None,
+        profile_stage: str = "*",
+        profile_dir: Path = Path("profiles"),
+        profile_top: int = 20,
+        progress_callback=None,
+        progress_interval: float = PROGRESS_INTERVAL,
+    ):
+        self.logger = getLogger("Stats")
+        self.trace_memory = trace_memory
+        if profile is not None and profile not in PROFILES:
+            raise ValueError(
+                f"Expected one of {PROFILES} for profile, but got '{profile}'"
+            )
+        self.profile = profile
+        self.profile_stage = profile_stage
+        self.profile_dir = Path(profile_dir)
+        self.profile_top = profile_top
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self.stages = list()
+        self._open = list()
+        self._peaks = list()  # running traced peak of each open stage, before its reset
+        self._profiling = False
+
+    @contextmanager
+    def stage(self, name: str, **counts):
+        """Measure the stage run in the body of a with statement, yielding its record"""
+        record = {"stage": name}
+        record.update({k: counts.get(k) for k in COUNTS})
+        self.stages.append(record)
+        self._open.append(record)
+        profiling = self._start_profile(name)
+        started_tracing = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        traced = None
+        if tracemalloc.is_tracing():
+            traced, peak = tracemalloc.get_traced_memory()
+            # resetting the peak for this stage would lose that of the stages around it
+            self._keep_peak(peak)
+            tracemalloc.reset_peak()
+        self._peaks.append(traced)
+        rss = peak_rss()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_s"] = time.perf_counter() - wall
+            record["cpu_s"] = time.process_time() - cpu
+            record["peak_rss_bytes"] = peak_rss()
+            try:
+                record["rss_growth_bytes"] = record["peak_rss_bytes"] - rss
+            except TypeError:
+                record["rss_growth_bytes"] = None
+            peak = self._peaks.pop()
+            if traced is not None and tracemalloc.is_tracing():
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                record["traced_peak_bytes"] = peak - traced
+                self._keep_peak(peak)
+            if started_tracing:
+                tracemalloc.stop()
+            if profiling:
+                self._stop_profile(name, *profiling)
+            self._open.pop()
+            self.logger.info(
+                f"Stage '{name}' took {record['wall_s']:.3f}s ({record['cpu_s']:.3f}s CPU): "
+                + ", ".join(
+                    [f"{k} {record[k]}" for k in COUNTS if record[k] is not None]
+                )
+            )
+
+    def _keep_peak(self, peak: int):
+        """Raise the running traced peak of the innermost open stage to at least peak"""
+        if self._peaks and self._peaks[-1] is not None:
+            self._peaks[-1] = max(self._peaks[-1], peak)
+
+    def _start_profile(self, name: str) -> tuple:
+        """Start profiling a stage, if it is to be profiled, returning what _stop_profile needs"""
+        if (
+            self.profile is None
+            or self._profiling
+            or not fnmatchcase(name, self.profile_stage)
+        ):
+            return None
+        self._profiling = True
+        # number profiles in stage order, so that stages run more than once are kept apart
+        stem = f"{len(self.stages):03d}-" + re.sub(r"[^\w.-]+", "_", name)
+        profiler = None
+        snapshot = None
+        started_tracing = False
+        if self.profile in ("mem", "both"):
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            snapshot = tracemalloc.take_snapshot()
+        if self.profile in ("cpu", "both"):
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return (stem, profiler, snapshot, started_tracing)
+
+    def _stop_profile(
+        self,
+        name: str,
+        stem: str,
+        profiler: cProfile.Profile,
+        snapshot: tracemalloc.Snapshot,
+        started_tracing: bool,
+    ):
+        if profiler is not None:
+            profiler.disable()
+        if snapshot is not None:
+            # before anything below allocates, and without the profilers' own allocations
+            final = tracemalloc.take_snapshot().filter_traces(PROFILER_FILTERS)
+            if started_tracing:
+                tracemalloc.stop()
+        self._profiling = False
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        if profiler is not None:
+            path = self.profile_dir / f"{stem}.pstats"
+            profiler.dump_stats(path)
+            summary = StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(
+                self.profile_top
+            )
+            self.logger.info(
+                f"CPU profile of stage '{name}' saved to {path}:\n{summary.getvalue()}"
+            )
+        if snapshot is not None:
+            path = self.profile_dir / f"{stem}.tracemalloc"
+            final.dump(str(path))
+            top = final.compare_to(snapshot.filter_traces(PROFILER_FILTERS), "lineno")[
+                : self.profile_top
+            ]
+            self.logger.info(
+                f"Memory profile of stage '{name}' saved to {path}; allocated during the stage:\n"
+                + "\n".join([str(stat) for stat in top])
+            )
+
+    def progress(self, total: int = None, stage: str = None) -> "Progress":
+        """Return a Progress for a loop of total items, named for the innermost open stage"""
+        if stage is None:
+            try:
+                stage = self._open[-1]["stage"]
+            except IndexError:
+                stage = "run"
+        return Progress(
+            stage,
+            total,
+            callback=self.progress_callback,
+            interval=self.progress_interval,
+        )
+
+    def count(self, key: str, n: int = 1):
+        """Add n to a count (items_in, items_out, or candidates) of the innermost open stage"""
+        if key not in COUNTS:
+            raise KeyError(f"Expected one of {COUNTS} for count, but got '{key}'")
+        if self._open:
+            record = self._open[-1]
+            record[key] = (record[key] or 0) + n
+
+    def asdict(self) -> dict:
+        return {"format": STATS_FORMAT, "stages": self.stages}
+
+    def save(self, path: Path):
+        """Write the statistics to a JSON file"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.asdict(), f, indent=4)
+
+
+def summarize_stages(records: list) -> dict:
+    """
+    Summarize stage records, possibly repeated, by benchmark: the stage name, prefixed with
+    the size of the run ("10000/align proximity") if records have one
+    Times are medians across repeats. Peak RSS is the minimum, as a process's high-water
+    mark only rises across repeats run in it, and RSS growth the maximum, as only the first
+    repeat to need more memory raises that mark; traced allocation peaks are medians. Counts
+    are as last recorded (they are the same for every repeat of a deterministic run).
+    """
+    grouped = dict()
+    for record in records:
+        key = record["stage"]
+        if record.get("size") is not None:
+            key = f"{record['size']}/{key}"
+        grouped.setdefault(key, list()).append(record)
+    summary = dict()
+    for key, repeats in grouped.items():
+        summary[key] = {
+            "repeats": len(repeats),
+            "wall_s": median([r["wall_s"] for r in repeats]),
+            "cpu_s": median([r["cpu_s"] for r in repeats]),
+        }
+        rss = [r["peak_rss_bytes"] for r in repeats if r.get("peak_rss_bytes")]
+        summary[key]["peak_rss_bytes"] = min(rss) if rss else None
+        growth = [
+            r["rss_growth_bytes"]
+            for r in repeats
+            if r.get("rss_growth_bytes") is not None
+        ]
+        summary[key]["rss_growth_bytes"] = max(growth) if growth else None
+        traced = [r["traced_peak_bytes"] for r in repeats if "traced_peak_bytes" in r]
+        summary[key]["traced_peak_bytes"] = median(traced) if traced else None
+        for k in COUNTS:
+            summary[key][k] = repeats[-1].get(k)
+    return summary
+
+
+def compare_summaries(
+    baseline: dict,
+    current: dict,
+    time_tolerance: float = 0.25,
+    memory_tolerance: float = 0.25,
+    count_tolerance: float = 0.0,
+    min_seconds: float = 0.05,
+    min_bytes: int = 2**20,
+) -> list:
+    """
+    Compare summaries of the same benchmarks, as returned by summarize_stages(), returning a
+    row for every metric that changed beyond its tolerance (a fraction of the baseline value).
+    Metrics compared are median wall time (changes under min_seconds are ignored as noise),
+    memory (changes under min_bytes are ignored), and candidate pairs evaluated. Memory is
+    compared by traced allocation peaks if both summaries have them, and otherwise by how
+    much each stage raised the peak RSS of its process: that peak is a high-water mark for
+    the whole process, so a stage that needs less memory than an earlier one shows no
+    growth at all, and only traced peaks measure every stage. Each row holds the benchmark,
+    metric, baseline and current values, the relative change, and a verdict: "regression"
+    or "improvement". Benchmarks in only one summary are reported as "missing" or "new".
+    """
+    rows = list()
+    for key in sorted(set(baseline) | set(current)):
+        if key not in current:
+            rows.append(_comparison(key, None, None, None, "missing"))
+            continue
+        if key not in baseline:
+            rows.append(_comparison(key, None, None, None, "new"))
+            continue
+        old = baseline[key]
+        new = current[key]
+        memory = "rss_growth_bytes"
+        if old.get("traced_peak_bytes") is not None:
+            if new.get("traced_peak_bytes") is not None:
+                memory = "traced_peak_bytes"
+        for metric, tolerance, floor in [
+            ("wall_s", time_tolerance, min_seconds),
+            (memory, memory_tolerance, min_bytes),
+            ("candidates", count_tolerance, 0),
+        ]:
+            before = old.get(metric)
+            after = new.get(metric)
+            if before is None or after is None or abs(after - before) <= floor:
+                continue
+            change = (after - before) / before if before else float("inf")
+            if change > tolerance:
+                rows.append(_comparison(key, metric, before, after, "regression"))
+            elif change < -tolerance:
+                rows.append(_comparison(key, metric, before, after, "improvement"))
+    return rows
+
+
+def _comparison(key, metric, before, after, verdict) -> dict:
+    change = None
+    if before and after is not None:
+        change = (after - before) / before
+    return {
+        "benchmark": key,
+        "metric": metric,
+        "baseline": before,
+        "current": after,
+        "change": change,
+        "verdict": verdict,
+    }
+
+
+class Progress:
+    """
+    Rate-limited progress events for a long-running loop
+
+    Call update() as items are processed. The clock is read only every check_every items,
+    so updating costs next to nothing, and an event is emitted at most once every interval
+    seconds: a dict of the stage, items processed so far, total items (if known), seconds
+    elapsed, items per second, and the estimated seconds remaining (if total is known).
+    Events are passed to callback, or logged if there is none. finish() emits a last event,
+    marked done, if any were emitted before (or always, given a callback).
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        total: int = None,
+        callback=None,
+        interval: float = PROGRESS_INTERVAL,
+        check_every: int = 256,
+    ):
+        self.logger = getLogger("Progress")
+        self.stage = stage
+        self.total = total
+        self.callback = callback
+        self.interval = interval
+        self.check_every = check_every
+        self.processed = 0
+        self.events = 0
+        self._started = time.perf_counter()
+        self._last = self._started
+        self._next_check = check_every
+
+    def update(self, n: int = 1):
+        self.processed += n
+        if self.processed >= self._next_check:
+            self._next_check = self.processed + self.check_every
+            now = time.perf_counter()
+            if now - self._last >= self.interval:
+                self._emit(now)
+
+    def finish(self):
+        if self.events or self.callback is not None:
+            self._emit(time.perf_counter(), done=True)
+
+    def _emit(self, now: float, done: bool = False):
+        self._last = now
+        self.events += 1
+        elapsed = now - self._started
+        rate = self.processed / elapsed if elapsed > 0 else None
+        eta = None
+        if self.total is not None and rate:
+            eta = max(0.0, (self.total - self.processed) / rate)
+        event = {
+            "stage": self.stage,
+            "processed": self.processed,
+            "total": self.total,
+            "elapsed_s": elapsed,
+            "rate": rate,
+            "eta_s": eta,
+            "done": done,
+        }
+        if self.callback is not None:
+            self.callback(event)
+            return
+        msg = f"{self.stage}: {self.processed}"
+        if self.total:
+            msg += f"/{self.total} ({100 * self.processed / self.total:.0f}%)"
+        if rate is not None:
+            msg += f" at {rate:.1f}/s"
+        if done:
+            msg += f", done in {elapsed:.1f}s"
+        elif eta is not None:
+            msg += f", ETA {eta:.1f}s"
+        self.logger.info(msg)
@@ -0,0 +1,406 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Persist alignments and places to an indexed SQLite database
+"""
+import json
+from logging import getLogger
+import numpy
+from pathlib import Path
+from shapely import to_wkt
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alignments (
+    key TEXT PRIMARY KEY,
+    id_1 TEXT NOT NULL,
+    id_2 TEXT NOT NULL,
+    namespace_a TEXT NOT NULL,
+    namespace_b TEXT NOT NULL,
+    modes TEXT NOT NULL,
+    authorities TEXT NOT NULL,
+    proximity TEXT,
+    centroid_distance_dd REAL,
+    centroid_distance_m REAL
+);
+CREATE INDEX IF NOT EXISTS alignments_id_1 ON alignments (id_1);
+CREATE INDEX IF NOT EXISTS alignments_id_2 ON alignments (id_2);
+CREATE INDEX IF NOT EXISTS alignments_namespaces ON alignments (namespace_a, namespace_b);
+CREATE INDEX IF NOT EXISTS alignments_namespace_b ON alignments (namespace_b);
+CREATE INDEX IF NOT EXISTS alignments_proximity ON alignments (proximity);
+CREATE TABLE IF NOT EXISTS alignment_modes (
+    key TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    PRIMARY KEY (key, mode)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS alignment_modes_mode ON alignment_modes (mode, key);
+CREATE TABLE IF NOT EXISTS alignment_authorities (
+    key TEXT NOT NULL,
+    authority TEXT NOT NULL,
+    authority_namespace TEXT NOT NULL,
+    PRIMARY KEY (key, authority)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS alignment_authorities_authority ON alignment_authorities (authority);
+CREATE INDEX IF NOT EXISTS alignment_authorities_namespace ON alignment_authorities (authority_namespace, key);
+CREATE TABLE IF NOT EXISTS places (
+    full_id TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    id TEXT NOT NULL,
+    title TEXT,
+    names TEXT NOT NULL,
+    feature_types TEXT NOT NULL,
+    uri TEXT,
+    centroid TEXT,
+    footprint TEXT
+);
+CREATE INDEX IF NOT EXISTS places_namespace ON places (namespace);
+"""
+
+ALIGNMENT_COLUMNS = [
+    "key",
+    "id_1",
+    "id_2",
+    "namespace_a",
+    "namespace_b",
+    "modes",
+    "authorities",
+    "proximity",
+    "centroid_distance_dd",
+    "centroid_distance_m",
+]
+PLACE_COLUMNS = [
+    "full_id",
+    "namespace",
+    "id",
+    "title",
+    "names",
+    "feature_types",
+    "uri",
+    "centroid",
+    "footprint",
+]
+
+
+def alignment_key(alignment) -> str:
+    """Return the stable key for an alignment, which (unlike its hash) is the same across runs"""
+    return repr(alignment)
+
+
+class AlignmentStore:
+    """
+    A SQLite database of alignments and places, indexed for fast queries by full id,
+    namespace pair, alignment mode, authority, and proximity class
+    """
+
+    def __init__(self, path: Path):
+        self.logger = getLogger("AlignmentStore")
+        self.path = Path(path)
+        self.connection = sqlite3.connect(str(self.path))
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT count(*) FROM alignments").fetchone()[0]
+
+    # writing
+
+    def save(self, aligner):
+        """Replace the contents of the store with the alignments and places held by aligner"""
+        with self.connection:
+            for table in ["alignments", "alignment_modes", "alignment_authorities"]:
+                self.connection.execute(f"DELETE FROM {table}")
+            self.connection.execute("DELETE FROM places")
+            self._insert_alignments(aligner.alignments.values())
+            for namespace, ingester in aligner.ingesters.items():
+                self._insert_places(namespace, ingester)
+        self.logger.info(f"Saved {len(self)} alignments to {self.path}")
+
+    def upsert_alignments(self, alignments):
+        """Add alignments to the store, replacing any already stored under the same keys"""
+        with self.connection:
+            self._insert_alignments(alignments)
+
+    def delete_alignments(self, keys):
+        """Remove the alignments stored under keys"""
+        keys = [(k,) for k in keys]
+        with self.connection:
+            for table in ["alignments", "alignment_modes", "alignment_authorities"]:
+                self.connection.executemany(f"DELETE FROM {table} WHERE key = ?", keys)
+
+    def sync(self, aligner, place_ids: set = None):
+        """
+        Patch the store to match the alignments and places held by aligner, rewriting only
+        the alignments that were added, removed, or changed since it was saved
+        - place_ids: full ids of the only places that may have changed (e.g. as reported by
+          Aligner.update()); only the alignments involving them, or inferred on their
+          authority, are then read and compared. If None, every alignment is compared and
+          all places are rewritten
+        """
+        if place_ids is None:
+            stored = self._stored_rows(
+                f"SELECT {', '.join(ALIGNMENT_COLUMNS)} FROM alignments"
+            )
+            current = {alignment_key(a): a for a in aligner.alignments.values()}
+        else:
+            stored, current = self._affected_rows(aligner, place_ids)
+        removed = stored.keys() - current.keys()
+        changed = [
+            a for key, a in current.items() if stored.get(key) != self._alignment_row(a)
+        ]
+        self.delete_alignments(removed)
+        with self.connection:
+            self._insert_alignments(changed)
+            if place_ids is None:
+                self.connection.execute("DELETE FROM places")
+                for namespace, ingester in aligner.ingesters.items():
+                    self._insert_places(namespace, ingester)
+            else:
+                for namespace, ingester in aligner.ingesters.items():
+                    places = list()
+                    for full_id in place_ids:
+                        ns, rawid = full_id.split(":")
+                        if ns != namespace:
+                            continue
+                        try:
+                            places.append(ingester.data.get_place_by_id(rawid))
+                        except KeyError:
+                            self.connection.execute(
+                                "DELETE FROM places WHERE full_id = ?", (full_id,)
+                            )
+                    self._insert_places(namespace, ingester, places)
+        self.logger.info(
+            f"Synchronized {self.path}: removed {len(removed)} and wrote {len(changed)} alignments"
+        )
+
+    def _stored_rows(self, sql: str, params: tuple = ()) -> dict:
+        return {
+            tuple(row)[0]: tuple(row) for row in self.connection.execute(sql, params)
+        }
+
+    def _affected_rows(self, aligner, place_ids: set) -> tuple:
+        """
+        Return the stored rows and the current alignments, by key, that changes to the places
+        with place_ids can have touched: those involving the places, and inferences made on
+        their authority (inference is rerun in full, and chains through an aligned place)
+        """
+        with self.connection:
+            self.connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS sync_ids (full_id TEXT PRIMARY KEY)"
+            )
+            self.connection.execute("DELETE FROM sync_ids")
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO sync_ids (full_id) VALUES (?)",
+                [(full_id,) for full_id in place_ids],
+            )
+        columns = ", ".join(ALIGNMENT_COLUMNS)
+        stored = self._stored_rows(
+            f"SELECT {columns} FROM alignments WHERE id_1 IN (SELECT full_id FROM sync_ids) "
+            f"UNION SELECT {columns} FROM alignments WHERE id_2 IN (SELECT full_id FROM sync_ids) "
+            f"UNION SELECT {columns} FROM alignments WHERE key IN (SELECT key FROM "
+            "alignment_authorities WHERE authority IN (SELECT full_id FROM sync_ids))"
+        )
+        current = dict()
+        for full_id in place_ids:
+            try:
+                alignments = aligner.alignments_by_full_id(full_id)
+            except KeyError:
+                continue
+            current.update({alignment_key(a): a for a in alignments})
+        for a in aligner.alignments_by_mode("inference"):
+            if not a.authorities.isdisjoint(place_ids):
+                current[alignment_key(a)] = a
+        return (stored, current)
+
+    def _alignment_row(self, alignment) -> tuple:
+        id_1, id_2 = alignment.aligned_ids
+        namespaces = sorted([id_1.split(":")[0], id_2.split(":")[0]])
+        d = alignment.asdict()
+        return (
+            alignment_key(alignment),
+            id_1,
+            id_2,
+            namespaces[0],
+            namespaces[1],
+            ",".join(d["modes"]),
+            json.dumps(d["authorities"]),
+            d.get("proximity"),
+            d.get("centroid_distance_dd"),
+            d.get("centroid_distance_m"),
+        )
+
+    def _insert_alignments(self, alignments):
+        rows = list()
+        modes = list()
+        authorities = list()
+        for a in alignments:
+            row = self._alignment_row(a)
+            key = row[0]
+            rows.append(row)
+            modes.extend([(key, m) for m in sorted(a.modes)])
+            authorities.extend(
+                [(key, auth, auth.split(":")[0]) for auth in sorted(a.authorities)]
+            )
+        keys = [(row[0],) for row in rows]
+        self.connection.executemany("DELETE FROM alignment_modes WHERE key = ?", keys)
+        self.connection.executemany(
+            "DELETE FROM alignment_authorities WHERE key = ?", keys
+        )
+        self.connection.executemany(
+            f"INSERT OR REPLACE INTO alignments ({', '.join(ALIGNMENT_COLUMNS)}) "
+            f"VALUES ({', '.join(['?'] * len(ALIGNMENT_COLUMNS))})",
+            rows,
+        )
+        self.connection.executemany(
+            "INSERT INTO alignment_modes (key, mode) VALUES (?, ?)", modes
+        )
+        self.connection.executemany(
+            "INSERT INTO alignment_authorities (key, authority, authority_namespace) "
+            "VALUES (?, ?, ?)",
+            authorities,
+        )
+
+    def _insert_places(self, namespace: str, ingester, places: list = None):
+        if places is None:
+            places = list(ingester.data.place_view)
+        centroids = numpy.empty(len(places), dtype=object)
+        centroids[:] = [p.centroid for p in places]
+        footprints = numpy.empty(len(places), dtype=object)
+        footprints[:] = [p.footprint for p in places]
+        rows = (
+            (
+                ":".join((namespace, p.id)),
+                namespace,
+                p.id,
+                getattr(p, "title", None),
+                json.dumps(sorted(p.names), ensure_ascii=False),
+                json.dumps(sorted(p.feature_types), ensure_ascii=False),
+                ingester.base_uri + p.id,
+                centroid,
+                footprint,
+            )
+            for p, centroid, footprint in zip(
+                places, to_wkt(centroids).tolist(), to_wkt(footprints).tolist()
+            )
+        )
+        self.connection.executemany(
+            f"INSERT OR REPLACE INTO places ({', '.join(PLACE_COLUMNS)}) "
+            f"VALUES ({', '.join(['?'] * len(PLACE_COLUMNS))})",
+            rows,
+        )
+
+    # querying
+
+    def iter_alignments(self):
+        """Lazily yield every alignment record, in key order"""
+        for row in self.connection.execute("SELECT * FROM alignments ORDER BY key"):
+            yield self._alignment_record(row)
+
+    def alignments_for(self, full_id: str) -> list:
+        """Return all alignments involving the place with the full id"""
+        return self.query(full_id=full_id)
+
+    def query(
+        self,
+        full_id: str = None,
+        namespaces: list = list(),
+        modes: list = list(),
+        exclude_modes: list = list(),
+        proximity: list = list(),
+        authority_namespaces: list = list(),
+    ) -> list:
+        """
+        Return alignment records matching all the criteria given
+        - full_id: involve the place with this full id (e.g. "pleiades:589704")
+        - namespaces: involve places from this namespace, or from both of these namespaces
+        - modes: have all of these alignment modes
+        - exclude_modes: have none of these alignment modes
+        - proximity: have one of these proximity classes
+        - authority_namespaces: have an authority from one of these namespaces
+        """
+        clauses = list()
+        params = list()
+        if full_id:
+            clauses.append("(a.id_1 = ? OR a.id_2 = ?)")
+            params.extend([full_id, full_id])
+        if len(namespaces) == 1:
+            clauses.append("(a.namespace_a = ? OR a.namespace_b = ?)")
+            params.extend([namespaces[0], namespaces[0]])
+        elif len(namespaces) == 2:
+            clauses.append("a.namespace_a = ? AND a.namespace_b = ?")
+            params.extend(sorted(namespaces))
+        elif namespaces:
+            raise ValueError(
+                f"Expected one or two namespaces, but got {len(namespaces)}: {namespaces}"
+            )
+        for mode in modes:
+            clauses.append(
+                "EXISTS (SELECT 1 FROM alignment_modes m WHERE m.mode = ? AND m.key = a.key)"
+            )
+            params.append(mode)
+        for mode in exclude_modes:
+            clauses.append(
+                "NOT EXISTS (SELECT 1 FROM alignment_modes m WHERE m.mode = ? AND m.key = a.key)"
+            )
+            params.append(mode)
+        if proximity:
+            clauses.append(f"a.proximity IN ({', '.join(['?'] * len(proximity))})")
+            params.extend(proximity)
+        if authority_namespaces:
+            clauses.append(
+                "EXISTS (SELECT 1 FROM alignment_authorities t WHERE t.key = a.key "
+                f"AND t.authority_namespace IN ({', '.join(['?'] * len(authority_namespaces))}))"
+            )
+            params.extend(authority_namespaces)
+        sql = "SELECT * FROM alignments a"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY a.key"
+        return [
+            self._alignment_record(row) for row in self.connection.execute(sql, params)
+        ]
+
+    def get_place(self, full_id: str) -> dict:
+        row = self.connection.execute(
+            "SELECT * FROM places WHERE full_id = ?", (full_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"Requested place {full_id}, but it is not in the store.")
+        return self._place_record(row)
+
+    def _alignment_record(self, row: sqlite3.Row) -> dict:
+        """Convert an alignments row to a dictionary shaped like Alignment.asdict()"""
+        d = {
+            "key": row["key"],
+            "aligned_ids": [row["id_1"], row["id_2"]],
+            "aligned_namespaces": sorted(
+                {row["id_1"].split(":")[0], row["id_2"].split(":")[0]}
+            ),
+            "authorities": json.loads(row["authorities"]),
+            "modes": row["modes"].split(","),
+        }
+        if row["proximity"] is not None:
+            d["proximity"] = row["proximity"]
+            for k in ["centroid_distance_dd", "centroid_distance_m"]:
+                if row[k] is not None:
+                    d[k] = row[k]
+        return d
+
+    def _place_record(self, row: sqlite3.Row) -> dict:
+        d = {k: row[k] for k in PLACE_COLUMNS}
+        d["names"] = json.loads(d["names"])
+        d["feature_types"] = json.loads(d["feature_types"])
+        return d
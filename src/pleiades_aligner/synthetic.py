@@ -0,0 +1,382 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Generate deterministic synthetic gazetteers, in the formats of the supported sources, for benchmarking
+"""
+import csv
+import json
+from math import cos, radians
+from pathlib import Path
+import random
+
+# share of the synthetic "true" places each source describes
+DEFAULT_PROPORTIONS = {
+    "pleiades": 1.0,
+    "chronique": 0.25,
+    "manto": 0.2,
+    "topostext": 0.25,
+}
+# roughly the extent of the ancient Mediterranean world: lon min, lat min, lon max, lat max
+DEFAULT_BOUNDS = (-10.0, 24.0, 45.0, 50.0)
+
+SYLLABLES = (
+    "a ai ak al an ar as ba da de di do e el en eu ga he hi ia ka ke ko ly la le li lo ma me "
+    "mi na ne ni o on pa pe phi po ra re ri ro sa se so ta te tha the ti to xe ze"
+).split()
+SUFFIXES = ["a", "ai", "e", "eia", "ia", "on", "os", "ous", "polis", "ion", "ai"]
+GREEK_DIGRAPHS = {"ph": "φ", "th": "θ", "ch": "χ", "ps": "ψ", "ou": "ου"}
+GREEK_LETTERS = str.maketrans("abgdeziklmnxoprstuy", "αβγδεζικλμνξοπρστυυ", "cfhjqvw")
+
+# feature types of the synthetic places and how each source records them
+FEATURE_TYPES = [
+    # (pleiades, chronique Dsg, manto symbol, topostext identifier, topostext label, weight)
+    ("settlement", "PPL", "🌍", "aat:300008347", "inhabited places", 8),
+    ("settlement", "DD", "🌍", "aat:300008347", "inhabited places", 3),
+    ("sanctuary", "ANS", "🏛", "aat:300000809", "archaeological sites", 2),
+    ("temple-2", "CH", "🏛", "aat:300007466", "temples", 1),
+    ("island", "ISL", "🌍", "aat:300008804", "islands", 2),
+    ("mountain", "MT", "🌍", "aat:300008795", "mountains", 2),
+    ("river", "STM", "🌍", "aat:300008707", "rivers", 2),
+    ("port", "HBR", "🌍", "aat:300008853", "harbors", 1),
+    ("theatre", "ARCH", "💠", "aat:300007119", "theaters", 1),
+]
+
+CHRONIQUE_FIELDNAMES = (
+    "Id,Geoname_id,Pleiades_id,Bsa_irn,Lau1,Lau2,Full_name,Greekname,Lat,Long,Dsg,"
+    "Date_created,Date_modified,Fk_id_cadastres,Fk_id_regions,Fk_id_pays"
+).split(",")
+MANTO_FIELDNAMES = (
+    "Object ID,Name,Name,Minimal Disambiguation,Information,Name (transliteration),"
+    "Name (Greek font),Name (Latinized),Name in Latin texts,Alternative names,"
+    "Alternative name,Alternative name - Object ID,Pleiades,In,In - Object ID"
+).split(",")
+TOPOSTEXT_CONTEXT = "https://raw.githubusercontent.com/LinkedPasts/linked-places/master/linkedplaces-context-v1.3.jsonld"
+PLEIADES_BASE_URI = "https://pleiades.stoa.org/places/"
+
+
+class SyntheticGazetteer:
+    """
+    A deterministic synthetic world of places, and the sources that describe it
+
+    Places cluster around regional centers, as settlements do, with a few spread out evenly.
+    Each source describes a share of the places (see DEFAULT_PROPORTIONS) with coordinates
+    jittered by source, names variously romanized or in Greek script, its own vocabulary of
+    feature types, and cross-references to the other sources, a few of them wrong. The same
+    size and seed always produce the same files.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        seed: int = 0,
+        proportions: dict = DEFAULT_PROPORTIONS,
+        bounds: tuple = DEFAULT_BOUNDS,
+    ):
+        self.size = size
+        self.seed = seed
+        self.proportions = proportions
+        self.bounds = bounds
+        self.places = list()
+        self._described = dict()  # places described by each source, by namespace
+        self._generate()
+
+    def write(self, path: Path) -> dict:
+        """
+        Write every source under path and return a data_sources mapping of namespace to file
+        path, as used in config files
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        writers = {
+            "pleiades": (self.write_pleiades, path / "pleiades"),
+            "chronique": (self.write_chronique, path / "chronique.csv"),
+            "manto": (self.write_manto, path / "manto.csv"),
+            "topostext": (self.write_topostext, path / "topostext.json"),
+        }
+        data_sources = dict()
+        for namespace in self.proportions.keys():
+            try:
+                writer, whither = writers[namespace]
+            except KeyError:
+                raise ValueError(f"No synthetic source for namespace '{namespace}'")
+            writer(whither)
+            data_sources[namespace] = str(whither)
+        return data_sources
+
+    def write_pleiades(self, path: Path):
+        """Write a tree of Pleiades place JSON files, nested by leading digits of the ids"""
+        rand = self._rand("pleiades")
+        for place in self._described_by("pleiades"):
+            pid = place["ids"]["pleiades"]
+            locations = list()
+            if rand.random() > 0.08:  # some places are unlocated
+                for i in range(1 + int(rand.random() < 0.15)):
+                    lon, lat = self._jitter(rand, place, 0.0002 + 0.002 * i)
+                    locations.append(
+                        {
+                            "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                            "accuracy_value": rand.choice([5.0, 20.0, 100.0, 500.0]),
+                        }
+                    )
+            references = [{"accessURI": ""}]
+            for namespace, uri_base in [
+                ("chronique", "https://chronique.efa.gr/?kroute=topo_public&id="),
+                ("manto", "https://resource.manto.unh.edu/"),
+                ("topostext", "https://topostext.org/place/"),
+            ]:
+                other_id = self._cross_reference(rand, place, namespace, 0.4)
+                if other_id:
+                    references.append({"accessURI": uri_base + other_id})
+            if rand.random() < 0.3:
+                references.append(
+                    {"accessURI": f"https://www.geonames.org/{place['geonames']}"}
+                )
+            names = [{"attested": place["greek"], "romanized": place["name"]}]
+            for variant in place["variants"]:
+                names.append({"attested": "", "romanized": variant})
+            datum = {
+                "@type": "Place",
+                "id": pid,
+                "uri": PLEIADES_BASE_URI + pid,
+                "title": place["name"],
+                "description": f"A synthetic {place['type'][0]}.",
+                "locations": locations,
+                "names": names,
+                "placeTypes": [place["type"][0]],
+                "references": references,
+            }
+            whither = Path(path) / pid[0] / pid[1]
+            whither.mkdir(parents=True, exist_ok=True)
+            with open(whither / f"{pid}.json", "w", encoding="utf-8") as f:
+                json.dump(datum, f, ensure_ascii=False)
+
+    def write_chronique(self, path: Path):
+        """Write a Chronique toponyms CSV export"""
+        rand = self._rand("chronique")
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(CHRONIQUE_FIELDNAMES)
+            for place in self._described_by("chronique"):
+                lon, lat = self._jitter(rand, place, 0.003)
+                pleiades_id = self._cross_reference(rand, place, "pleiades", 0.3)
+                geonames_id = place["geonames"] if rand.random() < 0.7 else ""
+                writer.writerow(
+                    [
+                        f'GA_OPE_EDIT" target="_blank">{place["ids"]["chronique"]}',
+                        geonames_id,
+                        pleiades_id,
+                        "",
+                        rand.randint(100000, 999999),
+                        rand.randint(100000, 999999),
+                        ", ".join([place["name"]] + place["variants"][:1]),
+                        place["greek"],
+                        round(lat, 6),
+                        round(lon, 6),
+                        place["type"][1],
+                        "2018-05-04 12:25:54",
+                        "2018-10-02 10:35:04",
+                        rand.randint(1, 60),
+                        rand.randint(1, 13),
+                        2,
+                    ]
+                )
+
+    def write_manto(self, path: Path):
+        """Write a MANTO CSV export (no coordinates, and some places on several rows)"""
+        rand = self._rand("manto")
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(MANTO_FIELDNAMES)
+            for place in self._described_by("manto"):
+                rows = 1 + int(rand.random() < 0.1)
+                for i in range(rows):
+                    alternative = place["variants"][0] if place["variants"] else ""
+                    writer.writerow(
+                        [
+                            place["ids"]["manto"],
+                            f"{place['type'][2]} {place['name']} ({place['type'][0]})",
+                            place["name"],
+                            f"({place['type'][0]})",
+                            "",
+                            "",
+                            place["greek"] if i == 0 else "",
+                            "",
+                            "",
+                            alternative if i == 0 else "",
+                            alternative if i > 0 else "",
+                            "",
+                            self._cross_reference(rand, place, "pleiades", 0.4),
+                            "",
+                            "",
+                        ]
+                    )
+
+    def write_topostext(self, path: Path):
+        """Write a ToposText WHG JSON (Linked Places format) feature collection"""
+        rand = self._rand("topostext")
+        features = list()
+        for place in self._described_by("topostext"):
+            lon, lat = self._jitter(rand, place, 0.001)
+            uri = f"https://topostext.org/place/{place['ids']['topostext']}"
+            names = [{"toponym": place["name"], "lang": "en"}]
+            if place["greek"]:
+                names.append({"toponym": place["greek"], "lang": "grc"})
+            links = list()
+            pleiades_id = self._cross_reference(rand, place, "pleiades", 0.35)
+            if pleiades_id:
+                links.append(
+                    {
+                        "type": "closeMatch",
+                        "identifier": f"http://pleiades.stoa.org/places/{pleiades_id}",
+                    }
+                )
+            features.append(
+                {
+                    "@id": uri,
+                    "type": "Feature",
+                    "properties": {"title": place["name"]},
+                    "geometry": {
+                        "type": "GeometryCollection",
+                        "geometries": [
+                            {
+                                "type": "Point",
+                                "coordinates": [round(lon, 3), round(lat, 3)],
+                            }
+                        ],
+                    },
+                    "names": names,
+                    "types": [
+                        {
+                            "identifier": place["type"][3],
+                            "label": place["type"][4],
+                            "sourceLabel": place["type"][0],
+                        }
+                    ],
+                    "links": links,
+                    "descriptions": [
+                        {
+                            "@id": uri,
+                            "value": f"A synthetic {place['type'][0]}",
+                            "lang": "en",
+                        }
+                    ],
+                }
+            )
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "type": "FeatureCollection",
+                    "@context": TOPOSTEXT_CONTEXT,
+                    "features": features,
+                },
+                f,
+                ensure_ascii=False,
+            )
+
+    def _generate(self):
+        rand = self._rand("places")
+        lon_min, lat_min, lon_max, lat_max = self.bounds
+        # a few hundred places per region, on average
+        centers = [
+            (rand.uniform(lon_min, lon_max), rand.uniform(lat_min, lat_max))
+            for i in range(max(1, self.size // 250))
+        ]
+        weights = [rand.paretovariate(1.5) for c in centers]
+        types = [t for t in FEATURE_TYPES]
+        type_weights = [t[5] for t in FEATURE_TYPES]
+        names = list()
+        for i in range(self.size):
+            if rand.random() < 0.05:
+                lon = rand.uniform(lon_min, lon_max)
+                lat = rand.uniform(lat_min, lat_max)
+            else:
+                lon, lat = rand.choices(centers, weights)[0]
+                spread = rand.choice([0.02, 0.1, 0.4])
+                lon += rand.gauss(0.0, spread) / max(0.2, cos(radians(lat)))
+                lat += rand.gauss(0.0, spread)
+            if names and rand.random() < 0.03:
+                # homonyms are common (Apollonia, Herakleia, ...)
+                name = rand.choice(names)
+            else:
+                name = self._name(rand)
+            names.append(name)
+            variants = list()
+            if rand.random() < 0.3:
+                variants.append(self._variant(rand, name))
+            self.places.append(
+                {
+                    "lon": lon,
+                    "lat": lat,
+                    "name": name,
+                    "greek": self._greek(name) if rand.random() < 0.7 else "",
+                    "variants": variants,
+                    "type": rand.choices(types, type_weights)[0],
+                    "geonames": str(200000 + i),
+                    "ids": {
+                        "pleiades": str(100000 + i * 7),
+                        "chronique": str(1000 + i),
+                        "manto": str(10000000 + i * 3),
+                        "topostext": f"{300000 + i}{name[:3].upper()}",
+                    },
+                }
+            )
+        # which places each source describes
+        for namespace, proportion in self.proportions.items():
+            selected = self._rand(f"select {namespace}").random
+            self._described[namespace] = list()
+            for place in self.places:
+                if selected() < proportion:
+                    place.setdefault("described_by", set()).add(namespace)
+                    self._described[namespace].append(place)
+
+    def _described_by(self, namespace: str) -> list:
+        return self._described[namespace]
+
+    def _cross_reference(
+        self, rand: random.Random, place: dict, namespace: str, rate: float
+    ) -> str:
+        """Return the id of the place in namespace, if referenced, rarely a wrong one"""
+        if namespace not in place.get("described_by", set()) or rand.random() >= rate:
+            return ""
+        if rand.random() < 0.02:
+            return rand.choice(self._described[namespace])["ids"][namespace]
+        return place["ids"][namespace]
+
+    def _jitter(self, rand: random.Random, place: dict, spread: float) -> tuple:
+        return (
+            round(place["lon"] + rand.gauss(0.0, spread), 6),
+            round(place["lat"] + rand.gauss(0.0, spread), 6),
+        )
+
+    def _name(self, rand: random.Random) -> str:
+        syllables = [rand.choice(SYLLABLES) for i in range(rand.randint(1, 3))]
+        return ("".join(syllables) + rand.choice(SUFFIXES)).capitalize()
+
+    def _variant(self, rand: random.Random, name: str) -> str:
+        for a, b in [("os", "us"), ("on", "um"), ("k", "c"), ("ai", "ae"), ("ei", "i")]:
+            if a in name:
+                return name.replace(a, b)
+        return name + rand.choice(["a", "e", "on"])
+
+    def _greek(self, name: str) -> str:
+        greek = name.lower()
+        for latin, letter in GREEK_DIGRAPHS.items():
+            greek = greek.replace(latin, letter)
+        greek = greek.translate(GREEK_LETTERS)
+        if greek.endswith("σ"):
+            greek = greek[:-1] + "ς"
+        return greek.capitalize()
+
+    def _rand(self, purpose: str) -> random.Random:
+        # independent streams, so that changing one source does not reshuffle the others
+        return random.Random(f"{self.seed}:{self.size}:{purpose}")
+
+
+def generate(path: Path, size: int, seed: int = 0, **kwargs) -> dict:
+    """Write a synthetic gazetteer of size places under path and return its data_sources"""
+    return SyntheticGazetteer(size, seed, **kwargs).write(path)
@@ -14,16 +14,21 @@ from pleiades_aligner.ingester import IngesterWHGJSON
 
 
 class IngesterTopostext(IngesterWHGJSON):
-    def __init__(self, filepath: Path):
+    def __init__(self, filepath: Path, raw_properties: str = "keep"):
         self.base_uri = "https://topostext.org/place/"
         IngesterWHGJSON.__init__(
-            self, namespace="topostext", filepath=filepath, base_uri=self.base_uri
+            self,
+            namespace="topostext",
+            filepath=filepath,
+            base_uri=self.base_uri,
+            raw_properties=raw_properties,
         )
         self.logger = getLogger("IngesterTopostext")
 
     def ingest(self):
         IngesterWHGJSON.ingest(self)
         self._digest()
+        self._apply_raw_properties_policy()
 
     def _digest(self):
         self._set_titles_from_properties("Place {id}: {title}")
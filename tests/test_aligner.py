@@ -8,9 +8,12 @@
 """
 Test the pleiades_aligner.aligner module
 """
+from copy import deepcopy
 from pathlib import Path
 import pleiades_aligner
+from pleiades_aligner.aligner import distance
 from pprint import pformat
+from pytest import raises
 
 
 class TestAligner:
@@ -182,3 +185,224 @@ class TestAligner:
         assert len(geonames) == 17
         inferred_geo = {a for a in geonames if "inference" in a.modes}
         assert len(inferred_geo) == 4
+
+    def test_save_load(self, tmp_path):
+        this_aligner = pleiades_aligner.Aligner(
+            self.ingesters,
+            {
+                "chronique": "tests/data/chronique/chronique_example.csv",
+                "manto": "tests/data/manto/manto_example.csv",
+            },
+            redirects=dict(),
+        )
+        this_aligner.align(
+            modes=["assertions", "proximity"],
+            proximity_categories={
+                "tight": ("centroid", 0.001),
+                "close": ("centroid", 0.01),
+            },
+        )
+        whence = tmp_path / "aligner.snapshot"
+        this_aligner.save(whence)
+        that_aligner = pleiades_aligner.Aligner.load(whence)
+        assert set(that_aligner.ingesters.keys()) == set(self.ingesters.keys())
+        for ns, ingester in self.ingesters.items():
+            assert that_aligner.ingesters[ns].data.pids == ingester.data.pids
+        place = that_aligner.ingesters["pleiades"].data.get_place_by_id("589704")
+        assert (
+            place.names
+            == self.ingesters["pleiades"].data.get_place_by_id("589704").names
+        )
+        for mode in ["assertion", "proximity"]:
+            assert {repr(a) for a in that_aligner.alignments_by_mode(mode)} == {
+                repr(a) for a in this_aligner.alignments_by_mode(mode)
+            }
+        for aligner in [this_aligner, that_aligner]:
+            aligner.align(modes=["toponymy"], apply_to_modes=["assertion", "proximity"])
+            aligner.align_by_inference("pleiades", "chronique", "geonames")
+        assert {
+            (repr(a), tuple(sorted(a.modes))) for a in that_aligner.alignments.values()
+        } == {
+            (repr(a), tuple(sorted(a.modes))) for a in this_aligner.alignments.values()
+        }
+
+    def test_update(self, tmp_path):
+        categories = {
+            "tight": ("centroid", 0.001),
+            "close": ("centroid", 0.01),
+        }
+        secondary = {"toponymy": ["assertion", "proximity"]}
+
+        def summarize(aligner):
+            return {
+                (repr(a), tuple(sorted(a.modes)), tuple(sorted(a.authorities)))
+                for a in aligner.alignments.values()
+            }
+
+        def full(ingesters):
+            aligner = pleiades_aligner.Aligner(ingesters, dict(), redirects=dict())
+            aligner.align(
+                modes=["assertions", "proximity"], proximity_categories=categories
+            )
+            for mode, apply_to_modes in secondary.items():
+                aligner.align(modes=[mode], apply_to_modes=apply_to_modes)
+            return aligner
+
+        before = full(
+            {
+                "chronique": self.ingesters["chronique"],
+                "pleiades": self.ingesters["pleiades"],
+            }
+        )
+        whence = tmp_path / "aligner.snapshot"
+        before.save(whence)
+
+        chronique = pleiades_aligner.IngesterChronique(
+            Path("tests/data/chronique/chronique_example.csv")
+        )
+        chronique.ingest()
+        assert "3891" in {a.split(":")[1] for a in before._alignment_hashes_by_full_id}
+        chronique.data.places = [p for p in chronique.data if p.id != "3891"]
+        chronique.data.get_place_by_id("10037").add_names("Aptera")
+        after = {"chronique": chronique, "pleiades": self.ingesters["pleiades"]}
+
+        aligner = pleiades_aligner.Aligner.load(whence)
+        changes = aligner.update(
+            after,
+            modes=["assertions", "proximity"],
+            proximity_categories=categories,
+            secondary_modes=secondary,
+        )
+        assert changes["chronique"] == {
+            "added": [],
+            "removed": ["3891"],
+            "changed": ["10037"],
+        }
+        assert changes["pleiades"] == {"added": [], "removed": [], "changed": []}
+        assert summarize(aligner) == summarize(full(after))
+        assert summarize(aligner) != summarize(before)
+
+    def test_shard_merge(self, tmp_path):
+        categories = {
+            "tight": ("centroid", 0.001),
+            "close": ("centroid", 0.01),
+        }
+
+        def summarize(aligner):
+            return {
+                (repr(a), tuple(sorted(a.modes)), tuple(sorted(a.authorities)))
+                for a in aligner.alignments.values()
+            }
+
+        whole = pleiades_aligner.Aligner(self.ingesters, dict(), redirects=dict())
+        whole.align(modes=["assertions", "proximity"], proximity_categories=categories)
+        paths = list()
+        held = 0
+        for index in [3, 1, 2]:
+            # a shard drops the places it does not hold
+            ingesters = deepcopy(self.ingesters)
+            aligner = pleiades_aligner.Aligner(ingesters, dict(), redirects=dict())
+            aligner.set_shard(index, 3)
+            aligner.align(
+                modes=["assertions", "proximity"], proximity_categories=categories
+            )
+            assert len(aligner.alignments) < len(whole.alignments)
+            held += sum([len(i.data) for i in ingesters.values()])
+            paths.append(tmp_path / f"shard{index}.snapshot")
+            aligner.save(paths[-1])
+        assert held == sum([len(i.data) for i in self.ingesters.values()])
+        with raises(ValueError):
+            pleiades_aligner.Aligner.merge(paths[:2])
+        merged = pleiades_aligner.Aligner.merge(paths)
+        assert merged.shard is None
+        assert summarize(merged) == summarize(whole)
+        assert merged.fingerprints() == whole.fingerprints()
+        # shards of other data are refused
+        ingesters = deepcopy(self.ingesters)
+        ingesters["manto"].data.remove_place(ingesters["manto"].data.pids[0])
+        aligner = pleiades_aligner.Aligner(ingesters, dict(), redirects=dict())
+        aligner.set_shard(1, 3)
+        aligner.save(paths[1])
+        with raises(ValueError):
+            pleiades_aligner.Aligner.merge(paths)
+        assert list(merged.alignments.values()) == sorted(
+            merged.alignments.values(), key=repr
+        )
+
+    def test_align_place(self):
+        categories = {
+            "tight": ("centroid", 0.001),
+            "close": ("centroid", 0.01),
+        }
+        ingesters = {
+            "chronique": pleiades_aligner.IngesterChronique(
+                Path("tests/data/chronique/chronique_example.csv")
+            ),
+            "pleiades": self.ingesters["pleiades"],
+        }
+        ingesters["chronique"].ingest()
+        aligner = pleiades_aligner.Aligner(ingesters, dict(), redirects=dict())
+        aligner.align(
+            modes=["assertions", "proximity"], proximity_categories=categories
+        )
+        # the distance cache is bounded, and emptied after each batch
+        assert distance.cache_info().maxsize is not None
+        assert distance.cache_info().currsize == 0
+        for mode in ["toponymy", "typology"]:
+            aligner.align(modes=[mode], apply_to_modes=["assertion", "proximity"])
+
+        def summarize(alignments):
+            return {
+                (repr(a), tuple(sorted(a.modes)), tuple(sorted(a.authorities)))
+                for a in alignments
+            }
+
+        before = summarize(aligner.alignments.values())
+        for pid in ["10037", "1083", "3891"]:
+            place = ingesters["chronique"].data.get_place_by_id(pid)
+            found = aligner.align_place(place, proximity_categories=categories)
+            assert found
+            assert summarize(found) == summarize(
+                aligner.alignments_by_full_id(f"chronique:{pid}")
+            )
+        assert summarize(aligner.alignments.values()) == before
+        found = aligner.align_place(
+            place, modes=["proximity"], proximity_categories=categories
+        )
+        assert found and {tuple(a.modes) for a in found} == {("proximity",)}
+        with raises(ValueError):
+            aligner.align_place(place, modes=["inference"])
+        with raises(ValueError):
+            aligner.align_place(pleiades_aligner.dataset.Place("1"))
+
+        # a new place, registered
+        new = pleiades_aligner.dataset.Place("new", names={"Aptera"})
+        new.geometries = place.geometries
+        found = aligner.align_place(
+            new, "chronique", proximity_categories=categories, register=True
+        )
+        assert found
+        assert summarize(found) == summarize(
+            aligner.alignments_by_full_id("chronique:new")
+        )
+        assert ingesters["chronique"].data.get_place_by_id("new") is new
+
+        # registering re-aligns the place from scratch, so no primary mode may be left out
+        place = ingesters["chronique"].data.get_place_by_id("10037")
+        before = summarize(aligner.alignments_by_full_id("chronique:10037"))
+        assert any(["assertion" in a[1] for a in before])
+        for modes in [["proximity"], ["assertions"]]:
+            with raises(ValueError):
+                aligner.align_place(
+                    place, modes=modes, proximity_categories=categories, register=True
+                )
+        with raises(ValueError):
+            aligner.align_place(place, register=True)
+        assert summarize(aligner.alignments_by_full_id("chronique:10037")) == before
+        found = aligner.align_place(
+            place,
+            modes=["assertions", "proximity"],
+            proximity_categories=categories,
+            register=True,
+        )
+        assert {repr(a) for a in found} == {a[0] for a in before}
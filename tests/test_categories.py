@@ -0,0 +1,184 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Test the pleiades_aligner.categories module
+"""
+from itertools import combinations
+from pleiades_aligner.categories import (
+    ALIGNMENT_MODES,
+    CategoryRules,
+    iter_place_groups,
+    mode_mask,
+    PLACE_CRITERIA,
+    PRIORITY_CRITERIA,
+    split_ids,
+)
+from pytest import raises
+
+PROXIMITY = [None, "identical", "tight", "overlapping", "close", "near"]
+
+
+def walk_criteria(criteria: dict, record: dict):
+    """Classify the way the prioritize scripts used to, by walking criteria in order"""
+    for cat, rule in criteria.items():
+        if set(record["modes"]) != rule["modes"]:
+            continue
+        if not rule["proximity_types"]:
+            return cat
+        if record.get("proximity") in rule["proximity_types"]:
+            return cat
+    return None
+
+
+def legacy_place_category(records: list) -> int:
+    """Categorize a place the way prioritize.py used to, bugs and all"""
+    modes = {",".join(sorted(r["modes"])) for r in records}
+    if "assertion,proximity,toponymy,typology" in modes:
+        return 1
+    elif "assertion,proximity,typology" or "proximity,toponymy,typology" in modes:
+        return 2
+    elif "assertion,proximity,toponymy" in modes:
+        return 3
+    elif "toponymy,proximity" in modes:
+        return 4
+    elif "proximity" in modes:
+        return 5
+    return 6
+
+
+class TestCategories:
+    def test_mode_mask(self):
+        assert mode_mask([]) == 0
+        assert mode_mask(["assertion", "proximity"]) == mode_mask(
+            ["proximity", "assertion"]
+        )
+        assert mode_mask(["assertion"]) != mode_mask(["proximity"])
+        assert mode_mask(["assertion", "telepathy"]) is None
+
+    def test_split_ids(self):
+        record = {"aligned_ids": ["chronique:1", "pleiades:2"]}
+        assert split_ids(record, "pleiades") == (
+            "pleiades:2",
+            "chronique:1",
+            "chronique",
+        )
+        assert split_ids(record, "chronique") == (
+            "chronique:1",
+            "pleiades:2",
+            "pleiades",
+        )
+        assert split_ids(record, "manto") is None
+
+    def test_classify(self):
+        rules = CategoryRules(PRIORITY_CRITERIA)
+        for n in range(len(ALIGNMENT_MODES) + 1):
+            for modes in combinations(ALIGNMENT_MODES, n):
+                for proximity in PROXIMITY:
+                    record = {"modes": sorted(modes)}
+                    if proximity:
+                        record["proximity"] = proximity
+                    assert rules.classify(record) == walk_criteria(
+                        PRIORITY_CRITERIA, record
+                    )
+        assert rules.classify({"modes": ["assertion", "telepathy"]}) is None
+
+    def test_precedence(self):
+        rules = CategoryRules(
+            {
+                "a": {"modes": {"proximity"}, "proximity_types": {"tight"}},
+                "b": [
+                    {"modes": {"proximity"}},
+                    {"modes": {"assertion"}},
+                ],
+                "c": {"modes": {"proximity"}, "proximity_types": {"close"}},
+            }
+        )
+        assert rules.classify({"modes": ["proximity"], "proximity": "tight"}) == "a"
+        assert rules.classify({"modes": ["proximity"], "proximity": "close"}) == "b"
+        assert rules.classify({"modes": ["assertion"]}) == "b"
+        records = [{"modes": ["assertion"]}, {"modes": ["typology"]}]
+        assert [cat for cat, r in rules.classify_all(records)] == ["b", None]
+        with raises(ValueError):
+            CategoryRules({"x": {"modes": {"telepathy"}}})
+
+    def test_place_categories(self):
+        rules = CategoryRules(PLACE_CRITERIA)
+        # modes of a place's alignments: (old category, new category)
+        cases = {
+            ("assertion,proximity,toponymy,typology", "proximity"): (1, 1),
+            ("assertion,proximity,typology",): (2, 2),
+            ("proximity,toponymy,typology", "assertion"): (2, 2),
+            ("assertion,proximity,toponymy",): (2, 3),
+            ("proximity,toponymy",): (2, 4),
+            ("proximity", "proximity,toponymy"): (2, 4),
+            ("proximity",): (2, 5),
+            ("assertion", "assertion,toponymy"): (2, 6),
+        }
+        for modes, (old, new) in cases.items():
+            records = [{"modes": m.split(",")} for m in modes]
+            assert legacy_place_category(records) == old
+            assert rules.classify_group(records, default=6) == new
+        assert rules.classify_group([]) is None
+
+    def test_place_groups(self):
+        records = [
+            {
+                "aligned_ids": ["chronique:1", "pleiades:1"],
+                "authorities": ["chronique:1"],
+                "modes": ["assertion", "toponymy"],
+                "chronique": {"id": "1"},
+                "pleiades": {"id": "1"},
+            },
+            {
+                "aligned_ids": ["geonames:9", "pleiades:1"],
+                "authorities": ["chronique:1"],
+                "modes": ["inference"],
+            },
+            {
+                "aligned_ids": ["geonames:8", "pleiades:1"],
+                "authorities": ["chronique:7"],
+                "modes": ["inference"],
+            },
+            {
+                "aligned_ids": ["chronique:2", "manto:2"],
+                "authorities": ["chronique:2"],
+                "modes": ["assertion", "toponymy"],
+            },
+            {
+                "aligned_ids": ["chronique:3", "pleiades:2"],
+                "authorities": [],
+                "modes": ["proximity"],
+                "proximity": "tight",
+            },
+            {
+                "aligned_ids": ["manto:4", "pleiades:3"],
+                "authorities": [],
+                "modes": ["proximity", "toponymy", "typology"],
+                "proximity": "tight",
+                "centroid_distance_m": 12.5,
+            },
+            {
+                "aligned_ids": ["chronique:4", "pleiades:3"],
+                "authorities": ["chronique:4"],
+                "modes": ["assertion", "toponymy"],
+            },
+        ]
+        rules = CategoryRules(PRIORITY_CRITERIA)
+        groups = iter_place_groups(iter(records), "pleiades", rules)
+        cat, pid, count, group = next(groups)
+        assert (cat, pid, count) == ("8", "pleiades:1", 1)
+        assert list(group.keys()) == ["pleiades:1", "chronique:1", "geonames:9"]
+        assert group["chronique:1"]["proximity"] is None
+        cat, pid, count, group = next(groups)
+        assert (cat, pid, count) == ("4", "pleiades:3", 2)
+        assert group["manto:4"]["centroid_distance_m"] == 12.5
+        assert list(groups) == list()
+        # the alignments of a place that are not grouped together
+        interleaved = [records[0], records[4], records[1]]
+        with raises(ValueError):
+            list(iter_place_groups(iter(interleaved), "pleiades", rules))
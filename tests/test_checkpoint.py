@@ -0,0 +1,78 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Test the pleiades_aligner.checkpoint module
+"""
+import os
+from pathlib import Path
+import pleiades_aligner
+from pleiades_aligner.checkpoint import RunDirectory, source_signature
+from pytest import raises
+
+
+class TestCheckpoint:
+    def test_source_signature(self, tmp_path):
+        (tmp_path / "a").mkdir()
+        (tmp_path / "a" / "1.json").write_text("{}")
+        (tmp_path / "2.json").write_text("[]")
+        signature = source_signature(tmp_path)
+        assert [s[0] for s in signature] == ["2.json", os.path.join("a", "1.json")]
+        assert source_signature(tmp_path / "2.json") == [signature[0]]
+        (tmp_path / "2.json").write_text("[1]")
+        assert source_signature(tmp_path) != signature
+        with raises(FileNotFoundError):
+            source_signature(tmp_path / "empty")
+
+    def test_resume(self, tmp_path):
+        ingesters = {
+            "chronique": pleiades_aligner.IngesterChronique(
+                Path("tests/data/chronique/chronique_example.csv")
+            ),
+            "pleiades": pleiades_aligner.IngesterPleiades(
+                Path("tests/data/pleiades/pleiades_example")
+            ),
+        }
+        for ingester in ingesters.values():
+            ingester.ingest()
+        categories = {"tight": ["centroid", 0.001]}
+        stages = [
+            ("ingest", {"sources": ["chronique", "pleiades"]}),
+            ("align assertions", {}),
+            ("align proximity", {"proximity_categories": categories}),
+            ("align toponymy", {"apply_to_modes": ["proximity"]}),
+        ]
+        run = RunDirectory(tmp_path, stages)
+        aligner = pleiades_aligner.Aligner(ingesters, dict(), redirects=dict())
+        run.save("ingest", aligner)
+        with raises(ValueError):
+            run.save("align proximity", aligner)
+        for mode in ["assertions", "proximity"]:
+            aligner.align(modes=[mode], proximity_categories=categories)
+            run.save(f"align {mode}", aligner)
+        # interrupted before toponymy
+        run = RunDirectory(tmp_path, stages, resume=True)
+        assert run.completed == ["ingest", "align assertions", "align proximity"]
+        assert not run.skip("align toponymy")
+        restored = run.restore()
+        assert set(restored.ingesters.keys()) == {"chronique", "pleiades"}
+        assert {repr(a) for a in restored.alignments_by_mode("proximity")} == {
+            repr(a) for a in aligner.alignments_by_mode("proximity")
+        }
+        restored.align(modes=["toponymy"], apply_to_modes=["proximity"])
+        run.save("align toponymy", restored)
+        assert RunDirectory(tmp_path, stages, resume=True).skip("align toponymy")
+        # changed inputs invalidate that stage and every stage after it
+        stages[2] = ("align proximity", {"proximity_categories": dict()})
+        run = RunDirectory(tmp_path, stages, resume=True)
+        assert run.completed == ["ingest", "align assertions"]
+        assert len(run.restore().alignments) == len(
+            aligner.alignments_by_mode("assertion")
+        )
+        # without resuming, every stage is run again
+        assert RunDirectory(tmp_path, stages).completed == list()
+        assert RunDirectory(tmp_path, stages, resume=True).completed == list()
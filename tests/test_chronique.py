@@ -42,3 +42,21 @@ class TestIngesterChronique:
         place = i.data.get_place_by_id("1083")
         assert place.alignments == {"pleiades:589694", "geonames:264858"}
         assert place.centroid == Point([24.1, 35.216667])
+
+    def test_raw_properties_policy(self):
+        whence = data_path / "chronique" / "chronique_example.csv"
+        with raises(ValueError):
+            IngesterChronique(filepath=whence, raw_properties="shred")
+        kept = IngesterChronique(filepath=whence)
+        kept.ingest()
+        compressed = IngesterChronique(filepath=whence, raw_properties="compress")
+        compressed.ingest()
+        dropped = IngesterChronique(filepath=whence, raw_properties="drop")
+        dropped.ingest()
+        for pid in kept.data.pids:
+            raw = kept.data.get_place_by_id(pid).raw_properties
+            assert raw
+            assert compressed.data.get_place_by_id(pid).raw_properties == raw
+            place = dropped.data.get_place_by_id(pid)
+            assert place.raw_properties == dict()
+            assert place.title == kept.data.get_place_by_id(pid).title
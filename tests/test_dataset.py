@@ -8,8 +8,13 @@
 """
 Test the pleiades_aligner.dataset module
 """
-from pleiades_aligner.dataset import DataSet, Place
+from haversine import inverse_haversine, Direction, Unit
+import os
+from pleiades_aligner.dataset import accuracy_to_degrees, DataSet, Place
 from pytest import raises
+from shapely import distance, Point
+import subprocess
+import sys
 
 
 class TestDataSet:
@@ -23,6 +28,160 @@ class TestDataSet:
         d = DataSet(namespace=ns)
         assert ns == d.namespace
 
+    def test_views(self):
+        d = DataSet(namespace="springfield")
+        assert len(d) == 0
+        view = d.place_view
+        d.places = [Place(id="1"), Place(id="2")]
+        assert len(d) == 2
+        assert "1" in d and "3" not in d
+        assert list(d.pid_view) == d.pids == ["1", "2"]
+        assert [p.id for p in d] == [p.id for p in d.place_view] == ["1", "2"]
+        assert [(fid, p.id) for fid, p in d.iter_full_ids()] == [
+            ("springfield:1", "1"),
+            ("springfield:2", "2"),
+        ]
+        # views obtained earlier see later changes to the place collection
+        assert len(view) == 2
+
+    def test_name_index(self):
+        d = DataSet(namespace="springfield")
+        a = Place(id="1", names={"Aptera"})
+        b = Place(id="2")
+        d.places = [a, b]
+        assert d.get_places_by_name("aptera") == [a]
+        # names changed after the places were assigned are indexed too
+        b.names = ["Aptera", "Apteron"]
+        assert {p.id for p in d.get_places_by_name("Aptera")} == {"1", "2"}
+        a.add_names("APTERA")
+        a.remove_names("Aptera")
+        assert {p.id for p in d.get_places_by_name("aptera")} == {"1", "2"}
+        a.remove_names("APTERA")
+        del b.names
+        assert d.get_places_by_name("aptera") == []
+        b.add_names("Apteron")
+        assert d.get_places_by_name("apteron") == [b]
+        # reassigning places leaves no stale entries behind
+        d.places = [a]
+        b.add_names("Kydonia")
+        assert d.get_places_by_name("apteron") == []
+        assert d.get_places_by_name("kydonia") == []
+
+    def test_spatial_queries(self):
+        d = DataSet(namespace="springfield")
+        places = list()
+        for i, xy in enumerate([(0.0, 0.0), (1.0, 0.0), (0.0, 2.0), (5.0, 5.0)]):
+            p = Place(id=str(i))
+            p.geometries = Point(xy)
+            places.append(p)
+        places[3].add_geometries(Point(6.0, 6.0))
+        d.places = places
+        assert [p.id for p in d.query_bbox((-0.5, -0.5, 1.5, 0.5))] == ["0", "1"]
+        assert [p.id for p in d.query_bbox((5.4, 5.4, 5.6, 5.6))] == ["3"]
+        assert d.query_bbox((5.4, 5.4, 5.6, 5.6), geometry="centroid") == [places[3]]
+        assert [p.id for p in d.query_radius(Point(0.0, 0.0), 1.0)] == ["0", "1"]
+        assert [p.id for p in d.nearest(Point(0.1, 1.9), k=3)] == ["2", "0", "1"]
+        assert [p.id for p in d.nearest(Point(0.1, 1.9), k=10)] == ["2", "0", "1", "3"]
+        with raises(ValueError):
+            d.nearest(Point(0.0, 0.0), geometry="bin")
+        # the index follows geometry changes
+        places[1].add_geometries(Point(1.0, 10.0))
+        assert d.query_radius(Point(0.0, 0.0), 1.0, geometry="centroid") == [places[0]]
+
+    def test_add_remove_place(self):
+        d = DataSet(namespace="springfield")
+        a = Place(id="1", names={"Aptera"})
+        a.geometries = Point(0.0, 0.0)
+        d.places = [a]
+        d.build_spatial_index()
+        b = Place(id="2", names={"Kydonia"})
+        b.geometries = Point(0.5, 0.0)
+        d.add_place(b)
+        assert [p.id for p in d.query_radius(Point(0.0, 0.0), 1.0)] == ["1", "2"]
+        # replacing a place replaces its index entries
+        c = Place(id="1", names={"Apteron"})
+        c.geometries = Point(5.0, 5.0)
+        d.add_place(c)
+        assert len(d) == 2
+        assert d.get_places_by_name("aptera") == []
+        assert d.get_places_by_name("apteron") == [c]
+        assert [p.id for p in d.query_radius(Point(0.0, 0.0), 1.0)] == ["2"]
+        assert d.remove_place("2") is b
+        assert d.get_places_by_name("kydonia") == []
+        assert d.query_radius(Point(0.0, 0.0), 1.0) == []
+        with raises(KeyError):
+            d.remove_place("2")
+        with raises(TypeError):
+            d.add_place("3")
+
+    def test_pending_spatial_changes(self):
+        d = DataSet(namespace="springfield")
+        places = list()
+        for i in range(10):
+            p = Place(id=str(i))
+            p.geometries = Point(float(i), 0.0)
+            places.append(p)
+        d.places = places
+        d.build_spatial_index()
+        tree = d._spatial_index["footprint"]
+        # changes are queried alongside the index rather than rebuilding it
+        moved = Place(id="3")
+        moved.geometries = Point(0.2, 0.0)
+        d.add_place(moved)
+        d.remove_place("1")
+        places[2].add_geometries(Point(2.0, 1.0))
+        added = Place(id="10")
+        added.geometries = Point(0.1, 0.1)
+        d.add_place(added)
+        assert [p.id for p in d.query_radius(Point(0.0, 0.0), 1.0)] == ["0", "3", "10"]
+        assert [p.id for p in d.query_bbox((1.5, 0.25, 2.5, 0.75))] == ["2"]
+        assert [p.id for p in d.nearest(Point(0.0, 0.0), k=4)] == ["0", "10", "3", "2"]
+        assert [p.id for p in d.nearest(Point(9.0, 0.0), k=20)][:2] == ["9", "8"]
+        assert len(d.nearest(Point(9.0, 0.0), k=20)) == 10
+        assert d._spatial_index["footprint"] is tree
+        # and it is rebuilt once they pile up
+        for i in range(11, 300):
+            p = Place(id=str(i))
+            p.geometries = Point(float(i), 0.0)
+            d.add_place(p)
+        assert [p.id for p in d.query_radius(Point(299.0, 0.0), 1.0)] == ["298", "299"]
+        assert d._spatial_index["footprint"] is not tree
+        assert not d._spatial_index["added"] and not d._spatial_index["stale"]
+
+    def test_apply_deferred_accuracy(self):
+        d = DataSet(namespace="springfield")
+        immediate = Place(id="1")
+        deferred = Place(id="2")
+        for p in [immediate, deferred]:
+            for xy, m in [((21.45, 38.05), 500.0), ((21.5, 38.1), 2000.0)]:
+                p.add_geometries(Point(xy))
+                p.set_accuracy_if_larger(Point(xy), m, "meters", defer=p is deferred)
+        assert deferred.accuracy == 0.0
+        d.places = [immediate, deferred]
+        d.apply_deferred_accuracy()
+        assert round(deferred.accuracy, 12) == round(immediate.accuracy, 12)
+        assert deferred.footprint.equals_exact(immediate.footprint, 1e-12)
+
+
+def test_accuracy_to_degrees():
+    origins = [(18.519463, 51.893773), (0.0, 0.0), (-70.0, -85.0)]
+    meters = [10000.0, 1.0, 250.0]
+    expected = list()
+    for (x, y), m in zip(origins, meters):
+        points = [
+            inverse_haversine((y, x), m, direction, unit=Unit.METERS)
+            for direction in [
+                Direction.NORTH,
+                Direction.EAST,
+                Direction.SOUTH,
+                Direction.WEST,
+            ]
+        ]
+        expected.append(max([distance(Point(x, y), Point(p[1], p[0])) for p in points]))
+    result = accuracy_to_degrees(origins, meters)
+    assert [round(r, 12) for r in result] == [round(e, 12) for e in expected]
+    assert len(accuracy_to_degrees([], [])) == 0
+
 
 class TestPlace:
     def test_init(self):
@@ -34,3 +193,54 @@ class TestPlace:
         valid_id = "8675309"
         p = Place(id=valid_id)
         assert valid_id == p.id
+
+    def test_slots(self):
+        p = Place(id="8675309")
+        with raises(AttributeError):
+            p.jenny = "Tommy Tutone"
+        with raises(TypeError):
+            Place(id="8675309", jenny="Tommy Tutone")
+        with raises(TypeError):
+            Place(id="8675309", bin=(1, 2))
+        assert Place(id="8675309", title="Jenny").title == "Jenny"
+
+    def test_feature_types_interned(self):
+        a = Place(id="1")
+        b = Place(id="2")
+        a.feature_types = ["".join(["settle", "ment"])]
+        b.add_feature_types("".join(["settl", "ement"]))
+        assert a.feature_types == b.feature_types == {"settlement"}
+        assert list(a.feature_types)[0] is list(b.feature_types)[0]
+
+    def test_fingerprint_across_runs(self):
+        # geometries are hashed differently from one process to the next
+        script = (
+            "from pleiades_aligner.dataset import Place\n"
+            "from shapely import Point\n"
+            "for i in range(50):\n"
+            "    p = Place(id=str(i))\n"
+            "    for j in range(7):\n"
+            "        p.add_geometries(Point(21.0 + i * 0.013 + j * 0.1, 38.0 + j * 0.07))\n"
+            "    p.add_geometries([Point(20.0, 37.0), Point(20.5, 37.3)])\n"
+            "    print(p.fingerprint())\n"
+        )
+        fingerprints = [
+            subprocess.run(
+                [sys.executable, "-c", script],
+                env=dict(os.environ, PYTHONHASHSEED=seed),
+                capture_output=True,
+                check=True,
+                text=True,
+            ).stdout
+            for seed in ["1", "2"]
+        ]
+        assert fingerprints[0].count("\n") == 50
+        assert fingerprints[0] == fingerprints[1]
+
+    def test_compress_raw_properties(self):
+        raw = {"Name": "Aptera", "Alternative names": {"Apteron", "Apteraion"}}
+        p = Place(id="1", raw_properties=raw)
+        p.compress_raw_properties()
+        assert p.raw_properties == raw
+        del p.raw_properties
+        assert p.raw_properties == dict()
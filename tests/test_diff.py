@@ -0,0 +1,121 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Test the pleiades_aligner.diff module
+"""
+import json
+from pathlib import Path
+import pleiades_aligner
+from pleiades_aligner.diff import diff_alignments, diff_paths, iter_sorted, record_key
+from pleiades_aligner.store import alignment_key
+
+OLD = [
+    {
+        "aligned_ids": ["pleiades:2", "chronique:1"],
+        "authorities": [],
+        "modes": ["proximity"],
+        "proximity": "close",
+        "centroid_distance_dd": 0.005,
+    },
+    {
+        "aligned_ids": ["chronique:3", "pleiades:4"],
+        "authorities": ["chronique:3"],
+        "modes": ["assertion"],
+    },
+    {
+        "aligned_ids": ["manto:5", "pleiades:6"],
+        "authorities": ["manto:5"],
+        "modes": ["assertion"],
+    },
+]
+NEW = [
+    {
+        "aligned_ids": ["manto:5", "pleiades:6"],
+        "authorities": ["manto:5"],
+        "modes": ["assertion"],
+    },
+    {
+        "aligned_ids": ["chronique:1", "pleiades:2"],
+        "authorities": [],
+        "modes": ["proximity", "toponymy"],
+        "proximity": "tight",
+        "centroid_distance_dd": 0.001,
+    },
+    {
+        "aligned_ids": ["chronique:7", "pleiades:8"],
+        "authorities": ["chronique:7"],
+        "modes": ["assertion"],
+    },
+]
+
+
+def write_jsonl(path: Path, records: list) -> Path:
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+    return path
+
+
+class TestDiff:
+    def test_record_key(self):
+        a = pleiades_aligner.aligner.Alignment(
+            "pleiades:2", "chronique:1", mode="proximity"
+        )
+        assert record_key(OLD[0]) == alignment_key(a)
+
+    def test_iter_sorted(self, tmp_path):
+        path = write_jsonl(tmp_path / "new.jsonl", NEW)
+        keys = [k for k, record in iter_sorted(path, chunk_size=2)]
+        assert keys == sorted(record_key(r) for r in NEW)
+
+    def test_diff(self, tmp_path):
+        old = write_jsonl(tmp_path / "old.jsonl", OLD)
+        new = write_jsonl(tmp_path / "new.jsonl", NEW)
+        changes = {c["key"]: c for c in diff_paths(old, new, chunk_size=1)}
+        assert len(changes) == 3
+        assert changes["chronique:3 >< pleiades:4"]["change"] == "removed"
+        assert changes["chronique:7 >< pleiades:8"]["change"] == "added"
+        changed = changes["chronique:1 >< pleiades:2"]
+        assert changed["change"] == "changed"
+        assert changed["modes"] == {"added": ["toponymy"], "removed": []}
+        assert changed["proximity"] == {"old": "close", "new": "tight"}
+        assert changed["centroid_distance_dd"]["delta"] == 0.001 - 0.005
+        assert "authorities" not in changed
+
+    def test_distance_tolerance(self):
+        old = [("a", {"centroid_distance_dd": 0.0015, "centroid_distance_m": 0.0})]
+        new = [
+            ("a", {"centroid_distance_dd": 0.0015 - 4e-15, "centroid_distance_m": 0.0})
+        ]
+        assert list(diff_alignments(old, new)) == list()
+        changes = list(diff_alignments(old, new, rel_tol=0.0, abs_tol=0.0))
+        assert list(changes[0].keys()) == ["centroid_distance_dd", "key", "change"]
+        new = [("a", {"centroid_distance_dd": 0.0015, "centroid_distance_m": 1.0})]
+        changes = list(diff_alignments(old, new))
+        assert changes[0]["centroid_distance_m"] == {
+            "old": 0.0,
+            "new": 1.0,
+            "delta": 1.0,
+        }
+
+    def test_diff_store(self, tmp_path):
+        ingesters = {
+            "pleiades": pleiades_aligner.IngesterPleiades(
+                Path("tests/data/pleiades/pleiades_example")
+            ),
+        }
+        ingesters["pleiades"].ingest()
+        aligner = pleiades_aligner.Aligner(ingesters, dict(), redirects=dict())
+        aligner.align(modes=["assertions"])
+        aligner.persist(tmp_path / "alignments.db").close()
+        report = tmp_path / "report.jsonl"
+        with open(report, "w", encoding="utf-8") as f:
+            pleiades_aligner.ReportWriter(ingesters, f, format="jsonl").write(
+                aligner.alignments.values()
+            )
+        assert list(diff_paths(report, tmp_path / "alignments.db")) == list()
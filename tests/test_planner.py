@@ -0,0 +1,87 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Test the pleiades_aligner.planner module
+"""
+from pathlib import Path
+import pleiades_aligner
+from pleiades_aligner.planner import plan_pipeline
+from pleiades_aligner.report import filter_alignments
+
+CONFIG = {
+    "infer": [
+        {
+            "primary_namespace": "pleiades",
+            "aligned_namespace": "chronique",
+            "inference_namespace": "geonames",
+        }
+    ],
+    "report": {
+        "require_modes": ["toponymy"],
+        "ignore_place_namespaces": ["manto"],
+    },
+}
+
+
+class TestPlanner:
+    def test_rules(self):
+        plan = plan_pipeline(CONFIG)
+        assert plan.rules("pleiades", "topostext") == (False, True, False)
+        assert plan.rules("manto", "topostext") == (True, True, False)
+        # inference reads every alignment of its namespaces
+        assert plan.rules("chronique", "pleiades") == (False, False, False)
+        assert plan.rules("geonames", "chronique") == (False, False, False)
+        plan = plan_pipeline(CONFIG, exhaustive=True)
+        assert plan.rules("manto", "topostext") == (False, False, False)
+        assert plan_pipeline(dict()).rules("a", "b") == (False, False, False)
+
+    def test_same_report(self):
+        ingesters = {
+            "chronique": pleiades_aligner.IngesterChronique(
+                Path("tests/data/chronique/chronique_example.csv")
+            ),
+            "manto": pleiades_aligner.IngesterMANTO(
+                Path("tests/data/manto/manto_example.csv")
+            ),
+            "pleiades": pleiades_aligner.IngesterPleiades(
+                Path("tests/data/pleiades/pleiades_example")
+            ),
+            "topostext": pleiades_aligner.IngesterTopostext(
+                Path("tests/data/topostext/topostext_example.json")
+            ),
+        }
+        for ingester in ingesters.values():
+            ingester.ingest()
+        categories = {
+            "tight": ["centroid", 0.001],
+            "overlapping": ["footprint", 0.0],
+            "close": ["centroid", 0.005],
+        }
+        config = dict(CONFIG, infer=list())
+        reports = list()
+        candidates = list()
+        for plan in [None, plan_pipeline(config)]:
+            aligner = pleiades_aligner.Aligner(ingesters, dict(), redirects=dict())
+            aligner.align(
+                modes=["assertions", "proximity"],
+                proximity_categories=categories,
+                plan=plan,
+            )
+            aligner.align(modes=["toponymy"], apply_to_modes=["assertion", "proximity"])
+            candidates.append(aligner.stats.stages[1]["candidates"])
+            reports.append(
+                {
+                    (repr(a), tuple(sorted(a.modes)), a.centroid_distance_dd)
+                    for a in filter_alignments(
+                        aligner.alignments.values(), require_modes=["toponymy"]
+                    )
+                    if "proximity" in a.modes and not a.has_id_namespace("manto")
+                }
+            )
+        assert reports[0] and reports[0] == reports[1]
+        assert candidates[1] < candidates[0]
@@ -0,0 +1,166 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Test the pleiades_aligner.report module
+"""
+from io import StringIO
+import json
+from pathlib import Path
+import pleiades_aligner
+from pleiades_aligner.report import (
+    filter_alignments,
+    group_alignments,
+    iter_report,
+    load_report,
+    ReportWriter,
+)
+from pytest import raises
+from shapely import from_wkb
+
+
+class TestReportWriter:
+    @classmethod
+    def setup_class(cls):
+        cls.ingesters = {
+            "chronique": pleiades_aligner.IngesterChronique(
+                Path("tests/data/chronique/chronique_example.csv")
+            ),
+            "pleiades": pleiades_aligner.IngesterPleiades(
+                Path("tests/data/pleiades/pleiades_example")
+            ),
+        }
+        for ingester in cls.ingesters.values():
+            ingester.ingest()
+        cls.aligner = pleiades_aligner.Aligner(cls.ingesters, dict(), redirects=dict())
+        cls.aligner.align(
+            modes=["assertions", "proximity"],
+            proximity_categories={
+                "tight": ("centroid", 0.001),
+                "close": ("centroid", 0.01),
+            },
+        )
+
+    def test_init(self):
+        with raises(ValueError):
+            ReportWriter(self.ingesters, StringIO(), format="xml")
+
+    def test_filter(self):
+        alignments = list(
+            filter_alignments(
+                self.aligner.alignments.values(),
+                ignore_authority_namespaces=["chronique"],
+                require_modes=["assertion"],
+            )
+        )
+        assert alignments
+        for a in alignments:
+            assert "assertion" in a.modes
+            assert "chronique" not in a.authority_namespaces
+
+    def test_group(self):
+        alignments = group_alignments(self.aligner.alignments.values(), "chronique")
+        assert len(alignments) == len(self.aligner.alignments)
+        seen = list()
+        for a in alignments:
+            pid = [pid for pid in a.aligned_ids if pid.startswith("chronique:")]
+            if not pid:
+                break
+            if not seen or seen[-1] != pid[0]:
+                assert pid[0] not in seen
+                seen.append(pid[0])
+        assert seen
+
+    def test_json(self):
+        writer = ReportWriter(self.ingesters, StringIO())
+        alignments = list(self.aligner.alignments.values())
+        records = [writer.make_record(a) for a in alignments]
+        expected = json.dumps(records, ensure_ascii=False, indent=4, sort_keys=True)
+        stream = StringIO()
+        writer = ReportWriter(self.ingesters, stream)
+        assert writer.write(iter(alignments)) == len(records)
+        assert stream.getvalue() == expected + "\n"
+
+        stream = StringIO()
+        ReportWriter(self.ingesters, stream).write(iter([]))
+        assert stream.getvalue() == json.dumps([]) + "\n"
+
+    def test_jsonl(self):
+        stream = StringIO()
+        writer = ReportWriter(
+            self.ingesters,
+            stream,
+            format="jsonl",
+            ignore_place_namespaces=["geonames"],
+        )
+        count = writer.write(self.aligner.alignments.values())
+        lines = stream.getvalue().splitlines()
+        assert count == len(lines)
+        for line in lines:
+            record = json.loads(line)
+            assert "geonames" not in record["aligned_namespaces"]
+            for pid in record["aligned_ids"]:
+                namespace, this_id = pid.split(":")
+                try:
+                    self.ingesters[namespace].data.get_place_by_id(this_id)
+                except KeyError:
+                    assert namespace not in record
+                else:
+                    assert record[namespace]["id"] == this_id
+
+    def test_empty_jsonl(self, tmp_path):
+        path = tmp_path / "empty.jsonl"
+        with open(path, "w", encoding="utf-8") as f:
+            assert ReportWriter(self.ingesters, f, format="jsonl").write([]) == 0
+        assert list(iter_report(path)) == list()
+
+    def test_fragment_cache(self):
+        alignments = list(self.aligner.alignments.values())
+        plain = StringIO()
+        ReportWriter(self.ingesters, plain).write(alignments)
+        primed = StringIO()
+        writer = ReportWriter(self.ingesters, primed)
+        count = writer.prime_fragments(alignments)
+        assert count == len(writer._fragments)
+        assert writer.prime_fragments(alignments) == 0
+        writer.write(alignments)
+        assert primed.getvalue() == plain.getvalue()
+        fragment = writer.place_fragment("pleiades:589704", None)
+        assert fragment["centroid"].startswith("POINT")
+        for a in self.aligner.alignments_by_full_id("pleiades:589704"):
+            assert writer.make_record(a)["pleiades"] is fragment
+
+    def test_wkb(self):
+        writer = ReportWriter(self.ingesters, StringIO(), geometry_encoding="wkb")
+        place = self.ingesters["pleiades"].data.get_place_by_id("589704")
+        fragment = writer.place_fragment("pleiades:589704", place)
+        assert from_wkb(fragment["centroid"]).equals(place.centroid)
+        assert from_wkb(fragment["footprint"]).equals(place.footprint)
+        with raises(ValueError):
+            ReportWriter(self.ingesters, StringIO(), geometry_encoding="geojson")
+
+    def test_normalized(self, tmp_path):
+        alignments = list(self.aligner.alignments.values())
+        loaded = dict()
+        for format in ["json", "jsonl", "normalized"]:
+            path = tmp_path / f"report.{format}"
+            with open(path, "w", encoding="utf-8") as f:
+                ReportWriter(self.ingesters, f, format=format).write(alignments)
+            loaded[format] = load_report(path)
+        assert loaded["normalized"] == loaded["json"] == loaded["jsonl"]
+        assert len(loaded["json"]) == len(alignments)
+        # each place is stored once, and records carry their own copies of fragments
+        with open(tmp_path / "report.normalized", "r", encoding="utf-8") as f:
+            report = json.load(f)
+        assert "pleiades" not in report["alignments"][0]
+        pids = {pid for a in alignments for pid in a.aligned_ids}
+        assert set(report["places"].keys()).issubset(pids)
+        a, b = [
+            r for r in loaded["normalized"] if "pleiades:589704" in r["aligned_ids"]
+        ][:2]
+        assert a["pleiades"] == b["pleiades"]
+        assert a["pleiades"] is not b["pleiades"]
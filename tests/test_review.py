@@ -0,0 +1,82 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Test the pleiades_aligner.review module
+"""
+from copy import deepcopy
+import json
+from pleiades_aligner.review import GroupIndex, ReviewLog
+
+CATEGORIES = {
+    "1": {
+        "pleiades:1": {"pleiades:1": {"title": "Ἀθῆναι"}, "chronique:1": {}},
+        "pleiades:2": {"pleiades:2": {"title": "Athens"}},
+    },
+    "2": {"pleiades:3": {"pleiades:3": {"title": "Sparta"}}},
+}
+
+
+class TestGroupIndex:
+    def test_json(self, tmp_path):
+        whence = tmp_path / "prioritized.json"
+        whence.write_text(json.dumps(CATEGORIES, indent=4), encoding="utf-8")
+        index = GroupIndex(whence)
+        assert index.rebuilt
+        assert len(index) == 3
+        assert index.ids() == ["pleiades:1", "pleiades:2", "pleiades:3"]
+        assert index[2] == ("2", "pleiades:3", CATEGORIES["2"]["pleiades:3"])
+        assert index[0][2] == CATEGORIES["1"]["pleiades:1"]
+        assert index.entry(2) == ("2", "pleiades:3")
+        # the saved index is reused until the prioritized output changes
+        assert not GroupIndex(whence).rebuilt
+        categories = deepcopy(CATEGORIES)
+        del categories["2"]
+        whence.write_text(json.dumps(categories, indent=4), encoding="utf-8")
+        index = GroupIndex(whence)
+        assert index.rebuilt
+        assert len(index) == 2
+
+    def test_jsonl(self, tmp_path):
+        whence = tmp_path / "prioritized.jsonl"
+        with open(whence, "w", encoding="utf-8") as f:
+            for i in range(5):
+                record = {
+                    "category": 1,
+                    "id": f"pleiades:{i}",
+                    "places": {f"pleiades:{i}": {"title": "Ἀθῆναι" * i}},
+                }
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        index = GroupIndex(whence)
+        assert index.data_path == whence
+        assert len(index) == 5
+        assert index[3] == (1, "pleiades:3", {"pleiades:3": {"title": "Ἀθῆναι" * 3}})
+
+    def test_list(self, tmp_path):
+        whence = tmp_path / "prioritized.json"
+        whence.write_text(json.dumps({"5": [{"pleiades": {}}, {}]}), encoding="utf-8")
+        index = GroupIndex(whence)
+        assert index.ids() == ["5/0", "5/1"]
+        # ids come from the index alone, so groups can be skipped without reading them
+        index.groups_path.unlink()
+        assert index.entry(1) == ("5", "5/1")
+
+
+class TestReviewLog:
+    def test_resume(self, tmp_path):
+        whence = tmp_path / "prioritized.json"
+        review = ReviewLog(whence)
+        assert review.cursor == 0
+        assert not review.is_decided("pleiades:1")
+        review.decide("pleiades:1", "y")
+        review.decide("pleiades:2", "n")
+        review.decide("pleiades:1", "?")
+        review.cursor = 3
+        review = ReviewLog(whence)
+        assert review.cursor == 3
+        assert review.decisions == {"pleiades:1": "?", "pleiades:2": "n"}
+        assert review.is_decided("pleiades:2")
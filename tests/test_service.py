@@ -0,0 +1,132 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Test the pleiades_aligner.service module
+"""
+import json
+from pathlib import Path
+import pleiades_aligner
+from pleiades_aligner.service import AlignmentService, make_server
+from pytest import raises
+from shapely.geometry import mapping
+import threading
+from urllib.request import Request, urlopen
+
+CONFIG = {
+    "alignment_modes": ["assertions", "proximity"],
+    "proximity_categories": {
+        "tight": ["centroid", 0.001],
+        "close": ["centroid", 0.01],
+    },
+    "secondary_modes": {
+        "toponymy": ["assertion", "proximity"],
+        "typology": ["assertion", "proximity"],
+    },
+}
+
+
+def record(namespace: str, place) -> dict:
+    return {
+        "namespace": namespace,
+        "id": place.id,
+        "names": sorted(place.names),
+        "feature_types": sorted(place.feature_types),
+        "alignments": sorted(place.alignments),
+        "geometry": mapping(place.geometries),
+        "accuracy": place.accuracy,
+    }
+
+
+def summarize(alignments: list) -> list:
+    return [
+        (a["aligned_ids"], a["modes"], a["authorities"], a.get("proximity"))
+        for a in alignments
+    ]
+
+
+class TestService:
+    def setup_method(self):
+        ingesters = {
+            "chronique": pleiades_aligner.IngesterChronique(
+                Path("tests/data/chronique/chronique_example.csv")
+            ),
+            "pleiades": pleiades_aligner.IngesterPleiades(
+                Path("tests/data/pleiades/pleiades_example")
+            ),
+        }
+        for ingester in ingesters.values():
+            ingester.ingest()
+        self.aligner = pleiades_aligner.Aligner(ingesters, dict(), redirects=dict())
+        self.aligner.align(
+            modes=CONFIG["alignment_modes"],
+            proximity_categories=CONFIG["proximity_categories"],
+        )
+        for mode, apply_to_modes in CONFIG["secondary_modes"].items():
+            self.aligner.align(modes=[mode], apply_to_modes=apply_to_modes)
+        self.service = AlignmentService(self.aligner, CONFIG)
+        # a chronique place with alignments of every mode
+        for full_id in sorted(self.aligner._alignment_hashes_by_full_id):
+            modes = set()
+            for a in self.aligner.alignments_by_full_id(full_id):
+                modes.update(a.modes)
+            if full_id.startswith("chronique:") and len(modes) == 4:
+                break
+        self.full_id = full_id
+        place = ingesters["chronique"].data.get_place_by_id(full_id.split(":")[1])
+        self.record = record("chronique", place)
+
+    def test_align_place(self):
+        expected = summarize(self.service.alignments_for(self.full_id))
+        assert {m for a in expected for m in a[1]} == {
+            "assertion",
+            "proximity",
+            "toponymy",
+            "typology",
+        }
+        # the place as a new record, in a service that no longer holds it
+        self.service.update(removed=[self.full_id])
+        # only what other places assert about it is left
+        for alignment in self.service.alignments_for(self.full_id):
+            assert alignment["modes"] == ["assertion"]
+            assert self.full_id not in alignment["authorities"]
+        before = len(self.aligner.alignments)
+        assert summarize(self.service.align_place(self.record)) == expected
+        assert len(self.aligner.alignments) == before
+        # and ingested again
+        changes = self.service.update(records=[self.record])
+        assert changes["realigned"] == [self.full_id]
+        assert summarize(self.service.alignments_for(self.full_id)) == expected
+        with raises(KeyError):
+            self.service.update(removed=["chronique:nowhere"])
+        with raises(ValueError):
+            self.service.align_place({"id": "1"})
+
+    def test_http(self):
+        server = make_server(self.service, port=0)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            with urlopen(f"{base}/alignments?id={self.full_id}") as response:
+                alignments = json.load(response)
+            assert summarize(alignments) == summarize(
+                self.service.alignments_for(self.full_id)
+            )
+            request = Request(
+                f"{base}/align_place",
+                data=json.dumps(self.record).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+            )
+            with urlopen(request) as response:
+                assert summarize(json.load(response)) == summarize(alignments)
+            with urlopen(f"{base}/status") as response:
+                assert json.load(response)["places"]["chronique"] > 0
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
@@ -0,0 +1,179 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Test the pleiades_aligner.stats module
+"""
+import json
+from pathlib import Path
+import pleiades_aligner
+from pleiades_aligner.stats import (
+    compare_summaries,
+    Progress,
+    Stats,
+    summarize_stages,
+)
+from pytest import raises
+
+
+class TestStats:
+    def test_stage(self, tmp_path):
+        stats = Stats(trace_memory=True)
+        with stats.stage("outer", items_in=3) as record:
+            stats.count("items_out", 2)
+            with stats.stage("inner"):
+                stats.count("candidates", 5)
+            stats.count("items_out")
+            data = [0] * 100000
+        assert [s["stage"] for s in stats.stages] == ["outer", "inner"]
+        assert record["items_in"] == 3
+        assert record["items_out"] == 3
+        assert record["candidates"] is None
+        assert stats.stages[1]["candidates"] == 5
+        assert record["wall_s"] >= stats.stages[1]["wall_s"]
+        assert record["traced_peak_bytes"] >= 800000
+        with raises(KeyError):
+            stats.count("places")
+        stats.save(tmp_path / "stats.json")
+        with open(tmp_path / "stats.json", "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        assert saved["stages"][0]["items_out"] == 3
+
+    def test_nested_peak(self):
+        stats = Stats(trace_memory=True)
+        with stats.stage("outer") as record:
+            data = [0] * 1000000
+            del data
+            with stats.stage("inner") as inner:
+                pass
+        assert record["traced_peak_bytes"] >= 8000000
+        assert inner["traced_peak_bytes"] < 8000000
+        # the peak of an inner stage is also that of the stages around it
+        with stats.stage("outer") as record:
+            with stats.stage("inner"):
+                data = [0] * 1000000
+                del data
+        assert record["traced_peak_bytes"] >= 8000000
+
+    def test_profile(self, tmp_path):
+        with raises(ValueError):
+            Stats(profile="disk")
+        stats = Stats(profile="both", profile_stage="align *", profile_dir=tmp_path)
+        with stats.stage("ingest pleiades"):
+            sorted(range(1000))
+        with stats.stage("align proximity"):
+            with stats.stage("align toponymy"):
+                data = [str(i) for i in range(1000)]
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            "002-align_proximity.pstats",
+            "002-align_proximity.tracemalloc",
+        ]
+
+    def test_progress(self):
+        events = list()
+        progress = Progress(
+            "align proximity", 25, callback=events.append, interval=0.0, check_every=10
+        )
+        for i in range(25):
+            progress.update()
+        progress.finish()
+        assert [e["processed"] for e in events] == [10, 20, 25]
+        assert [e["done"] for e in events] == [False, False, True]
+        assert events[0]["total"] == 25
+        assert events[0]["eta_s"] >= 0.0
+        # rate-limited
+        events = list()
+        progress = Progress("x", callback=events.append, interval=60.0, check_every=1)
+        for i in range(1000):
+            progress.update()
+        progress.finish()
+        assert len(events) == 1
+
+    def test_ingest_progress(self):
+        events = list()
+        stats = Stats(progress_callback=events.append)
+        ingester = pleiades_aligner.IngesterChronique(
+            Path("tests/data/chronique/chronique_example.csv")
+        )
+        ingester.stats = stats
+        with stats.stage("ingest chronique"):
+            ingester.ingest()
+        assert events[-1]["stage"] == "ingest chronique"
+        assert events[-1]["done"]
+        assert events[-1]["processed"] == events[-1]["total"] == len(ingester.data)
+
+    def test_compare(self):
+        records = [
+            {"size": 10, "stage": "align proximity", "wall_s": t, "cpu_s": t}
+            for t in [1.0, 3.0, 2.0]
+        ]
+        for r, rss in zip(records, [300, 100, 200]):
+            r.update({"peak_rss_bytes": rss, "rss_growth_bytes": 0, "candidates": 50})
+        baseline = summarize_stages(records)
+        assert list(baseline.keys()) == ["10/align proximity"]
+        assert baseline["10/align proximity"]["wall_s"] == 2.0
+        assert baseline["10/align proximity"]["peak_rss_bytes"] == 100
+        assert baseline["10/align proximity"]["repeats"] == 3
+        current = {
+            "10/align proximity": dict(
+                baseline["10/align proximity"], wall_s=3.0, candidates=40
+            ),
+            "10/report": dict(baseline["10/align proximity"]),
+        }
+        rows = compare_summaries(baseline, current, time_tolerance=0.25)
+        verdicts = {(r["benchmark"], r["metric"]): r["verdict"] for r in rows}
+        assert verdicts == {
+            ("10/align proximity", "wall_s"): "regression",
+            ("10/align proximity", "candidates"): "improvement",
+            ("10/report", None): "new",
+        }
+        # peak RSS is the process's, so memory is compared by each stage's growth of it
+        current["10/align proximity"]["peak_rss_bytes"] = 2**30
+        rows = compare_summaries(baseline, current, time_tolerance=0.6)
+        assert [r["metric"] for r in rows] == ["candidates", None]
+        current["10/align proximity"]["rss_growth_bytes"] = 2**30
+        rows = compare_summaries(baseline, current, time_tolerance=0.6)
+        assert [r["metric"] for r in rows] == ["rss_growth_bytes", "candidates", None]
+        current["10/align proximity"]["rss_growth_bytes"] = 2**19
+        rows = compare_summaries(baseline, current, time_tolerance=0.6)
+        assert [r["metric"] for r in rows] == ["candidates", None]
+        assert not compare_summaries(baseline, baseline)
+        rows = compare_summaries(current, baseline)
+        assert ("10/report", None, "missing") in [
+            (r["benchmark"], r["metric"], r["verdict"]) for r in rows
+        ]
+
+    def test_aligner(self):
+        ingesters = {
+            "chronique": pleiades_aligner.IngesterChronique(
+                Path("tests/data/chronique/chronique_example.csv")
+            ),
+            "pleiades": pleiades_aligner.IngesterPleiades(
+                Path("tests/data/pleiades/pleiades_example")
+            ),
+        }
+        for ingester in ingesters.values():
+            ingester.ingest()
+        aligner = pleiades_aligner.Aligner(ingesters, dict(), redirects=dict())
+        aligner.align(
+            modes=["assertions", "proximity"],
+            proximity_categories={"tight": ["centroid", 0.001]},
+        )
+        aligner.align(modes=["toponymy"], apply_to_modes=["proximity"])
+        stages = {s["stage"]: s for s in aligner.stats.stages}
+        assert list(stages.keys()) == [
+            "align assertions",
+            "align proximity",
+            "align toponymy",
+        ]
+        proximity = stages["align proximity"]
+        assert proximity["items_in"] == sum(len(i.data) for i in ingesters.values())
+        assert proximity["candidates"] > 0
+        assert proximity["items_out"] == len(aligner.alignments_by_mode("proximity"))
+        toponymy = stages["align toponymy"]
+        assert toponymy["items_in"] == proximity["items_out"]
+        assert toponymy["items_out"] == len(aligner.alignments_by_mode("toponymy"))
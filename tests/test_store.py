@@ -0,0 +1,148 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Test the pleiades_aligner.store module
+"""
+from pathlib import Path
+import pleiades_aligner
+from pleiades_aligner.aligner import Alignment
+from pleiades_aligner.store import alignment_key, AlignmentStore
+from pytest import raises
+
+
+class TestAlignmentStore:
+    @classmethod
+    def setup_class(cls):
+        cls.ingesters = {
+            "chronique": pleiades_aligner.IngesterChronique(
+                Path("tests/data/chronique/chronique_example.csv")
+            ),
+            "pleiades": pleiades_aligner.IngesterPleiades(
+                Path("tests/data/pleiades/pleiades_example")
+            ),
+        }
+        for ingester in cls.ingesters.values():
+            ingester.ingest()
+        cls.aligner = pleiades_aligner.Aligner(cls.ingesters, dict(), redirects=dict())
+        cls.aligner.align(
+            modes=["assertions", "proximity"],
+            proximity_categories={
+                "tight": ("centroid", 0.001),
+                "close": ("centroid", 0.01),
+            },
+        )
+        cls.aligner.align(modes=["toponymy"], apply_to_modes=["assertion", "proximity"])
+
+    def test_save(self, tmp_path):
+        with self.aligner.persist(tmp_path / "alignments.db") as store:
+            assert len(store) == len(self.aligner.alignments)
+            place = store.get_place("pleiades:589704")
+            assert place["id"] == "589704"
+            assert place["uri"] == "https://pleiades.stoa.org/places/589704"
+            assert place["centroid"].startswith("POINT")
+            with raises(KeyError):
+                store.get_place("pleiades:8675309")
+        # saving again replaces rather than duplicates
+        with AlignmentStore(tmp_path / "alignments.db") as store:
+            store.save(self.aligner)
+            assert len(store) == len(self.aligner.alignments)
+
+    def test_query(self, tmp_path):
+        store = self.aligner.persist(tmp_path / "alignments.db")
+        expected = {
+            alignment_key(a)
+            for a in self.aligner.alignments_by_full_id("pleiades:589704")
+        }
+        assert {a["key"] for a in store.alignments_for("pleiades:589704")} == expected
+
+        found = store.query(
+            modes=["proximity", "toponymy"], exclude_modes=["assertion"]
+        )
+        expected = {
+            alignment_key(a)
+            for a in self.aligner.alignments.values()
+            if {"proximity", "toponymy"}.issubset(a.modes)
+            and "assertion" not in a.modes
+        }
+        assert {a["key"] for a in found} == expected
+
+        found = store.query(namespaces=["pleiades", "chronique"], proximity=["tight"])
+        expected = {
+            alignment_key(a)
+            for a in self.aligner.alignments.values()
+            if a.id_namespaces == {"chronique", "pleiades"} and a.proximity == {"tight"}
+        }
+        assert expected
+        assert {a["key"] for a in found} == expected
+
+        found = store.query(authority_namespaces=["chronique"])
+        expected = {
+            alignment_key(a)
+            for a in self.aligner.alignments_by_authority_namespace("chronique")
+        }
+        assert {a["key"] for a in found} == expected
+
+        aptera = [
+            a
+            for a in store.alignments_for("chronique:3891")
+            if "pleiades:589704" in a["aligned_ids"]
+        ][0]
+        original = [
+            a
+            for a in self.aligner.alignments_by_full_id("chronique:3891")
+            if "pleiades:589704" in a.aligned_ids
+        ][0].asdict()
+        del original["hash"]
+        original["aligned_namespaces"] = sorted(original["aligned_namespaces"])
+        del aptera["key"]
+        assert aptera == original
+        with raises(ValueError):
+            store.query(namespaces=["pleiades", "chronique", "manto"])
+        store.close()
+
+    def test_sync(self, tmp_path):
+        with self.aligner.persist(tmp_path / "alignments.db") as store:
+            key = alignment_key(
+                self.aligner.alignments_by_full_id("pleiades:589704")[0]
+            )
+            expected = store.alignments_for("pleiades:589704")
+            store.delete_alignments([key])
+            store.connection.execute(
+                "UPDATE places SET title = 'Stale' WHERE full_id = 'pleiades:589704'"
+            )
+            store.sync(self.aligner, place_ids={"pleiades:589704"})
+            assert len(store) == len(self.aligner.alignments)
+            assert store.alignments_for("pleiades:589704") == expected
+            assert store.get_place("pleiades:589704")["title"] != "Stale"
+
+    def test_sync_scope(self, tmp_path):
+        store = self.aligner.persist(tmp_path / "alignments.db")
+        # rows involving none of the places synchronized are not read or rewritten
+        other = alignment_key(self.aligner.alignments_by_full_id("pleiades:589704")[0])
+        store.connection.execute(
+            "UPDATE alignments SET proximity = 'stale' WHERE key = ?", (other,)
+        )
+        # but inferences made on the authority of those places are
+        inferred = Alignment(
+            "pleiades:589704", "geonames:1", "inference", authority="chronique:1"
+        )
+        self.aligner._register_alignment(inferred)
+        try:
+            store.sync(self.aligner, place_ids={"chronique:1"})
+            assert len(store) == len(self.aligner.alignments)
+            assert [a["modes"] for a in store.alignments_for("geonames:1")] == [
+                ["inference"]
+            ]
+        finally:
+            self.aligner._unregister_alignment(hash(inferred))
+        store.sync(self.aligner, place_ids={"chronique:1"})
+        assert store.alignments_for("geonames:1") == list()
+        assert {a["key"]: a.get("proximity") for a in store.iter_alignments()}[
+            other
+        ] == "stale"
+        store.close()
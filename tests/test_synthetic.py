@@ -0,0 +1,46 @@
+#
+# This file is part of pleiades_aligner
+# by Tom Elliott for the Institute for the Study of the Ancient World
+# (c) Copyright 2024 by New York University
+# Licensed under the AGPL-3.0; see LICENSE.txt file.
+#
+
+"""
+Test the pleiades_aligner.synthetic module
+"""
+import pleiades_aligner
+from pleiades_aligner.synthetic import generate, SyntheticGazetteer
+
+INGESTERS = {
+    "chronique": pleiades_aligner.IngesterChronique,
+    "manto": pleiades_aligner.IngesterMANTO,
+    "pleiades": pleiades_aligner.IngesterPleiades,
+    "topostext": pleiades_aligner.IngesterTopostext,
+}
+
+
+class TestSynthetic:
+    def test_deterministic(self):
+        a = SyntheticGazetteer(200, seed=1)
+        b = SyntheticGazetteer(200, seed=1)
+        c = SyntheticGazetteer(200, seed=2)
+        assert a.places == b.places
+        assert a.places != c.places
+
+    def test_ingest(self, tmp_path):
+        data_sources = generate(tmp_path, 200, seed=1)
+        assert set(data_sources.keys()) == set(INGESTERS.keys())
+        ingesters = dict()
+        for namespace, path in data_sources.items():
+            ingesters[namespace] = INGESTERS[namespace](path)
+            ingesters[namespace].ingest()
+        assert len(ingesters["pleiades"].data) == 200
+        for namespace in ["chronique", "manto", "topostext"]:
+            assert 0 < len(ingesters[namespace].data) < 200
+        aligner = pleiades_aligner.Aligner(ingesters, data_sources, redirects=dict())
+        aligner.align(
+            modes=["assertions", "proximity"],
+            proximity_categories={"tight": ["centroid", 0.001]},
+        )
+        assert aligner.alignments_by_mode("assertion")
+        assert aligner.alignments_by_mode("proximity")